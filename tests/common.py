@@ -18,6 +18,48 @@ xpath_ns = get_xpath_ns(VERSION)
 MINI_CEDA_CACHE_DIR = Path.home() / ".mini-ceda-archive"
 
 
+STANDARD_NAMES = """<?xml version="1.0"?>
+<standard_name_table>
+  <version_number>{version}</version_number>
+  <last_modified>2024-01-01</last_modified>
+  <entry id="air_temperature"><canonical_units>K</canonical_units></entry>
+  <entry id="time"><canonical_units>s</canonical_units></entry>
+</standard_name_table>
+"""
+
+AREA_TYPES = """<?xml version="1.0"?>
+<area_type_table>
+  <version_number>11</version_number>
+  <date>2024-01-01</date>
+  <entry id="land"/>
+</area_type_table>
+"""
+
+REGION_NAMES = """<?xml version="1.0"?>
+<standardized_region_list>
+  <version_number>4</version_number>
+  <date>2024-01-01</date>
+  <entry id="atlantic_ocean"/>
+</standardized_region_list>
+"""
+
+
+def write_cf_tables(tmp_path, version=84):
+    """
+    Writes small copies of the CF standard name, area type and region name tables to `tmp_path`.
+    Returns the paths to the tables, as the `sources` of a `CFTableCache`.
+    """
+    sources = {}
+
+    for name, content in (("standard_names", STANDARD_NAMES.format(version=version)),
+                          ("area_types", AREA_TYPES), ("region_names", REGION_NAMES)):
+        sources[name] = str(tmp_path / f"{name}.xml")
+        with open(sources[name], "w") as writer:
+            writer.write(content)
+
+    return sources
+
+
 def resource_file(filepath):
     return os.path.join(TESTS_HOME, "testdata", filepath)
 
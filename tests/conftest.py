@@ -4,7 +4,7 @@ import shutil
 
 from git import Repo
 
-from tests.common import MINI_CEDA_CACHE_DIR
+from tests.common import MINI_CEDA_CACHE_DIR, write_cf_tables
 
 CEDA_TEST_DATA_REPO_URL = "https://github.com/cedadev/mini-ceda-archive"
 
@@ -30,3 +30,48 @@ def load_ceda_test_data():
         repo.git.checkout(branch)
         repo.remotes[0].pull()
 
+
+@pytest.fixture
+def cru_like_file(tmp_path):
+    """
+    Writes a small NetCDF file laid out like the CRU TS monthly temperature data
+    (0.5 degree grid, with missing values over the "sea" in the western columns).
+    Returns the path to the file.
+    """
+    import numpy as np
+    import xarray as xr
+
+    rng = np.random.default_rng(0)
+    lat = np.arange(40.25, 60, 0.5)
+    lon = np.arange(-9.75, 10, 0.5)
+    time = xr.date_range("1901-01-16", periods=123 * 12, freq="MS", use_cftime=True)
+
+    months = np.arange(len(time))
+    seasonal = 10 + 0.01 * months / 12 + 5 * np.sin(2 * np.pi * months / 12)
+    tmp = seasonal[:, None, None] + rng.normal(0, 1, (len(time), len(lat), len(lon)))
+    tmp[:, :, :4] = np.nan
+
+    ds = xr.Dataset({"tmp": (("time", "lat", "lon"), tmp.astype("float32"))},
+                    coords={"time": time, "lat": lat, "lon": lon})
+
+    nc_path = str(tmp_path / "cru_ts.tmp.dat.nc")
+    ds.to_netcdf(nc_path, encoding={"tmp": {"chunksizes": (120, 10, 10), "zlib": True}})
+    return nc_path
+
+
+@pytest.fixture
+def local_cf_tables(tmp_path, monkeypatch):
+    """
+    Makes the CF checks (including those run by worker processes) read small local copies of the CF tables,
+    and keep their reports in a temporary cache. Returns the `CFTableCache` used.
+    """
+    from vulture.cf_reports import CF_REPORTS
+    from vulture.cf_tables import CF_TABLES
+
+    os.mkdir(tmp_path / "tables")
+    monkeypatch.setattr(CF_TABLES, "sources", write_cf_tables(tmp_path / "tables"))
+    monkeypatch.setattr(CF_REPORTS, "cache_dir", str(tmp_path / "cf-report-cache"))
+    CF_TABLES.clear()
+
+    yield CF_TABLES
+    CF_TABLES.clear()
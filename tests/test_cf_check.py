@@ -5,6 +5,7 @@ from pywps.tests import client_for, assert_response_success, assert_process_exce
 
 from .common import get_output, PYWPS_CFG, MINI_CEDA_CACHE_DIR
 from vulture.processes.wps_cf_check import CFCheck
+from vulture.processes.wps_cf_check_batch import CFCheckBatch
 
 import pytest
 import xml.etree.ElementTree as ET
@@ -86,3 +87,35 @@ def test_cf_check_NetCDFFileUpload_success():
     assert 'WARNINGS given: 1'
     assert 'INFORMATION messages: 0'
 
+
+def test_cf_check_batch_success(tmp_path, cru_like_file, local_cf_tables):
+    client = client_for(Service(processes=[CFCheckBatch()], cfgfiles=[PYWPS_CFG]))
+    os.mkdir(tmp_path / "delivery")
+
+    for name in ("a.nc", "b.nc"):
+        os.link(cru_like_file, tmp_path / "delivery" / name)
+
+    datainputs = f"CFVersion=auto;NetCDFFilePaths={tmp_path / 'delivery'};NetCDFFilePaths={cru_like_file}"
+    resp = client.get(
+        f"?service=WPS&request=Execute&version=1.0.0&identifier=CFCheckBatch&datainputs={datainputs}"
+    )
+    assert_response_success(resp)
+
+    output_file = get_output(resp.xml)["output"][7:] # trims off 'file://'
+    output = open(output_file).read()
+
+    assert output.startswith('CF-CHECKER REPORT FOR 3 FILES')
+    assert output.count('CHECKING NetCDF FILE:') == 3
+    assert output.endswith('3 of 3 files passed the CF checks.\n')
+
+
+def test_cf_check_batch_fail_no_files(tmp_path):
+    client = client_for(Service(processes=[CFCheckBatch()], cfgfiles=[PYWPS_CFG]))
+
+    datainputs = f"CFVersion=auto;NetCDFFilePaths={tmp_path}/*.nc"
+    resp = client.get(
+        f"?service=WPS&request=Execute&version=1.0.0&identifier=CFCheckBatch&datainputs={datainputs}"
+    )
+
+    resp_str = resp.response[0].decode('utf-8')
+    assert "Process error: No NetCDF files were found at one or more of the paths provided." in resp_str
@@ -0,0 +1,135 @@
+import os
+import shutil
+from io import StringIO
+
+import pytest
+from cfchecker import cfchecks
+
+from vulture.cf_reports import REPORT_FILE_PREFIX, check_file, check_files, find_nc_files, get_report_key
+from vulture.cf_tables import CFTableCache
+from vulture.stripes_lib.cache import ArtifactCache
+
+from .common import write_cf_tables
+
+
+def _count_checks(tables):
+    checks = []
+    create_checker = tables.create_checker
+
+    def _create_checker(**kwargs):
+        checks.append(kwargs["version"])
+        return create_checker(**kwargs)
+
+    tables.create_checker = _create_checker
+    return checks
+
+
+def test_check_file_stores_report(tmp_path, cru_like_file):
+    tables = CFTableCache(write_cf_tables(tmp_path))
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    checks = _count_checks(tables)
+    version = cfchecks.newest_version
+
+    reports = [str(tmp_path / f"report{i}.txt") for i in range(2)]
+
+    assert check_file(cru_like_file, reports[0], version, cache=cache, tables=tables) is False
+    assert check_file(cru_like_file, reports[1], version, cache=cache, tables=tables) is True
+    assert checks == [version]
+
+    assert open(reports[0]).read() == open(reports[1]).read()
+    assert f"{REPORT_FILE_PREFIX}{cru_like_file}\n" in open(reports[1]).read()
+
+    # The file is checked again when it changes, or against another version
+    stat = os.stat(cru_like_file)
+    os.utime(cru_like_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    assert check_file(cru_like_file, reports[1], version, cache=cache, tables=tables) is False
+    assert check_file(cru_like_file, reports[1], cfchecks.CFVersion("CF-1.6"), cache=cache, tables=tables) is False
+    assert len(checks) == 3
+
+
+def test_check_file_by_content(tmp_path, cru_like_file):
+    tables = CFTableCache(write_cf_tables(tmp_path))
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    checks = _count_checks(tables)
+    version = cfchecks.newest_version
+
+    # The same content, uploaded to a new directory for each job
+    nc_files = []
+    for job in ("job1", "job2"):
+        os.mkdir(tmp_path / job)
+        nc_files.append(str(tmp_path / job / "data.nc"))
+        shutil.copyfile(cru_like_file, nc_files[-1])
+
+    assert get_report_key(nc_files[0], version, by_content=True, tables=tables) == \
+        get_report_key(nc_files[1], version, by_content=True, tables=tables)
+    assert get_report_key(nc_files[0], version, tables=tables) != get_report_key(nc_files[1], version, tables=tables)
+
+    reports = [str(tmp_path / job / "report.txt") for job in ("job1", "job2")]
+    for nc_file, report in zip(nc_files, reports):
+        check_file(nc_file, report, version, by_content=True, cache=cache, tables=tables)
+
+    assert len(checks) == 1
+
+    # The stored report names the file that was checked in each job
+    first, second = open(reports[0]).read(), open(reports[1]).read()
+    assert f"{REPORT_FILE_PREFIX}{nc_files[0]}\n" in first
+    assert f"{REPORT_FILE_PREFIX}{nc_files[1]}\n" in second
+    assert second == first.replace(nc_files[0], nc_files[1])
+
+    # ...without changing the report in the cache
+    check_file(nc_files[0], reports[0], version, by_content=True, cache=cache, tables=tables)
+    assert open(reports[0]).read() == first
+
+
+def test_find_nc_files(tmp_path):
+    for path in ("a.nc", "b.nc", "notes.txt", "sub/c.nc"):
+        (tmp_path / path).parent.mkdir(exist_ok=True)
+        (tmp_path / path).write_text("")
+
+    assert find_nc_files([str(tmp_path)]) == [str(tmp_path / path) for path in ("a.nc", "b.nc", "sub/c.nc")]
+    assert find_nc_files([str(tmp_path / "b.nc"), str(tmp_path / "*.nc")]) == \
+        [str(tmp_path / "b.nc"), str(tmp_path / "a.nc")]
+    assert find_nc_files([str(tmp_path / "**" / "c.nc")]) == [str(tmp_path / "sub/c.nc")]
+    assert find_nc_files([str(tmp_path / "*")]) == [str(tmp_path / "a.nc"), str(tmp_path / "b.nc")]
+
+    # The search stops once there are more files than the limit
+    assert find_nc_files([str(tmp_path)], limit=3) == find_nc_files([str(tmp_path)])
+    assert find_nc_files([str(tmp_path / "b.nc"), str(tmp_path)], limit=1) == \
+        [str(tmp_path / "b.nc"), str(tmp_path / "a.nc")]
+
+    with pytest.raises(ValueError, match="No NetCDF files found"):
+        find_nc_files([str(tmp_path / "*.txt"), str(tmp_path / "missing")])
+
+
+def test_check_files(tmp_path, cru_like_file, local_cf_tables):
+    nc_files = [str(tmp_path / name) for name in ("a.nc", "b.nc", "bad.nc")]
+    shutil.copyfile(cru_like_file, nc_files[0])
+    shutil.copyfile(cru_like_file, nc_files[1])
+    (tmp_path / "bad.nc").write_text("Not a NetCDF file")
+
+    progress = []
+    writer = StringIO()
+    rows = check_files(nc_files, writer, version="1.6", work_dir=str(tmp_path), max_workers=2,
+                       callback=lambda n_done, n_total, row: progress.append((n_done, n_total)))
+
+    assert progress == [(1, 3), (2, 3), (3, 3)]
+    assert [row["status"] for row in rows[:2]] == ["PASS", "PASS"]
+    assert rows[0]["cf_version"] == "CF-1.6" and rows[0]["warnings"] > 0
+    assert rows[2]["status"] == "FAIL" and rows[2]["fatal"] == 1
+
+    # The reports are written in the order of the files, followed by the summary
+    report = writer.getvalue()
+    sections = [report.index(f"] {row['status']}: {row['file']}\n") for row in rows]
+    assert sections == sorted(sections)
+    assert report.count(REPORT_FILE_PREFIX) == 3
+    assert f"FATAL: NetCDF: Unknown file format: {nc_files[2]}\n" in report
+    assert "Using Standard Name Table Version 84" in report
+    assert report.endswith("2 of 3 files passed the CF checks.\n")
+
+    summary = report[report.index("SUMMARY"):].splitlines()
+    assert summary[2].split() == ["File", "CF", "version", "Fatal", "Errors", "Warnings", "Info", "Status"]
+    assert summary[3].split()[:3] == [nc_files[0], "CF-1.6", "0"]
+
+    # Nothing is left behind in the working directory
+    assert sorted(os.listdir(tmp_path)) == ["a.nc", "b.nc", "bad.nc", "cf-report-cache", "cru_ts.tmp.dat.nc", "tables"]
@@ -0,0 +1,89 @@
+import functools
+import os
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+
+from cfchecker import cfchecks
+
+from vulture.cf_tables import CFTableCache
+from vulture.utils import capture_stdout
+
+from .common import write_cf_tables
+
+
+def _count_parses(tables):
+    parsed = []
+    parse = tables._parse
+
+    def _parse(name):
+        parsed.append(name)
+        return parse(name)
+
+    tables._parse = _parse
+    return parsed
+
+
+def test_CFTableCache_parses_once(tmp_path):
+    tables = CFTableCache(write_cf_tables(tmp_path))
+    parsed = _count_parses(tables)
+
+    assert tables.warm() == ["standard_names", "area_types", "region_names"]
+    assert tables.get("standard_names").dict["air_temperature"] == "K"
+    assert tables.get("area_types").list == {"land"}
+    assert parsed == ["standard_names", "area_types", "region_names"]
+
+
+def test_CFTableCache_parses_changed_files(tmp_path):
+    sources = write_cf_tables(tmp_path)
+    tables = CFTableCache(sources)
+    parsed = _count_parses(tables)
+
+    assert tables.get("standard_names").version_number == "84"
+
+    write_cf_tables(tmp_path, version=85)
+    stat = os.stat(sources["standard_names"])
+    os.utime(sources["standard_names"], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    assert tables.get("standard_names").version_number == "85"
+    assert parsed == ["standard_names", "standard_names"]
+
+
+def test_CFTableCache_reads_urls(tmp_path):
+    write_cf_tables(tmp_path)
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=str(tmp_path))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    try:
+        url = f"http://127.0.0.1:{server.server_port}"
+        tables = CFTableCache({name: f"{url}/{name}.xml" for name in ("standard_names", "area_types")} |
+                              {"region_names": f"{url}/missing.xml"})
+
+        assert tables.warm() == ["standard_names", "area_types"]
+        assert tables.get("standard_names").version_number == "84"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_CFTableCache_create_checker(tmp_path, cru_like_file):
+    tables = CFTableCache(write_cf_tables(tmp_path))
+    tables.warm()
+    parsed = _count_parses(tables)
+
+    nc_file = str(tmp_path / "data.nc")
+    os.link(cru_like_file, nc_file)
+
+    for _ in range(2):
+        output = StringIO()
+        with capture_stdout(output):
+            tables.create_checker(version=cfchecks.newest_version).checker(nc_file)
+
+        assert "Using Standard Name Table Version 84 (2024-01-01)" in output.getvalue()
+
+    assert parsed == []
+
+    # Checkers created without the cache still parse their own tables
+    handler = cfchecks.ConstructDict()
+    assert handler.dict == {}
@@ -1,10 +1,23 @@
+import json
 import os
+import re
+import zipfile
+from io import BytesIO, StringIO
 
-#from pywps import Service
-#from pywps.tests import client_for, assert_response_success, assert_process_exception
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
 
-#from .common import get_output, PYWPS_CFG, MINI_CEDA_CACHE_DIR
-from vulture.stripes_lib.stripes import StripesRenderer
+from pywps import Service
+from pywps.tests import client_for, assert_response_success
+
+from .common import get_output, PYWPS_CFG
+from vulture.processes import wps_plot_climate_stripes_global
+from vulture.processes.wps_plot_climate_stripes_global import PlotClimateStripesGlobal
+from vulture.stripes_lib.stripes import (StripesMaker, StripesRenderer, get_colour_map, get_colour_indexes,
+                                         get_colour_tables, get_colours_lookup, rgba_to_hex, benchmark_pdf_backends)
+from vulture.stripes_lib.cache import ArtifactCache, DiskCache
 
 #import pytest
 #import xml.etree.ElementTree as ET
@@ -49,3 +62,434 @@ def test_StripesMakerGlobal():
     #stripes_maker.show_table(full=False)
     #stripes_maker.show_plot()
 
+
+def test_StripesMaker_caches_by_grid_cell(cru_like_file, tmp_path, monkeypatch):
+    stripes_maker = StripesRenderer(global_mode=True, netcdf_path=cru_like_file, 
+                                    cache=DiskCache(str(tmp_path / "cache")))
+    calls = []
+    extract = stripes_maker._extract_time_series_at_location
+
+    def _counting_extract(*args, **kwargs):
+        calls.append(args)
+        return extract(*args, **kwargs)
+
+    monkeypatch.setattr(stripes_maker, "_extract_time_series_at_location", _counting_extract)
+
+    png_file = str(tmp_path / "stripes.png")
+    df1 = stripes_maker.create(51.57, -1.31, output_file=png_file)
+    df2 = stripes_maker.create(51.60, -1.35, n_colours=10, time_range=(1950, 2010), output_file=png_file)
+
+    # Both requests are in the same grid cell, so the data files are only read once
+    assert len(calls) == 1
+    assert list(df2["years"]) == list(range(1950, 2011))
+
+    # The same series is sliced in memory for the smaller time range
+    df1 = df1.set_index("years")
+    df2 = df2.set_index("years")
+    assert (df1.loc[1950:2010, "temp_value"] == df2["temp_value"]).all()
+    assert (df1.loc[1950:2010, "temp_demeaned"] == df2["temp_demeaned"]).all()
+
+    # The series is read again once the data file has been modified
+    stat = os.stat(cru_like_file)
+    os.utime(cru_like_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    stripes_maker.create(51.57, -1.31, output_file=png_file)
+    assert len(calls) == 2
+
+
+def _count_bytes_read(monkeypatch, var_id):
+    """
+    Patch the NetCDF4 backend of Xarray to count the bytes read for variable `var_id`.
+    Returns a list that accumulates the byte counts of each read.
+    """
+    from xarray.backends.netCDF4_ import NetCDF4ArrayWrapper
+    bytes_read = []
+    _getitem = NetCDF4ArrayWrapper._getitem
+
+    def _counting_getitem(self, key):
+        array = _getitem(self, key)
+        if self.variable_name == var_id:
+            bytes_read.append(np.asarray(array).nbytes)
+        return array
+
+    monkeypatch.setattr(NetCDF4ArrayWrapper, "_getitem", _counting_getitem)
+    return bytes_read
+
+
+@pytest.mark.parametrize("lat, lon, cell_lon", [(51.57, -1.31, -1.25), (51.57, -8.2, -7.75), (51.57, -15, -7.75)])
+def test_StripesMakerGlobal_reads_only_the_point(cru_like_file, tmp_path, monkeypatch, lat, lon, cell_lon):
+    stripes_maker = StripesMaker(global_mode=True, netcdf_path=cru_like_file, annual_netcdf_path=None,
+                                 cache=DiskCache(str(tmp_path / "cache")))
+    stripes_maker._get_valid_cell_lookup(stripes_maker._open_dataset())
+    bytes_read = _count_bytes_read(monkeypatch, "tmp")
+
+    data = stripes_maker._get_cell_series(lat, lon)
+    assert not np.isnan(data["temp_values"]).any()
+
+    # Points on the coast or at sea are redirected to the nearest land cell
+    assert (data["lat"], data["lon"]) == (51.75, cell_lon)
+
+    # Only the time series at that cell should be read
+    n_times, n_lats, n_lons = xr.open_dataset(cru_like_file).tmp.shape
+    one_cell = n_times * np.dtype("float32").itemsize
+
+    assert 0 < sum(bytes_read) <= 2 * one_cell
+    assert sum(bytes_read) < n_lats * n_lons * one_cell / 100
+
+
+def test_StripesRenderer_create_many(cru_like_file, tmp_path):
+    stripes_maker = StripesRenderer(global_mode=True, netcdf_path=cru_like_file, annual_netcdf_path=None,
+                                    cache=DiskCache(str(tmp_path / "cache")))
+    locations = [(51.57, -1.31, "Harwell"), (51.75, -1.26, "Oxford"), (55.95, -3.19, "Edinburgh")]
+    progress = []
+
+    zip_file = stripes_maker.create_many(locations, str(tmp_path), time_range=(1950, 2010), max_workers=2,
+                                         callback=lambda n_done, n_total: progress.append((n_done, n_total)))
+
+    with zipfile.ZipFile(zip_file) as bundle:
+        names = sorted(bundle.namelist())
+        summary = pd.read_csv(bundle.open("summary.csv"))
+
+    assert names == ["001_Harwell.pdf", "001_Harwell.png", "002_Oxford.pdf", "002_Oxford.png",
+                     "003_Edinburgh.pdf", "003_Edinburgh.png", "summary.csv"]
+    assert list(summary["status"]) == ["OK"] * 3
+    assert progress[-1] == (3, 3)
+
+    # Harwell and Oxford are in the same grid box
+    assert summary["cell_latitude"][0] == summary["cell_latitude"][1] == 51.75
+
+
+def test_StripesRenderer_create_many_location_fails(cru_like_file, tmp_path):
+    stripes_maker = StripesRenderer(global_mode=True, netcdf_path=cru_like_file, annual_netcdf_path=None,
+                                    cache=DiskCache(str(tmp_path / "cache")))
+    locations = [(51.57, -1.31, "Harwell"), (55.95, -3.19, "Edinburgh")]
+
+    # Give the worker that renders Edinburgh data it cannot use
+    get_cell_series_many = stripes_maker._get_cell_series_many
+
+    def _get_cell_series_many(locations):
+        all_data = get_cell_series_many(locations)
+        del all_data[1]["temp_values"]
+        return all_data
+
+    stripes_maker._get_cell_series_many = _get_cell_series_many
+    progress = []
+
+    zip_file = stripes_maker.create_many(locations, str(tmp_path), time_range=(1950, 2010), max_workers=2,
+                                         callback=lambda n_done, n_total: progress.append((n_done, n_total)))
+
+    with zipfile.ZipFile(zip_file) as bundle:
+        names = sorted(bundle.namelist())
+        summary = pd.read_csv(bundle.open("summary.csv"))
+
+    # The error is listed in the summary, and the other location is still rendered
+    assert names == ["001_Harwell.pdf", "001_Harwell.png", "summary.csv"]
+    assert list(summary["name"]) == ["001_Harwell", "002_Edinburgh"]
+    assert list(summary["status"]) == ["OK", "Could not render the stripes: 'temp_values'"]
+    assert progress[-1] == (2, 2)
+
+
+@pytest.fixture
+def global_stripes_renders(monkeypatch, cru_like_file, tmp_path):
+    """
+    Points the global stripes process at the test data (with its own caches), and records the files
+    it asks the renderer for. Returns the list of (png_file, pdf_file) passed to `create_outputs`.
+    """
+    renders = []
+
+    class _Renderer(StripesRenderer):
+        def __init__(self, **kwargs):
+            super().__init__(netcdf_path=cru_like_file, annual_netcdf_path=None,
+                             climatology_path=str(tmp_path / "climatology.nc"),
+                             cache=DiskCache(str(tmp_path / "cache")),
+                             artifacts=ArtifactCache(str(tmp_path / "artifacts")), **kwargs)
+
+        def create_outputs(self, png_file=None, pdf_file=None, **kwargs):
+            renders.append((png_file, pdf_file))
+            return super().create_outputs(png_file, pdf_file, **kwargs)
+
+    monkeypatch.setattr(wps_plot_climate_stripes_global, "StripesRenderer", _Renderer)
+    return renders
+
+
+def _run_with_inputs(datainputs, response_document):
+    """
+    Run the global stripes process with `datainputs`, asking for the outputs in `response_document`.
+    Returns the paths of the outputs that were written (the response lists the others without a reference).
+    """
+    client = client_for(Service(processes=[PlotClimateStripesGlobal()], cfgfiles=[PYWPS_CFG]))
+    resp = client.get(
+        f"?service=WPS&request=Execute&version=1.0.0&identifier=PlotClimateStripesGlobal"
+        f"&datainputs={datainputs}&ResponseDocument={response_document}"
+    )
+    assert_response_success(resp)
+    return {name: href[7:] for name, href in get_output(resp.xml).items() if href}  # trims off 'file://'
+
+
+def test_wps_global_png_only(global_stripes_renders):
+    datainputs = "latitude=51.57;longitude=-1.31;start_year=1950;end_year=2010"
+    outputs = _run_with_inputs(datainputs, "png_output=@asReference=true")
+
+    # Only the PNG is rendered (no HTML or PDF) and returned
+    assert set(outputs) == {"png_output"}
+    assert len(global_stripes_renders) == 1
+    assert global_stripes_renders[0][0].endswith("stripes.png") and global_stripes_renders[0][1] is None
+    assert open(outputs["png_output"], "rb").read(8) == b"\x89PNG\r\n\x1a\n"
+
+
+def test_wps_global_data_only(global_stripes_renders):
+    datainputs = "latitude=51.57;longitude=-1.31;start_year=1950;end_year=2010"
+    json_outputs = _run_with_inputs(datainputs, "data_output=@asReference=true")
+    csv_outputs = _run_with_inputs(datainputs, "data_output=@asReference=true@mimetype=text/csv")
+
+    # Nothing is rendered, and only the data is returned: as JSON by default, or as CSV if asked for
+    assert set(json_outputs) == set(csv_outputs) == {"data_output"}
+    assert global_stripes_renders == []
+
+    data = json.load(open(json_outputs["data_output"]))
+    df = pd.read_csv(csv_outputs["data_output"])
+
+    assert json_outputs["data_output"].endswith(".json") and csv_outputs["data_output"].endswith(".csv")
+    assert data["years"] == list(df["years"]) == list(range(1950, 2011))
+    assert data["colour"] == list(df["colour"])
+
+
+def test_wps_global_data_only_missing_values(global_stripes_renders, cru_like_file, monkeypatch):
+    data_formats = []
+    to_data = StripesRenderer.to_data
+
+    def _to_data(self, data_format="json", data_file=None):
+        data_formats.append(data_format)
+        return to_data(self, data_format, data_file)
+
+    monkeypatch.setattr(StripesRenderer, "to_data", _to_data)
+
+    # Remove a whole year of data at the grid cell
+    with xr.open_dataset(cru_like_file) as ds:
+        ds = ds.load()
+    ds["tmp"].loc[{"time": ds.time.dt.year == 1960, "lat": 51.75, "lon": -1.25}] = np.nan
+    ds.to_netcdf(cru_like_file)
+
+    client = client_for(Service(processes=[PlotClimateStripesGlobal()], cfgfiles=[PYWPS_CFG]))
+    resp = client.get(
+        "?service=WPS&request=Execute&version=1.0.0&identifier=PlotClimateStripesGlobal"
+        "&datainputs=latitude=51.57;longitude=-1.31;start_year=1950;end_year=2010"
+        "&ResponseDocument=data_output=@asReference=true"
+    )
+
+    # The data is checked as it is for the figure, before any of it is written
+    resp_str = resp.response[0].decode('utf-8')
+    assert "Process error: The chosen latitude and longitude returned no valid data." in resp_str
+    assert "data_output" not in get_output(resp.xml)
+    assert global_stripes_renders == [] and data_formats == []
+
+
+def test_get_colour_indexes_matches_colour_map():
+    values = np.array([-0.1, 0, 0.049, 0.05, 0.5, 0.999, 1.0, 1.2, np.nan])
+    cmap = get_colour_map("RdBu_r", 20)
+    tables = get_colour_tables("RdBu_r", 20)
+
+    indexes = get_colour_indexes(values, tables.n_colours)
+
+    assert indexes.tolist() == [20, 0, 0, 1, 10, 19, 19, 21, 22]
+    np.testing.assert_array_equal(tables.lut[indexes], cmap(values))
+    assert tables.hex[5] == rgba_to_hex(*cmap._lut[5])
+
+
+def test_StripesMaker_colour_names(cru_like_file, tmp_path):
+    stripes_maker = StripesMaker(global_mode=True, netcdf_path=cru_like_file, annual_netcdf_path=None,
+                                 cache=DiskCache(str(tmp_path / "cache")))
+    df = stripes_maker.create(51.57, -1.31, n_colours=20, range_buffer=0, output_file=str(tmp_path / "stripes.png"))
+
+    # The coolest and warmest years are in the first and last colour bins
+    assert df.loc[df.temp_demeaned.idxmin(), "colour"] == "colour_01"
+    assert df.loc[df.temp_demeaned.idxmax(), "colour"] == "colour_20"
+
+    tables = get_colour_tables("RdBu_r", 20)
+    for _, row in df.iterrows():
+        i = int(row["colour"].split("_")[1]) - 1
+        assert row["hex_colour"] == tables.hex[i]
+        assert (row["red"], row["green"], row["blue"]) == tuple(tables.lut[i, :3])
+
+
+def test_get_colour_tables_is_memoised(capsys):
+    tables = get_colour_tables("viridis", 12)
+
+    assert get_colour_tables("viridis", 12) is tables
+    assert get_colour_tables("viridis", 13) is not tables
+    assert not tables.lut.flags.writeable
+
+    lookup = get_colours_lookup("viridis", 12)
+    assert lookup[tuple(tables.lut[5, :3].tolist())] == "colour_06"
+    assert capsys.readouterr().out == ""
+
+
+def test_StripesRenderer_html_tables(cru_like_file, tmp_path):
+    stripes_maker = StripesRenderer(global_mode=True, netcdf_path=cru_like_file, annual_netcdf_path=None,
+                                    cache=DiskCache(str(tmp_path / "cache")))
+    df = stripes_maker.create(51.57, -1.31, time_range=(1950, 2010), output_file=str(tmp_path / "stripes.png"))
+
+    html_file = str(tmp_path / "output.html")
+    html = stripes_maker.to_html(html_file=html_file, project_name="Fish & <Chips>")
+
+    with open(html_file, encoding="utf-8") as reader:
+        assert reader.read() == html
+
+    # write_html streams the same content to a file
+    with open(str(tmp_path / "streamed.html"), "w", encoding="utf-8") as writer:
+        stripes_maker.write_html(writer, project_name="Fish & <Chips>")
+
+    with open(str(tmp_path / "streamed.html"), encoding="utf-8") as reader:
+        assert reader.read() == html
+
+    assert "<p><b>Fish &amp; &lt;Chips&gt;</b></p>" in html
+
+    # One row per year in table 1, and one per colour used in table 2
+    tables = pd.read_html(StringIO(html))
+    assert len(tables[0]) == len(df)
+    assert len(tables[1]) == df["colour"].nunique()
+
+    first_row = stripes_maker._get_table(table=1).split("<tr>")[1]
+    expected = [str(value) for value in df.round(5).iloc[0][["years", "temp_value", "temp_demeaned"]]]
+    assert [f"<td>{value}</td>" in first_row for value in expected] == [True] * 3
+
+    # Values are escaped
+    stripes_maker.latest_df.loc[0, "colour"] = "<b>"
+    assert "<td>&lt;b&gt;</td>" in stripes_maker._get_table(table=1)
+
+
+def test_StripesRenderer_pdf_backends(cru_like_file, tmp_path):
+    stripes_maker = StripesRenderer(global_mode=True, netcdf_path=cru_like_file, annual_netcdf_path=None,
+                                    cache=DiskCache(str(tmp_path / "cache")))
+    stripes_maker.create(51.57, -1.31, output_file=str(tmp_path / "stripes.png"))
+
+    pdf_file = stripes_maker.to_pdf(str(tmp_path / "output.pdf"), project_name="My project", backend="matplotlib")
+
+    with open(pdf_file, "rb") as reader:
+        content = reader.read()
+
+    # The tables run over several pages, and the text uses the standard PDF fonts
+    assert content.startswith(b"%PDF")
+    assert len(re.findall(rb"/Type /Page\b", content)) > 1
+    assert b"/BaseFont /Times-Roman" in content
+
+    with pytest.raises(ValueError):
+        stripes_maker.to_pdf(str(tmp_path / "other.pdf"), backend="unknown")
+
+    results = benchmark_pdf_backends(stripes_maker, repeats=1)
+    assert sorted(results) == ["matplotlib", "pisa"]
+    assert all(result["seconds"] > 0 and result["size_bytes"] > 0 for result in results.values())
+
+
+def test_StripesRenderer_outputs_in_memory(cru_like_file, tmp_path):
+    stripes_maker = StripesRenderer(global_mode=True, netcdf_path=cru_like_file, annual_netcdf_path=None,
+                                    cache=DiskCache(str(tmp_path / "cache")))
+    stripes_maker.create(51.57, -1.31, output_file=None)
+
+    assert stripes_maker.latest_png.startswith(b"\x89PNG")
+    assert "data:image/png;base64," in stripes_maker.to_html()
+
+    # No files are written apart from the cache
+    for backend in ("pisa", "matplotlib"):
+        pdf_file = stripes_maker.to_pdf(BytesIO(), backend=backend)
+        assert pdf_file.getvalue().startswith(b"%PDF")
+
+    assert sorted(os.listdir(tmp_path)) == ["cache", os.path.basename(cru_like_file)]
+
+    # The PNG file is the same as the image kept in memory
+    png_file = tmp_path / "stripes.png"
+    stripes_maker.create(51.57, -1.31, output_file=str(png_file))
+    assert png_file.read_bytes() == stripes_maker.latest_png
+
+
+def test_StripesRenderer_create_outputs_uses_cache(cru_like_file, tmp_path, monkeypatch):
+    stripes_maker = StripesRenderer(global_mode=True, netcdf_path=cru_like_file, annual_netcdf_path=None,
+                                    cache=DiskCache(str(tmp_path / "cache")),
+                                    artifacts=ArtifactCache(str(tmp_path / "artifacts")))
+    outputs = [str(tmp_path / "stripes.png"), str(tmp_path / "stripes.pdf")]
+
+    df = stripes_maker.create_outputs(*outputs, lat=51.57, lon=-1.31, project_name="My project")
+    contents = [open(path, "rb").read() for path in outputs]
+    assert len(df) > 0
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("The outputs should come from the cache")
+
+    # An identical request is served from the cache, without creating the stripes
+    with monkeypatch.context() as patch:
+        patch.setattr(stripes_maker, "create", _fail)
+        repeat = [str(tmp_path / "repeat.png"), str(tmp_path / "repeat.pdf")]
+
+        assert stripes_maker.create_outputs(*repeat, lat=51.57, lon=-1.31, project_name="My project") is None
+        assert [open(path, "rb").read() for path in repeat] == contents
+
+    # Anything that changes the outputs is a different request
+    df = stripes_maker.create_outputs(*outputs, lat=51.57, lon=-1.31, project_name="Another project")
+    assert df is not None
+
+    # ...including a change to the data file, or to the climatology file
+    stat = os.stat(cru_like_file)
+    os.utime(cru_like_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert stripes_maker.create_outputs(*outputs, lat=51.57, lon=-1.31, project_name="My project") is not None
+
+    stripes_maker.climatology_path = str(tmp_path / "climatology.nc")
+    xr.Dataset(attrs={"dataset_version": "another version"}).to_netcdf(stripes_maker.climatology_path)
+    assert stripes_maker.create_outputs(*outputs, lat=51.57, lon=-1.31, project_name="My project") is not None
+    assert open(outputs[0], "rb").read() == contents[0]
+    assert open(outputs[1], "rb").read() != contents[1]
+
+    # Writing the new outputs did not change the cached ones
+    assert [open(path, "rb").read() for path in repeat] == contents
+
+
+def test_StripesMaker_create_data(cru_like_file, tmp_path, monkeypatch):
+    stripes_maker = StripesMaker(global_mode=True, netcdf_path=cru_like_file, annual_netcdf_path=None,
+                                 cache=DiskCache(str(tmp_path / "cache")))
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("The stripes should not be drawn")
+
+    monkeypatch.setattr("vulture.stripes_lib.stripes.render_stripes", _fail)
+    df = stripes_maker.create_data(51.57, -1.31, n_colours=10, time_range=(1950, 1960))
+    assert stripes_maker.latest_png is None
+
+    data = json.loads(stripes_maker.to_data("json"))
+    assert data["years"] == list(range(1950, 1961))
+    assert data["temp_demeaned"] == df["temp_demeaned"].round(5).tolist()
+    assert data["request"]["n_colours"] == 10
+    assert data["request"]["dataset"] == "cru_ts-4.08"
+    assert [data["colours"][colour] for colour in data["colour"]] == df["hex_colour"].tolist()
+
+    csv_file = stripes_maker.to_data("csv", str(tmp_path / "stripes.csv"))
+    csv_df = pd.read_csv(csv_file)
+    assert list(csv_df.columns) == ["years", "temp_value", "temp_demeaned", "colour", "hex_colour"]
+    assert csv_df["years"].tolist() == data["years"]
+
+    with pytest.raises(ValueError):
+        stripes_maker.to_data("xml")
+
+
+def test_StripesRenderer_create_outputs_only_requested(cru_like_file, tmp_path, monkeypatch):
+    stripes_maker = StripesRenderer(global_mode=True, netcdf_path=cru_like_file, annual_netcdf_path=None,
+                                    cache=DiskCache(str(tmp_path / "cache")),
+                                    artifacts=ArtifactCache(str(tmp_path / "artifacts")))
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("The PDF should not be written")
+
+    # Only the PNG is made, without any HTML or PDF content
+    with monkeypatch.context() as patch:
+        patch.setattr(stripes_maker, "write_html", _fail)
+        patch.setattr(stripes_maker, "to_pdf", _fail)
+
+        png_file = str(tmp_path / "stripes.png")
+        assert stripes_maker.create_outputs(png_file, None, lat=51.57, lon=-1.31, project_name="Project") is not None
+        assert open(png_file, "rb").read() == stripes_maker.latest_png
+
+    # The PNG is shared by requests for different projects, so only the PDF is missing from the cache
+    outputs = [str(tmp_path / "both.png"), str(tmp_path / "both.pdf")]
+    assert stripes_maker.create_outputs(*outputs, lat=51.57, lon=-1.31, project_name="Another project") is not None
+    assert open(outputs[0], "rb").read() == open(png_file, "rb").read()
+    assert open(outputs[1], "rb").read().startswith(b"%PDF")
+
+    assert stripes_maker.create_outputs(None, str(tmp_path / "repeat.pdf"), lat=51.57, lon=-1.31,
+                                        project_name="Another project") is None
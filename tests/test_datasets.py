@@ -0,0 +1,54 @@
+import os
+import threading
+
+import xarray as xr
+
+from vulture.stripes_lib.datasets import DatasetPool
+
+
+def _counting_opener(opened):
+    def _open(path):
+        opened.append(path)
+        return xr.open_dataset(path)
+    return _open
+
+
+def test_DatasetPool_reuses_open_datasets(cru_like_file):
+    pool = DatasetPool()
+    opened = []
+
+    ds1 = pool.get(cru_like_file, _counting_opener(opened)).ds
+    ds2 = pool.get(cru_like_file, _counting_opener(opened)).ds
+
+    assert ds1 is ds2
+    assert opened == [cru_like_file]
+
+
+def test_DatasetPool_reopens_changed_files(cru_like_file):
+    pool = DatasetPool()
+    opened = []
+
+    handle = pool.get(cru_like_file, _counting_opener(opened))
+    mtime = os.stat(cru_like_file).st_mtime
+    os.utime(cru_like_file, (mtime + 10, mtime + 10))
+
+    assert pool.get(cru_like_file, _counting_opener(opened)) is not handle
+    assert opened == [cru_like_file, cru_like_file]
+
+
+def test_DatasetPool_is_thread_safe(cru_like_file):
+    pool = DatasetPool()
+    opened = []
+    handles = []
+
+    def _get():
+        handles.append(pool.get(cru_like_file, _counting_opener(opened)))
+
+    threads = [threading.Thread(target=_get) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(opened) == 1
+    assert len(set(id(handle) for handle in handles)) == 1
@@ -0,0 +1,114 @@
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from vulture.downloads import download_file
+from vulture.exceptions import DownloadError
+
+
+CONTENT = os.urandom(300 * 1024)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    Serves `CONTENT` (with support for "Range" requests). The server's `failures` list sets what
+    happens to each request in turn: "drop" (close the connection half way through), "503", or None.
+    Any other path than "/file.nc" is not found.
+    """
+
+    def do_GET(self):
+        self.server.requests.append(self.headers.get("Range"))
+        failure = self.server.failures.pop(0) if self.server.failures else None
+
+        if self.path != "/file.nc":
+            self.send_error(404)
+            return
+
+        if failure == "503":
+            self.send_error(503)
+            return
+
+        start = 0
+        match = re.fullmatch(r"bytes=(\d+)-", self.headers.get("Range") or "")
+
+        if match and self.server.ranges:
+            start = int(match.group(1))
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(CONTENT) - 1}/{len(CONTENT)}")
+        else:
+            self.send_response(200)
+
+        body = CONTENT[start:]
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        if failure == "drop":
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+        else:
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.requests, server.failures, server.ranges = [], [], True
+    server.url = f"http://127.0.0.1:{server.server_port}/file.nc"
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_download_file_streams_in_chunks(server, tmp_path):
+    progress = []
+    path = download_file(server.url, str(tmp_path / "file.nc"), chunk_size=64 * 1024,
+                         callback=lambda n_bytes, total: progress.append((n_bytes, total)))
+
+    assert open(path, "rb").read() == CONTENT
+    assert progress[0] == (64 * 1024, len(CONTENT))
+    assert progress[-1] == (len(CONTENT), len(CONTENT))
+
+
+@pytest.mark.parametrize("ranges", [True, False])
+def test_download_file_resumes(server, tmp_path, ranges):
+    server.failures = ["drop", "503"]
+    server.ranges = ranges
+
+    path = download_file(server.url, str(tmp_path / "file.nc"), chunk_size=16 * 1024, retry_wait=0)
+    assert open(path, "rb").read() == CONTENT
+
+    # The retries ask for the rest of the file, after the chunks that were received
+    first, *retries = server.requests
+    assert first is None
+    assert len(retries) == 2 and retries[0] == retries[1]
+    assert 0 < int(re.fullmatch(r"bytes=(\d+)-", retries[0]).group(1)) <= len(CONTENT) // 2
+
+
+def test_download_file_gives_up(server, tmp_path):
+    server.failures = ["503"] * 3
+
+    with pytest.raises(DownloadError):
+        download_file(server.url, str(tmp_path / "file.nc"), retries=2, retry_wait=0)
+
+
+def test_download_file_size_limit(server, tmp_path):
+    with pytest.raises(DownloadError, match="too large"):
+        download_file(server.url, str(tmp_path / "file.nc"), max_bytes=len(CONTENT) - 1)
+
+    # Nothing is read beyond the headers
+    assert os.path.getsize(tmp_path / "file.nc") == 0
+
+
+def test_download_file_not_found(server, tmp_path):
+    with pytest.raises(DownloadError, match="404"):
+        download_file(server.url.replace("file.nc", "missing.nc"), str(tmp_path / "file.nc"))
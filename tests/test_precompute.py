@@ -0,0 +1,80 @@
+import os
+
+import numpy as np
+import pytest
+import xarray as xr
+from click.testing import CliRunner
+
+from vulture.cli import cli
+from vulture.stripes_lib.cache import DiskCache
+from vulture.stripes_lib.precompute import write_annual_means, write_climatologies
+from vulture.stripes_lib.stripes import StripesMaker, annual_mean
+
+
+def test_write_annual_means(cru_like_file, tmp_path):
+    output_path = str(tmp_path / "annual.nc")
+    write_annual_means(cru_like_file, output_path, chunk_size=(4, 4), lat_block_size=7)
+
+    expected = annual_mean(xr.open_dataset(cru_like_file, use_cftime=True).tmp)
+    ds = xr.open_dataset(output_path, use_cftime=True)
+
+    assert ds.attrs["frequency"] == "yr"
+    assert ds.tmp.encoding["chunksizes"] == (ds.time.size, 4, 4)
+    np.testing.assert_array_equal(ds.time.dt.year, expected.time.dt.year)
+    np.testing.assert_allclose(ds.tmp.values, expected.values, rtol=1e-6)
+
+
+def test_precompute_cru_annual_cli(cru_like_file, tmp_path):
+    output_path = str(tmp_path / "annual.nc")
+    result = CliRunner().invoke(cli, ["precompute", "cru-annual", "--netcdf-path", cru_like_file,
+                                      "--output-path", output_path])
+
+    assert result.exit_code == 0, result.output
+    assert os.path.isfile(output_path)
+
+
+def test_StripesMaker_global_uses_annual_means(cru_like_file, tmp_path):
+    annual_path = str(tmp_path / "annual.nc")
+    cache = DiskCache(str(tmp_path / "cache"))
+
+    stripes_maker = StripesMaker(global_mode=True, netcdf_path=cru_like_file, annual_netcdf_path=annual_path,
+                                 cache=cache)
+    monthly = stripes_maker._get_cell_series(51.57, -1.31)
+
+    write_annual_means(cru_like_file, annual_path)
+    assert stripes_maker.source_path == annual_path
+
+    annual = stripes_maker._get_cell_series(51.57, -1.31)
+    np.testing.assert_array_equal(annual["years"], monthly["years"])
+    np.testing.assert_allclose(annual["temp_values"], monthly["temp_values"], rtol=1e-6)
+
+
+def test_write_climatologies(cru_like_file, tmp_path):
+    climatology_path = str(tmp_path / "climatology.nc")
+    maker_kwargs = {"global_mode": True, "netcdf_path": cru_like_file, "annual_netcdf_path": None,
+                    "cache": DiskCache(str(tmp_path / "cache"))}
+
+    write_climatologies(output_path=climatology_path, periods=[(1901, 2000), (1961, 1990)], row_block_size=7,
+                        **maker_kwargs)
+
+    ds = xr.open_dataset(climatology_path)
+    assert ds.climatology.shape == (2, 40, 40)
+    assert list(ds.period_start.values) == [1901, 1961]
+
+    for reference_period in [(1901, 2000), (1961, 1990)]:
+        stripes_maker = StripesMaker(climatology_path=climatology_path, reference_period=reference_period,
+                                     **maker_kwargs)
+        data = stripes_maker._get_cell_series(51.57, -1.31)
+
+        in_period = (data["years"] >= reference_period[0]) & (data["years"] <= reference_period[1])
+        assert data["reference_mean"] == pytest.approx(data["temp_values"][in_period].mean())
+
+    # Reference periods that have not been pre-computed are calculated from the series
+    stripes_maker = StripesMaker(climatology_path=climatology_path, reference_period=(1971, 2000), **maker_kwargs)
+    assert stripes_maker._get_cell_series(51.57, -1.31)["reference_mean"] is None
+
+
+def test_precompute_climatology_cli_invalid_period():
+    result = CliRunner().invoke(cli, ["precompute", "climatology", "--period", "1961"])
+    assert result.exit_code != 0
+    assert "START-END" in result.output
@@ -0,0 +1,74 @@
+import json
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from vulture.exceptions import LocationOutOfRangeError
+from vulture.stripes_lib import stripes
+from vulture.stripes_lib.cache import DiskCache
+from vulture.stripes_lib.regions import Region
+from vulture.stripes_lib.stripes import StripesMaker, StripesRenderer, annual_mean
+
+
+SQUARE_WITH_HOLE = {
+    "type": "Polygon",
+    "coordinates": [[[-2, 50], [2, 50], [2, 54], [-2, 54], [-2, 50]],
+                    [[-1, 51], [1, 51], [1, 53], [-1, 53], [-1, 51]]]
+}
+
+
+def test_Region_from_bbox_contains():
+    region = Region.from_bbox(-2, 50, 2, 54)
+    lats = np.array([[52, 49.9], [53.9, 52]])
+    lons = np.array([[0, 0], [1.9, 2.1]])
+
+    assert region.contains(lats, lons).tolist() == [[True, False], [True, False]]
+    assert region.bounds == (-2, 50, 2, 54)
+
+
+def test_Region_from_geojson_with_hole():
+    feature = {"type": "FeatureCollection", "features": [{"type": "Feature", "geometry": SQUARE_WITH_HOLE}]}
+    region = Region.from_geojson(json.dumps(feature))
+
+    assert region.contains([52, 52, 55], [-1.5, 0, 0]).tolist() == [True, False, False]
+    assert region.key == Region.from_geojson(SQUARE_WITH_HOLE).key
+
+
+@pytest.mark.parametrize("geojson", ['{"type": "Point", "coordinates": [0, 51]}',
+                                     '{"type": "FeatureCollection", "features": []}'])
+def test_Region_from_geojson_invalid(geojson):
+    with pytest.raises(ValueError):
+        Region.from_geojson(geojson)
+
+
+def test_StripesMakerGlobal_region_mean(cru_like_file, tmp_path, monkeypatch):
+    # Force the data to be read in many small blocks
+    monkeypatch.setattr(stripes, "REGION_BLOCK_BYTES", 40 * 1024)
+    stripes_maker = StripesRenderer(global_mode=True, netcdf_path=cru_like_file, annual_netcdf_path=None,
+                                    cache=DiskCache(str(tmp_path / "cache")))
+    region = Region.from_bbox(-9, 45, 2, 55)
+
+    df = stripes_maker.create_for_region(region, time_range=(1950, 2010), output_file=str(tmp_path / "stripes.png"))
+    assert list(df["years"]) == list(range(1950, 2011))
+    assert "Area between latitudes 45.0" in stripes_maker.to_html()
+
+    # Compare with the cos(lat) weighted mean over the whole cube (ignoring the missing values)
+    tmp = xr.open_dataset(cru_like_file, use_cftime=True).tmp.sel(lat=slice(45, 55), lon=slice(-9, 2))
+    weights = np.cos(np.radians(tmp.lat)) * tmp.notnull()
+    expected = annual_mean((tmp * weights).sum(["lat", "lon"]) / weights.sum(["lat", "lon"]))
+    expected = expected.sel(time=slice("1950", "2010")).values
+
+    assert np.allclose(df["temp_value"], expected)
+
+
+def test_StripesMakerGlobal_region_without_cells(cru_like_file, tmp_path):
+    stripes_maker = StripesMaker(global_mode=True, netcdf_path=cru_like_file, annual_netcdf_path=None,
+                                 cache=DiskCache(str(tmp_path / "cache")))
+
+    with pytest.raises(LocationOutOfRangeError):
+        stripes_maker.create_for_region(Region.from_bbox(0.1, 51.1, 0.2, 51.2))
+
+    # Only missing values (sea)
+    with pytest.raises(LocationOutOfRangeError):
+        stripes_maker.create_for_region(Region.from_bbox(-9.9, 50, -8.1, 52))
@@ -0,0 +1,67 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import matplotlib.pyplot as plt
+import numpy as np
+import psutil
+import pytest
+
+from vulture.stripes_lib.render import StripesCollection, render_stripes
+
+
+def _to_pixels(fig):
+    buffer = BytesIO()
+    fig.savefig(buffer, format="png")
+    plt.close(fig)
+    buffer.seek(0)
+    return plt.imread(buffer)
+
+
+@pytest.mark.parametrize("n_stripes", [1, 2, 50, 100, 123, 187])
+def test_StripesCollection_matches_axvspan(n_stripes):
+    colours = plt.get_cmap("RdBu_r", 20)(np.random.default_rng(n_stripes).random(n_stripes))
+
+    fig, ax = plt.subplots(figsize=(10, 2))
+    for i, colour in enumerate(colours):
+        ax.axvspan(xmin=i - 0.5, xmax=i + 0.5, color=colour)
+    ax.axis("off")
+    expected = _to_pixels(fig)
+
+    fig, ax = plt.subplots(figsize=(10, 2))
+    StripesCollection.add_to(ax, colours)
+    ax.axis("off")
+
+    np.testing.assert_array_equal(_to_pixels(fig), expected)
+
+
+def _random_colours(n_stripes, seed=0):
+    return plt.get_cmap("RdBu_r", 20)(np.random.default_rng(seed).random(n_stripes))
+
+
+def test_render_stripes_in_threads():
+    colours = [_random_colours(120, seed) for seed in range(16)]
+    expected = [render_stripes(colour, BytesIO()).getvalue() for colour in colours]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda colour: render_stripes(colour, BytesIO()).getvalue(), colours))
+
+    assert results == expected
+    # No figures are left in pyplot's global state
+    assert plt.get_fignums() == []
+
+
+@pytest.mark.slow
+def test_render_stripes_memory_is_flat():
+    colours = _random_colours(120)
+    process = psutil.Process(os.getpid())
+
+    for _ in range(100):
+        render_stripes(colours, BytesIO())
+    rss_before = process.memory_info().rss
+
+    for _ in range(2000):
+        render_stripes(colours, BytesIO())
+    rss_after = process.memory_info().rss
+
+    assert rss_after - rss_before < 20 * 1024 * 1024
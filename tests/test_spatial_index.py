@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from vulture.exceptions import LocationOutOfRangeError
+from vulture.stripes_lib.spatial_index import SpatialIndex
+from vulture.stripes_lib.stripes import StripesMaker
+
+
+def _regular_grid():
+    return xr.Dataset(coords={"lat": np.arange(-89.75, 90, 0.5), "lon": np.arange(-179.75, 180, 0.5)})
+
+
+def test_SpatialIndex_nearest_regular_grid():
+    index = SpatialIndex.from_dataset(_regular_grid(), "lat", "lon")
+    match = index.nearest(51.57, -1.31)
+
+    assert match.index == {"lat": 283, "lon": 357}
+    assert (match.lat, match.lon) == (51.75, -1.25)
+    assert match.distance == pytest.approx(20.4, abs=0.1)
+
+
+def test_SpatialIndex_nearest_across_date_line():
+    index = SpatialIndex.from_dataset(_regular_grid(), "lat", "lon")
+    match = index.nearest(0.1, 179.99)
+
+    assert (match.lat, abs(match.lon)) == (0.25, 179.75)
+
+
+def test_SpatialIndex_query_many_2d_grid():
+    y, x = np.arange(50, 55, 0.1), np.arange(-5, 2, 0.1)
+    lons, lats = np.meshgrid(x, y)
+    ds = xr.Dataset(coords={"latitude": (("y", "x"), lats), "longitude": (("y", "x"), lons)})
+    index = SpatialIndex.from_dataset(ds, "latitude", "longitude")
+
+    match = index.query([50.01, 54.88], [-4.99, 1.79])
+
+    np.testing.assert_array_equal(match.index["y"], [0, 49])
+    np.testing.assert_array_equal(match.index["x"], [0, 68])
+    assert (match.distance < 10).all()
+
+
+def test_SpatialIndex_valid_cell_lookup():
+    index = SpatialIndex.from_dataset(_regular_grid(), "lat", "lon")
+    valid = np.zeros(index.shape, dtype=bool)
+    valid[283, 360:] = True
+    lookup = index.valid_cell_lookup(valid)
+
+    assert lookup.shape == index.shape
+    assert valid.ravel()[lookup].all()
+
+    # The nearest cell is invalid, so the nearest valid cell is used instead
+    match = index.nearest(51.57, -1.31, lookup=lookup)
+    assert match.index == {"lat": 283, "lon": 360}
+    assert (match.lat, match.lon) == (51.75, 0.25)
+    assert match.distance == pytest.approx(109.4, abs=0.1)
+
+
+def test_StripesMaker_check_location_is_near():
+    index = SpatialIndex.from_dataset(_regular_grid(), "lat", "lon")
+    stripes_maker = StripesMaker(spatial_threshold=0.5)
+
+    match = index.nearest(51.57, -1.31)
+    assert stripes_maker._check_location_is_near(51.57, -1.31, match) is match
+
+    stripes_maker.spatial_threshold = 0.05
+
+    with pytest.raises(LocationOutOfRangeError, match="outside the area covered by the data"):
+        stripes_maker._check_location_is_near(51.57, -1.31, match)
@@ -0,0 +1,120 @@
+import os
+import time
+
+import numpy as np
+
+from vulture.stripes_lib.cache import ArtifactCache, DiskCache, make_key
+
+
+def _data(n=100):
+    return {"years": np.arange(1901, 1901 + n), "values": np.linspace(8, 11, n)}
+
+
+def test_make_key_is_stable_and_unique():
+    assert make_key("cru_ts-4.08", 51.5, -1.3) == make_key("cru_ts-4.08", 51.5, -1.3)
+    assert make_key("cru_ts-4.08", 51.5, -1.3) != make_key("cru_ts-4.09", 51.5, -1.3)
+
+
+def test_DiskCache_put_and_get(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"))
+    key = make_key("test", 1)
+
+    assert cache.get(key) is None
+
+    cache.put(key, _data())
+    data = cache.get(key)
+
+    assert key in cache
+    np.testing.assert_array_equal(data["years"], _data()["years"])
+    np.testing.assert_array_equal(data["values"], _data()["values"])
+
+    # Check no temporary files are left behind
+    assert [f for f in os.listdir(cache.cache_dir) if not f.endswith(".npz")] == []
+
+
+def test_DiskCache_is_shared_between_instances(tmp_path):
+    key = make_key("test", 2)
+    DiskCache(str(tmp_path)).put(key, _data())
+
+    assert DiskCache(str(tmp_path)).get(key) is not None
+
+
+def test_DiskCache_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    keys = [make_key("test", i) for i in range(3)]
+
+    cache.put(keys[0], _data())
+    entry_size = os.path.getsize(cache._path(keys[0]))
+    cache.max_bytes = 2 * entry_size
+
+    cache.put(keys[1], _data())
+
+    # Make sure the first entry is the most recently used
+    os.utime(cache._path(keys[1]), (time.time() - 10, time.time() - 10))
+    cache.get(keys[0])
+
+    cache.put(keys[2], _data())
+
+    assert keys[0] in cache
+    assert keys[1] not in cache
+    assert keys[2] in cache
+
+
+def test_DiskCache_clear(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    cache.put(make_key("test", 3), _data())
+    cache.clear()
+
+    assert os.listdir(tmp_path) == []
+
+
+def _write_outputs(out_dir, content=b"stripes"):
+    outputs = {"png": str(out_dir / "stripes.png"), "pdf": str(out_dir / "stripes.pdf")}
+
+    for name, path in outputs.items():
+        with open(path, "wb") as writer:
+            writer.write(content + name.encode())
+
+    return outputs
+
+
+def test_ArtifactCache_store_and_fetch(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    key = make_key("test", 4)
+    (tmp_path / "job1").mkdir()
+    (tmp_path / "job2").mkdir()
+
+    outputs = _write_outputs(tmp_path / "job1")
+    assert not cache.fetch(key, outputs)
+
+    cache.store(key, outputs)
+    fetched = {"png": str(tmp_path / "job2" / "a.png"), "pdf": str(tmp_path / "job2" / "a.pdf")}
+
+    assert cache.fetch(key, fetched)
+    assert open(fetched["pdf"], "rb").read() == b"stripespdf"
+
+    # The files are linked, not copied, and no temporary files are left behind
+    assert os.stat(fetched["png"]).st_ino == os.stat(outputs["png"]).st_ino
+    assert sorted(os.listdir(tmp_path / "job2")) == ["a.pdf", "a.png"]
+    assert all(f.endswith(".artifact") for f in os.listdir(cache.cache_dir))
+
+    # All outputs must be cached for a hit
+    os.remove(cache._path(key, "pdf"))
+    assert not cache.fetch(key, fetched)
+
+
+def test_ArtifactCache_copies_if_links_fail(tmp_path, monkeypatch):
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    key = make_key("test", 5)
+    outputs = _write_outputs(tmp_path)
+
+    def _no_link(source, destination):
+        raise OSError("Invalid cross-device link")
+
+    monkeypatch.setattr(os, "link", _no_link)
+    cache.store(key, outputs)
+    fetched = {"png": str(tmp_path / "copy.png")}
+
+    assert cache.fetch(key, fetched)
+    assert open(fetched["png"], "rb").read() == b"stripespng"
+    assert os.stat(fetched["png"]).st_ino != os.stat(outputs["png"]).st_ino
@@ -1,11 +1,16 @@
 import os
+import sys
+import threading
 from collections import namedtuple
+from io import StringIO
+
+import pytest
 
 from netCDF4 import Dataset
 
 from .common import MINI_CEDA_CACHE_DIR
 
-from vulture.utils import resolve_conventions_version
+from vulture.utils import resolve_conventions_version, capture_stdout
 
 
 _i = namedtuple("_i", "data") 
@@ -51,6 +56,41 @@ def test_resolve_conventions_version_complex_string(tmp_path):
 
         _write_ds_with_conv(nc_file, conv) 
         res = resolve_conventions_version(inputs, nc_file)
-        assert res.tuple == (1, 5) 
+        assert res.tuple == (1, 5)
+
+
+def test_capture_stdout_per_thread():
+    original = sys.stdout
+    streams = [StringIO() for _ in range(4)]
+    barrier = threading.Barrier(len(streams))
+
+    def _print_lines(i):
+        with capture_stdout(streams[i]):
+            barrier.wait()
+            for line in range(100):
+                print(f"thread {i} line {line}")
+
+    threads = [threading.Thread(target=_print_lines, args=(i,)) for i in range(len(streams))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for i, stream in enumerate(streams):
+        assert stream.getvalue() == "".join(f"thread {i} line {line}\n" for line in range(100))
+
+    assert sys.stdout is original
+
+
+def test_capture_stdout_restores_on_error():
+    original = sys.stdout
+    stream = StringIO()
+
+    with pytest.raises(ValueError):
+        with capture_stdout(stream):
+            print("captured")
+            raise ValueError()
+
+    assert stream.getvalue() == "captured\n"
+    assert sys.stdout is original
 
-   
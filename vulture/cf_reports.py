@@ -0,0 +1,297 @@
+"""
+Runs the CF-Checker on a file (or on many files in parallel, see `check_files`), keeping the reports in an
+on-disk cache so that a file that has already been checked (against the same CF version, with the same
+CF-Checker and tables) is not checked again.
+"""
+import glob
+import hashlib
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from cfchecker import cfchecks
+
+from .cf_tables import CF_TABLES
+from .stripes_lib.cache import ArtifactCache, make_key
+from .utils import capture_stdout, get_conventions_version
+
+
+# Define some global constants for the cache of reports.
+# Both can be overridden with environment variables so that all workers of a deployment share the same cache.
+CF_REPORT_CACHE_DIR = os.environ.get("VULTURE_CF_REPORT_CACHE_DIR",
+                                     os.path.join(tempfile.gettempdir(), "vulture-cf-report-cache"))
+CF_REPORT_CACHE_MAX_BYTES = int(os.environ.get("VULTURE_CF_REPORT_CACHE_MAX_BYTES", 256 * 1024 ** 2))
+
+# Size (in bytes) of each chunk read when hashing the content of a file
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# The line of a report that names the file that was checked, and how far into the report to look for it
+REPORT_FILE_PREFIX = "CHECKING NetCDF FILE: "
+REPORT_HEADER_LINES = 10
+
+# Maximum number of parallel checking processes (batch mode)
+MAX_CHECK_WORKERS = min(4, os.cpu_count() or 1)
+# How the checking processes are started: not by forking, which would copy the threads of the server along with
+# any locks they hold (such as the one `CFTableCache` holds while it patches the CF-Checker)
+CHECK_MP_CONTEXT = "forkserver"
+
+# The messages counted in the summary of a batch report: {category printed by the checker: column name}
+MESSAGE_COUNTS = {"FATAL": "fatal", "ERROR": "errors", "WARN": "warnings", "INFO": "info"}
+# The columns of the summary table of a batch report: (name, title)
+SUMMARY_COLUMNS = [("file", "File"), ("cf_version", "CF version"), ("fatal", "Fatal"), ("errors", "Errors"),
+                   ("warnings", "Warnings"), ("info", "Info"), ("status", "Status")]
+
+# Define the cache of reports (shared on disk between workers)
+CF_REPORTS = ArtifactCache(CF_REPORT_CACHE_DIR, CF_REPORT_CACHE_MAX_BYTES)
+
+
+def hash_file(path, chunk_size=HASH_CHUNK_SIZE):
+    "Return the SHA-256 hex digest of the content of the file at `path` (read one chunk at a time)."
+    digest = hashlib.sha256()
+
+    with open(path, "rb") as reader:
+        for chunk in iter(lambda: reader.read(chunk_size), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def get_report_key(nc_path, version, by_content=False, tables=CF_TABLES):
+    """
+    Return the cache key of the report of checking `nc_path` against the CF `version`.
+
+    By default, the file is identified by its path, size and modification time, so that it does not
+    have to be read (use this for files in the archive). With `by_content`, it is identified by a hash
+    of its content (and its file name, which is also checked) instead: use this for downloaded and
+    uploaded files, which are at a different path for each job.
+
+    The key also includes the versions of the CF-Checker and of the tables it uses.
+    """
+    if by_content:
+        file_id = ["sha256", hash_file(nc_path), os.path.basename(nc_path)]
+    else:
+        stat = os.stat(nc_path)
+        file_id = ["path", os.path.abspath(nc_path), stat.st_size, stat.st_mtime_ns]
+
+    table_versions = {name: tables.get(name).version_number for name in tables.sources}
+    return make_key(file_id, str(version), cfchecks.__version__, table_versions)
+
+
+def _set_report_file(report_file, nc_path):
+    """
+    Make the report in `report_file` name `nc_path` as the file that was checked (a cached report may
+    come from checking the same content at another path). The report is only re-written if required.
+    """
+    header = f"{REPORT_FILE_PREFIX}{nc_path}\n"
+    tmp_path = f"{report_file}.{os.getpid()}.tmp"
+
+    with open(report_file) as reader:
+        lines = []
+
+        while len(lines) < REPORT_HEADER_LINES:
+            line = reader.readline()
+            lines.append(line)
+
+            if not line or line.startswith(REPORT_FILE_PREFIX):
+                break
+
+        if not lines[-1].startswith(REPORT_FILE_PREFIX) or lines[-1] == header:
+            return
+
+        # Write a new file (rather than changing the file in place, which may be linked to the cache)
+        lines[-1] = header
+        with open(tmp_path, "w") as writer:
+            writer.writelines(lines)
+            shutil.copyfileobj(reader, writer)
+
+    os.replace(tmp_path, report_file)
+
+
+def check_file(nc_path, output_file, version, by_content=False, cache=CF_REPORTS, tables=CF_TABLES):
+    """
+    Run the CF-Checker on `nc_path` (against the CF `version`), writing its report to `output_file`.
+    If the file has been checked before, the stored report is used instead (see `get_report_key` for how
+    files are identified, and the meaning of `by_content`).
+
+    Returns True if the report came from the cache, or False if the checker was run.
+    """
+    key = get_report_key(nc_path, version, by_content=by_content, tables=tables)
+
+    if cache.fetch(key, {"report": output_file}):
+        _set_report_file(output_file, nc_path)
+        return True
+
+    # Write the results (printed by the checker) straight to the output file.
+    # The tables are parsed once per worker (not for each check).
+    with open(output_file, "w") as fout, capture_stdout(fout):
+        checker = tables.create_checker(version=version)
+        checker.checker(nc_path)
+
+    cache.store(key, {"report": output_file})
+    return False
+
+
+def _iter_nc_files(pattern):
+    "Yield the paths of the files given by `pattern` (see `find_nc_files`), one at a time."
+    if os.path.isdir(pattern):
+        for root, dirs, names in os.walk(pattern):
+            dirs.sort()
+            yield from (os.path.join(root, name) for name in sorted(names) if name.endswith(".nc"))
+    elif os.path.isfile(pattern):
+        yield pattern
+    else:
+        yield from (path for path in glob.iglob(pattern, recursive=True)
+                    if path.endswith(".nc") and os.path.isfile(path))
+
+
+def find_nc_files(patterns, limit=None):
+    """
+    Return the paths of the files given by `patterns`, each of which is the path of a file, a directory
+    (all the ".nc" files in it and its sub-directories) or a glob pattern (e.g. "/badc/data/*.nc", or
+    "/badc/data/**/*.nc" to include sub-directories: only ".nc" files are included). Each file is listed
+    once, in the order given (and sorted, within a directory or pattern).
+
+    If `limit` is given, the search stops as soon as more than `limit` files have been found (so that
+    a pattern such as "/badc" does not walk the whole archive): at most `limit` + 1 paths are returned,
+    so callers can tell that there are too many.
+
+    Raises a ValueError if no files are found for one of the patterns.
+    """
+    paths = {}
+
+    for pattern in patterns:
+        found = []
+        matched = False
+
+        for path in _iter_nc_files(pattern):
+            matched = True
+            if path not in paths:
+                found.append(path)
+
+            if limit is not None and len(paths) + len(found) > limit:
+                break
+
+        if not matched:
+            raise ValueError(f"No NetCDF files found at: {pattern}")
+
+        paths.update(dict.fromkeys(sorted(found)))
+
+        if limit is not None and len(paths) > limit:
+            break
+
+    return list(paths)
+
+
+def _count_messages(report_file):
+    "Return the number of messages of each category (see `MESSAGE_COUNTS`) in a report."
+    counts = dict.fromkeys(MESSAGE_COUNTS.values(), 0)
+    pattern = re.compile(r"({}): ".format("|".join(MESSAGE_COUNTS)))
+
+    with open(report_file) as reader:
+        for line in reader:
+            match = pattern.match(line)
+            if match:
+                counts[MESSAGE_COUNTS[match.group(1)]] += 1
+
+    return counts
+
+
+def _init_worker(table_sources, cache_dir, max_bytes):
+    "Sets up a worker process of `check_files` to use the same tables and cache of reports as the caller."
+    CF_TABLES.sources = dict(table_sources)
+    CF_REPORTS.cache_dir, CF_REPORTS.max_bytes = cache_dir, max_bytes
+
+
+def _check_one(job):
+    """
+    Checks one file of `check_files` (in a worker process), writing its report to `job["report_file"]`.
+    Returns a row of the summary table (see `SUMMARY_COLUMNS`).
+    """
+    row = {"file": job["path"]}
+
+    try:
+        version = get_conventions_version(job["path"], job["version"])
+        row["cf_version"] = str(version)
+
+        check_file(job["path"], job["report_file"], version)
+
+        row.update(_count_messages(job["report_file"]))
+        row["status"] = "FAIL" if row["fatal"] or row["errors"] else "PASS"
+
+    except cfchecks.FatalCheckerError:
+        # The checker stops at the first fatal error, which is in the report
+        row.update(_count_messages(job["report_file"]))
+        row["status"] = "FAIL"
+
+    except Exception as exc:
+        row["status"] = f"Could not run the CF-Checker: {str(exc) or type(exc).__name__}"
+
+    return row
+
+
+def _write_summary(rows, writer):
+    "Write the summary table of a batch report (one row per file, see `SUMMARY_COLUMNS`) to `writer`."
+    table = [[title for _, title in SUMMARY_COLUMNS]]
+    table.extend([str(row.get(name, "")) for name, _ in SUMMARY_COLUMNS] for row in rows)
+    widths = [max(len(line[i]) for line in table) for i in range(len(SUMMARY_COLUMNS))]
+
+    writer.write("SUMMARY\n=======\n")
+
+    for line in table:
+        writer.write("  ".join(cell.ljust(width) for cell, width in zip(line, widths)).rstrip() + "\n")
+
+    n_passed = sum(row["status"] == "PASS" for row in rows)
+    writer.write(f"\n{n_passed} of {len(rows)} files passed the CF checks.\n")
+
+
+def check_files(nc_paths, writer, version="auto", work_dir=None, max_workers=MAX_CHECK_WORKERS, callback=None):
+    """
+    Run the CF-Checker on each of `nc_paths` (against the CF `version`, or the version each file declares
+    if "auto"), in a pool of `max_workers` processes. Files that have been checked before are not checked
+    again (see `check_file`).
+
+    The report of each file is written to `writer` (a text file-like object) as soon as it and the files
+    before it have been checked, followed by a summary table with the number of messages of each category
+    for each file. The reports are written to a temporary directory in `work_dir` first.
+    If provided, `callback(n_done, n_total, row)` is called each time a file has been checked.
+
+    Returns the rows of the summary table (one dictionary per file, see `SUMMARY_COLUMNS`).
+    """
+    writer.write(f"CF-CHECKER REPORT FOR {len(nc_paths)} FILES\n\n")
+    rows = [None] * len(nc_paths)
+    n_written = 0
+
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp_dir, \
+            ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(CHECK_MP_CONTEXT),
+                                initializer=_init_worker,
+                                initargs=(CF_TABLES.sources, CF_REPORTS.cache_dir, CF_REPORTS.max_bytes)) as executor:
+        jobs = [{"path": path, "version": version, "report_file": os.path.join(tmp_dir, f"{i}.txt")}
+                for i, path in enumerate(nc_paths)]
+        futures = {executor.submit(_check_one, job): i for i, job in enumerate(jobs)}
+
+        for n_done, future in enumerate(as_completed(futures), 1):
+            rows[futures[future]] = future.result()
+
+            # Write the reports that are ready, in the order of the files
+            while n_written < len(rows) and rows[n_written] is not None:
+                report_file = jobs[n_written]["report_file"]
+                writer.write(f"[{n_written + 1}/{len(rows)}] {rows[n_written]['status']}: "
+                             f"{rows[n_written]['file']}\n")
+
+                if os.path.isfile(report_file):
+                    with open(report_file) as reader:
+                        shutil.copyfileobj(reader, writer)
+                    os.remove(report_file)
+
+                writer.write("\n")
+                writer.flush()
+                n_written += 1
+
+            if callback:
+                callback(n_done, len(rows), rows[futures[future]])
+
+    _write_summary(rows, writer)
+    return rows
@@ -0,0 +1,213 @@
+"""
+Process-wide cache of the CF standard name, area type and region name tables used by the CF-Checker.
+
+The CF-Checker downloads and parses the (large) XML tables again for every file it checks. Instead,
+each table is parsed once per process and shared by all checks: create the checkers with
+`CFTableCache.create_checker`.
+"""
+import io
+import os
+import threading
+import time
+from urllib.parse import urlparse
+from xml.sax import make_parser
+from xml.sax.handler import feature_namespaces
+
+from cfchecker import cfchecks
+
+from .downloads import DOWNLOAD_TIMEOUT, get_session
+
+
+# Where the tables are read from: a URL or a local file (local copies avoid downloading the tables)
+TABLE_SOURCES = {
+    "standard_names": os.environ.get("VULTURE_CF_STANDARD_NAMES", cfchecks.STANDARDNAME),
+    "area_types": os.environ.get("VULTURE_CF_AREA_TYPES", cfchecks.AREATYPES),
+    "region_names": os.environ.get("VULTURE_CF_REGION_NAMES", cfchecks.REGIONNAMES),
+}
+# Time (in seconds) after which tables read from a URL are downloaded and parsed again
+# (tables read from local files are parsed again as soon as the file changes)
+TABLE_URL_TTL = int(os.environ.get("VULTURE_CF_TABLES_TTL", 24 * 60 * 60))
+
+# The CF-Checker classes that parse each table, and the shelve file name it gives each table
+# (used to tell the area type and region name tables apart)
+_TABLE_HANDLERS = {
+    "standard_names": cfchecks.ConstructDict,
+    "area_types": cfchecks.ConstructList,
+    "region_names": cfchecks.ConstructList,
+}
+_SHELVE_FILES = {None: "standard_names", "cfarea_cache": "area_types", "cfregion_cache": "region_names"}
+
+# The `CFTableCache` used by the checks running in each thread (see `CachedCFChecker`)
+_local = threading.local()
+_install_lock = threading.Lock()
+
+
+class CFTableCache:
+    """
+    A process-wide, thread-safe cache of the parsed CF tables.
+
+    Each table is parsed on first use (or up front, with `warm`), then shared by all checks: the
+    CF-Checker only reads from them. A table is parsed again if its file has changed (for local files),
+    or once it is older than `url_ttl` seconds (for URLs). The tables are not reset in child processes,
+    so tables parsed before forking are shared with the workers.
+
+    Use as follows:
+    >>> tables = CFTableCache()
+    >>> checker = tables.create_checker(version=cfchecks.CFVersion("CF-1.8"))
+    >>> checker.checker("/path/to/file.nc")
+    """
+
+    def __init__(self, sources=None, url_ttl=TABLE_URL_TTL):
+        self.sources = dict(TABLE_SOURCES if sources is None else sources)
+        self.url_ttl = url_ttl
+        self._lock = threading.Lock()
+        self._tables = {}
+
+    @staticmethod
+    def _get_stamp(source):
+        "Return the modification time and size of a local table file, or None for a URL."
+        if os.path.isfile(source):
+            stat = os.stat(source)
+            return stat.st_mtime_ns, stat.st_size
+
+        return None
+
+    def _parse(self, name):
+        handler = _TABLE_HANDLERS[name]()
+        parser = make_parser()
+        parser.setFeature(feature_namespaces, 0)
+        parser.setContentHandler(handler)
+        source = self.sources[name]
+
+        if urlparse(source).scheme in ("http", "https"):
+            # Download the table first, so that a server that does not respond cannot hang the worker
+            response = get_session().get(source, timeout=DOWNLOAD_TIMEOUT)
+            response.raise_for_status()
+            source = io.BytesIO(response.content)
+
+        parser.parse(source)
+
+        # Tell the CF-Checker that the table does not need parsing
+        handler.current = True
+        return handler
+
+    def get(self, name):
+        """
+        Return the parsed table `name` (one of the keys of `TABLE_SOURCES`), as a `cfchecks.ConstructDict`
+        (for the standard names) or `cfchecks.ConstructList`.
+        """
+        stamp = self._get_stamp(self.sources[name])
+
+        with self._lock:
+            entry = self._tables.get(name)
+
+            if entry is not None:
+                entry_stamp, parsed_at, table = entry
+
+                if stamp is not None and entry_stamp == stamp:
+                    return table
+
+                if stamp is None and time.time() - parsed_at < self.url_ttl:
+                    return table
+
+            print(f"Parsing CF table: {self.sources[name]}")
+            table = self._parse(name)
+            self._tables[name] = (stamp, time.time(), table)
+
+        return table
+
+    def warm(self):
+        """
+        Parse all the tables, so that the first check does not have to.
+        Tables that cannot be read are skipped. Returns a list of the names of the tables that were parsed.
+        """
+        parsed = []
+
+        for name in self.sources:
+            try:
+                self.get(name)
+                parsed.append(name)
+            except Exception as exc:
+                print(f"Could not parse CF table: {self.sources[name]}: {exc}")
+
+        return parsed
+
+    def clear(self):
+        "Remove all parsed tables from the cache."
+        with self._lock:
+            self._tables = {}
+
+    def create_checker(self, **kwargs):
+        """
+        Return a `CachedCFChecker` that uses the tables from this cache.
+        Takes the same keyword arguments as `cfchecks.CFChecker` (apart from the table locations).
+        """
+        return CachedCFChecker(self, **kwargs)
+
+
+class CachedCFChecker(cfchecks.CFChecker):
+    """
+    A `cfchecks.CFChecker` that takes the parsed tables from a `CFTableCache` instead of parsing them
+    for each file it checks.
+    """
+
+    def __init__(self, tables, **kwargs):
+        kwargs.update(cfStandardNamesXML=tables.sources["standard_names"],
+                      cfAreaTypesXML=tables.sources["area_types"],
+                      cfRegionNamesXML=tables.sources["region_names"],
+                      cacheTables=False)
+        super().__init__(**kwargs)
+        self.tables = tables
+
+    def checker(self, file):
+        _install_table_factories()
+
+        previous = getattr(_local, "tables", None)
+        _local.tables = self.tables
+        self.f = None
+
+        try:
+            return super().checker(file)
+        except OSError as exc:
+            if self.f is not None:
+                raise
+
+            # Recent versions of netCDF4 raise an OSError (rather than the RuntimeError the CF-Checker
+            # expects) for files they cannot open: report it as the fatal error it should be
+            self._fatal(f"{exc.strerror or exc}: {file}")
+        finally:
+            _local.tables = previous
+
+
+def _table_factory(handler_class):
+    """
+    Return a replacement for `handler_class` (`cfchecks.ConstructDict` or `cfchecks.ConstructList`) that
+    returns the cached table in threads running a `CachedCFChecker`, and a new instance otherwise.
+    """
+    def _create(useShelve=False, shelveFile=None, **kwargs):
+        tables = getattr(_local, "tables", None)
+
+        if tables is None or useShelve:
+            return handler_class(useShelve=useShelve, shelveFile=shelveFile, **kwargs)
+
+        return tables.get(_SHELVE_FILES[shelveFile])
+
+    _create.handler_class = handler_class
+    return _create
+
+
+def _install_table_factories():
+    """
+    Make the CF-Checker create its tables through `_table_factory`. It looks the classes up in the
+    `cfchecks` module each time it checks a file, so they are replaced there (once per process).
+    """
+    with _install_lock:
+        for name in ("ConstructDict", "ConstructList"):
+            handler_class = getattr(cfchecks, name)
+
+            if not hasattr(handler_class, "handler_class"):
+                setattr(cfchecks, name, _table_factory(handler_class))
+
+
+# Define the cache of parsed tables (shared between threads of a worker)
+CF_TABLES = CFTableCache()
@@ -6,12 +6,20 @@
 ###########################################################
 
 import os
+import re
+import sys
+import tempfile
 import psutil
 import click
 from jinja2 import Environment, PackageLoader
 from pywps import configuration
 
 from . import wsgi
+from .stripes_lib.stripes import (NETCDF_PATH, ANNUAL_NETCDF_PATH, REFERENCE_PERIODS, StripesRenderer,
+                                  benchmark_pdf_backends)
+from .stripes_lib.precompute import write_annual_means, write_climatologies, DEFAULT_CHUNK_SIZE
+from .cf_reports import MAX_CHECK_WORKERS, find_nc_files, check_files
+from .utils import capture_stdout
 from urllib.parse import urlparse
 
 PID_FILE = os.path.abspath(os.path.join(os.path.curdir, "pywps.pid"))
@@ -80,6 +88,8 @@ def _run(application, bind_host=None, daemon=False):
     bind_host = bind_host or host
     # need to serve the wps outputs
     static_files = {"/outputs": configuration.get_config_value("server", "outputpath")}
+    # warm up in the process that serves the requests (i.e. after forking, in daemon mode)
+    wsgi.warm_worker()
     run_simple(
         hostname=bind_host,
         port=port,
@@ -237,3 +247,120 @@ def start(
     else:
         # no daemon
         _run(app, bind_host=bind_host)
+
+
+@cli.group()
+def precompute():
+    """Pre-compute derived datasets used by the climate stripes processes."""
+    pass
+
+
+@precompute.command("cru-annual")
+@click.option(
+    "--netcdf-path", metavar="PATH", default=NETCDF_PATH, show_default=True,
+    help="path to the monthly CRU TS temperature file.",
+)
+@click.option(
+    "--output-path", metavar="PATH", default=ANNUAL_NETCDF_PATH, show_default=True,
+    help="path of the annual-mean file to write.",
+)
+@click.option(
+    "--chunk-size", metavar="INT", default=DEFAULT_CHUNK_SIZE[0], show_default=True, type=int,
+    help="number of latitude and longitude points in each (full time series) chunk of the output.",
+)
+def cru_annual(netcdf_path, output_path, chunk_size):
+    """Write annual means of the CRU TS data, chunked for point access.
+    Global climate stripes read from this file when it exists.
+    """
+    write_annual_means(netcdf_path, output_path, chunk_size=(chunk_size, chunk_size))
+    click.echo("Written annual means to: {}".format(output_path))
+
+
+@precompute.command("climatology")
+@click.option(
+    "--dataset", type=click.Choice(["uk", "global"]), default="global", show_default=True,
+    help="the dataset to calculate the climatologies for: UK (HadUK-Grid) or global (CRU TS).",
+)
+@click.option(
+    "--output-path", metavar="PATH", default=None,
+    help="path of the climatology file to write (defaults to the path the stripes processes read from).",
+)
+@click.option(
+    "--period", "periods", metavar="START-END", multiple=True,
+    help="reference period to calculate (can be repeated). Defaults to: {}.".format(
+        ", ".join("{}-{}".format(*period) for period in REFERENCE_PERIODS)),
+)
+def climatology(dataset, output_path, periods):
+    """Write the mean temperature over each reference period, for every grid cell.
+    The climate stripes processes look up the reference mean in this file when it exists.
+    """
+    if not all(re.fullmatch(r"\d{4}-\d{4}", period) for period in periods):
+        raise click.BadParameter("periods must be given as START-END, e.g. 1961-1990", param_hint="--period")
+
+    periods = [tuple(int(year) for year in period.split("-")) for period in periods] or REFERENCE_PERIODS
+
+    output_path = write_climatologies(global_mode=(dataset == "global"), output_path=output_path, periods=periods)
+    click.echo("Written climatologies to: {}".format(output_path))
+
+
+@cli.command("benchmark-pdf")
+@click.option(
+    "--dataset", type=click.Choice(["uk", "global"]), default="uk", show_default=True,
+    help="the dataset to make the stripes from: UK (HadUK-Grid) or global (CRU TS).",
+)
+@click.option(
+    "--latitude", metavar="FLOAT", default=51.57, show_default=True, type=float,
+    help="latitude of the stripes.",
+)
+@click.option(
+    "--longitude", metavar="FLOAT", default=-1.31, show_default=True, type=float,
+    help="longitude of the stripes.",
+)
+@click.option(
+    "--repeats", metavar="INT", default=3, show_default=True, type=int,
+    help="number of times to write each PDF.",
+)
+def benchmark_pdf(dataset, latitude, longitude, repeats):
+    """Compare the time and memory taken to write the climate stripes PDF with each PDF backend."""
+    stripes_renderer = StripesRenderer(global_mode=(dataset == "global"))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        stripes_renderer.create(latitude, longitude, output_file=os.path.join(tmp_dir, "stripes.png"))
+        results = benchmark_pdf_backends(stripes_renderer, repeats=repeats, project_name="Benchmark")
+
+    for backend, result in results.items():
+        click.echo("{}: {seconds:.3f} s, peak memory {peak_memory_mib:.1f} MiB, {size_bytes} bytes".format(
+            backend, **result))
+
+
+@cli.command("cf-check")
+@click.argument("paths", nargs=-1, required=True)
+@click.option(
+    "--cf-version", metavar="VERSION", default="auto", show_default=True,
+    help="version of the CF Conventions to check against, e.g. 1.8 (auto: the version each file declares).",
+)
+@click.option(
+    "--output-path", metavar="PATH", default="-", show_default=True,
+    help="path of the combined report to write (- for the standard output).",
+)
+@click.option("--workers", metavar="INT", default=MAX_CHECK_WORKERS, show_default=True, type=int,
+              help="number of files checked in parallel.")
+def cf_check(paths, cf_version, output_path, workers):
+    """Run the CF-Checker on many NetCDF files in parallel, and write one combined report.
+    Each of PATHS can be a file, a directory (all the .nc files in it and its sub-directories)
+    or a (quoted) glob pattern. Exits with status 1 if any file fails the checks.
+    """
+    try:
+        nc_paths = find_nc_files(paths)
+    except ValueError as exc:
+        raise click.BadParameter(str(exc), param_hint="PATHS")
+
+    def _echo_progress(n_done, n_total, row):
+        click.echo("[{}/{}] {}: {}".format(n_done, n_total, row["status"], row["file"]), err=True)
+
+    # Only the report is written to the output (anything else printed goes to the standard error)
+    with click.open_file(output_path, "w") as writer, capture_stdout(sys.stderr):
+        rows = check_files(nc_paths, writer, version=cf_version, max_workers=workers, callback=_echo_progress)
+
+    if any(row["status"] != "PASS" for row in rows):
+        sys.exit(1)
@@ -0,0 +1,143 @@
+"""
+Streaming downloads of (possibly large) input files over HTTP.
+"""
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .exceptions import DownloadError
+
+
+# Size (in bytes) of each chunk read from the connection and written to the file
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# Timeouts (in seconds) for connecting to the server, and for waiting for data once connected
+DOWNLOAD_TIMEOUT = (float(os.environ.get("VULTURE_DOWNLOAD_CONNECT_TIMEOUT", 10)),
+                    float(os.environ.get("VULTURE_DOWNLOAD_READ_TIMEOUT", 60)))
+# Number of times a failed download is resumed (from where it stopped), and the wait before the first retry
+DOWNLOAD_RETRIES = 3
+DOWNLOAD_RETRY_WAIT = 1.0
+# Number of connections kept open to each server
+DOWNLOAD_POOL_SIZE = 10
+
+# Server errors (HTTP status codes) after which a download is retried
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+
+class _RetryableError(Exception):
+    pass
+
+
+# Errors after which a download is retried (any other error is raised straight away)
+_RETRY_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                 _RetryableError)
+
+_session_lock = threading.Lock()
+_session = None
+_session_pid = None
+
+
+def get_session():
+    """
+    Return the `requests.Session` shared by all downloads in this process, so that connections
+    are pooled and reused. A child process creates its own session.
+    """
+    global _session, _session_pid
+
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=DOWNLOAD_POOL_SIZE, pool_maxsize=DOWNLOAD_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session, _session_pid = session, os.getpid()
+
+        return _session
+
+
+def _get_total_size(response, offset):
+    """
+    Return the full size of the file being downloaded (from the Content-Range or Content-Length
+    header of `response`, which starts at byte `offset`), or None if the server did not say.
+    """
+    content_range = response.headers.get("Content-Range", "")
+
+    if "/" in content_range and not content_range.endswith("/*"):
+        return int(content_range.rsplit("/", 1)[1])
+
+    if "Content-Length" in response.headers:
+        return offset + int(response.headers["Content-Length"])
+
+    return None
+
+
+def download_file(url, path, max_bytes=None, callback=None, session=None, chunk_size=DOWNLOAD_CHUNK_SIZE,
+                  timeout=DOWNLOAD_TIMEOUT, retries=DOWNLOAD_RETRIES, retry_wait=DOWNLOAD_RETRY_WAIT):
+    """
+    Download `url` to `path`, one chunk at a time, so that only `chunk_size` bytes are held in memory.
+
+    If the connection fails (or the server returns one of `RETRY_STATUS_CODES`), the download is retried
+    up to `retries` times (waiting `retry_wait` seconds, then twice as long each time), asking the server
+    for the rest of the file only (with a "Range" header). If the server does not support that, the file
+    is downloaded again from the start.
+
+    If provided, `callback(n_bytes, total_bytes)` is called after each chunk (`total_bytes` is None if the
+    server did not give the size of the file).
+
+    Raises a `DownloadError` if the file is larger than `max_bytes` (checked before downloading, if the
+    server gives the size, and while downloading), if the server returns an error, or if the download
+    still fails after all the retries. Returns `path`.
+    """
+    session = session or get_session()
+    n_bytes, total = 0, None
+    attempt = 0
+
+    with open(path, "wb") as writer:
+        while True:
+            headers = {"Range": f"bytes={n_bytes}-"} if n_bytes else {}
+
+            try:
+                with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                    if response.status_code in RETRY_STATUS_CODES:
+                        raise _RetryableError(f"the server returned {response.status_code} {response.reason}")
+
+                    if response.status_code >= 400:
+                        raise DownloadError(f"Could not download {url}: the server returned "
+                                            f"{response.status_code} {response.reason}.")
+
+                    if n_bytes and response.status_code != 206:
+                        # The server sent the whole file, so start again
+                        writer.seek(0)
+                        writer.truncate()
+                        n_bytes = 0
+
+                    total = _get_total_size(response, n_bytes)
+
+                    if max_bytes is not None and total is not None and total > max_bytes:
+                        raise DownloadError(f"The file at {url} is too large: {total} bytes. "
+                                            f"The maximum is {max_bytes} bytes.")
+
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        writer.write(chunk)
+                        n_bytes += len(chunk)
+
+                        if max_bytes is not None and n_bytes > max_bytes:
+                            raise DownloadError(f"The file at {url} is too large. "
+                                                f"The maximum is {max_bytes} bytes.")
+
+                        if callback:
+                            callback(n_bytes, total)
+
+                if total is not None and n_bytes < total:
+                    raise _RetryableError(f"the connection closed after {n_bytes} of {total} bytes")
+
+                return path
+
+            except _RETRY_ERRORS as exc:
+                if attempt >= retries:
+                    raise DownloadError(f"Could not download {url}: {exc}")
+
+                time.sleep(retry_wait * 2 ** attempt)
+                attempt += 1
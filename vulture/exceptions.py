@@ -1,2 +1,10 @@
 class WorkflowValidationError(Exception):
     pass
+
+
+class LocationOutOfRangeError(Exception):
+    pass
+
+
+class DownloadError(Exception):
+    pass
@@ -1,9 +1,13 @@
 from .wps_cf_check import CFCheck
+from .wps_cf_check_batch import CFCheckBatch
 from .wps_plot_climate_stripes import PlotClimateStripes
 from .wps_plot_climate_stripes_global import PlotClimateStripesGlobal
+from .wps_plot_climate_stripes_batch import PlotClimateStripesBatch
 
 processes = [
     CFCheck(),
+    CFCheckBatch(),
     PlotClimateStripes(),
     PlotClimateStripesGlobal(),
+    PlotClimateStripesBatch(),
 ]
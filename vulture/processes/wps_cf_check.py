@@ -1,8 +1,4 @@
-import requests
 import os
-import sys
-
-from cfchecker import cfchecks
 
 from pywps import LiteralInput, Process, FORMATS, Format, ComplexOutput
 from pywps.app.Common import Metadata
@@ -10,11 +6,18 @@ from pywps.app.exceptions import ProcessError
 from pywps import configuration
 
 from ..utils import get_input, resolve_conventions_version
+from ..cf_reports import check_file
+from ..downloads import download_file
+from ..exceptions import DownloadError
 
 import logging
 LOGGER = logging.getLogger("PYWPS")
 
 
+# Percentage of the job status used up by downloading the input file (if a URL is provided)
+DOWNLOAD_STATUS_PERCENT = 20
+
+
 class CFCheck(Process):
     def __init__(self):
         inputs = [
@@ -82,19 +85,29 @@ class CFCheck(Process):
             status_supported=True
         )
 
-    def _download_file(self, url):
-        response = requests.get(url)
-        downloaded_file = response.content
-
+    def _download_file(self, url, response=None):
+        """
+        Download the file at `url` to the working directory (streaming it to disk, see `download_file`),
+        reporting progress through `response` (if provided). Returns the path to the file.
+        """
         fpath = os.path.join(self.workdir, 'testfile.nc')
+        max_size = configuration.get_size_mb(configuration.get_config_value("server", "maxsingleinputsize"))
+        progress = {"percent": -1}
 
-        if response.status_code == 200:
-            with open(fpath, 'wb') as f:
-                f.write(response.content)
-        else:
-            raise ProcessError('Unable to download data file provided as input.')
+        def _update_status(n_bytes, total):
+            # Only update the status when the percentage changes
+            percent = int(100 * n_bytes / total) if total else 0
+
+            if response and percent != progress["percent"]:
+                progress["percent"] = percent
+                response.update_status(f'Downloaded {n_bytes / 1024 ** 2:.1f} MB of the input file',
+                                       int(percent * DOWNLOAD_STATUS_PERCENT / 100))
 
-        return fpath
+        try:
+            return download_file(url, fpath, max_bytes=int(max_size * 1024 ** 2), callback=_update_status)
+        except DownloadError as exc:
+            LOGGER.error(str(exc))
+            raise ProcessError(f'Unable to download data file provided as input. {exc}')
 
     def _map_url_to_path(self, url):
         """
@@ -112,7 +125,7 @@ class CFCheck(Process):
 
         return os.path.join(cache_dir, url.split(cache_dir)[-1].lstrip('/'))
 
-    def _get_nc_path(self, inputs):
+    def _get_nc_path(self, inputs, response=None):
         """
         Parse the inputs to decide which file to check, return the local path to it.
         """
@@ -123,7 +136,7 @@ class CFCheck(Process):
 
         if nc_url:
             # Use downloaded file
-            nc_path = self._download_file(nc_url)
+            nc_path = self._download_file(nc_url, response)
 
         elif nc_file_upload:
             nc_path = self._map_url_to_path(nc_file_upload)
@@ -145,7 +158,9 @@ class CFCheck(Process):
 
         # Determine the NetCDF file to check
         try:
-            nc_path = self._get_nc_path(request.inputs)
+            nc_path = self._get_nc_path(request.inputs, response)
+        except ProcessError:
+            raise
         except Exception:
             raise ProcessError(("User must provide one input from: NetCDFFileURL, "
                                 "NetCDFFileUpload or NetCDFFilePath."))
@@ -159,32 +174,16 @@ class CFCheck(Process):
         # Set output file
         output_file = os.path.join(self.workdir, 'cfchecker_output.txt')
 
-        # Redirect standard output so we can capture it
-        class Stdout(object):
-            def __init__(self):
-                self.data = ""
-            def write(self, data):
-                self.data += data
-
-        tmp_stdout = sys.stdout
-        sys.stdout = Stdout()
+        # Downloaded and uploaded files are identified by their content (their path is different for each job)
+        by_content = bool(get_input(request.inputs, "NetCDFFileURL") or get_input(request.inputs, "NetCDFFileUpload"))
 
         try:
-            checker = cfchecks.CFChecker(cfStandardNamesXML=cfchecks.STANDARDNAME,
-                                         cfAreaTypesXML=cfchecks.AREATYPES,
-                                         version=conventions_version)
-            rc = checker.checker(nc_path)
+            cached = check_file(nc_path, output_file, conventions_version, by_content=by_content)
         except Exception:
-            raise ProcessError('Could not run CF-Checker on input file') 
-
-        output = sys.stdout.data
-
-        # Put standard output back in the right place
-        sys.stdout = tmp_stdout
+            raise ProcessError('Could not run CF-Checker on input file')
 
-        # Write the results to the output file
-        with open(output_file, "w") as fout:
-            fout.write(output)
+        if cached:
+            LOGGER.info(f'Using the stored report of a previous check of: {nc_path}')
 
         response.update_status('CF-Checks completed', 90)
 
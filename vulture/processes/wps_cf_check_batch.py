@@ -0,0 +1,119 @@
+import os
+
+from pywps import LiteralInput, Process, FORMATS, ComplexOutput
+from pywps.app.Common import Metadata
+from pywps.app.exceptions import ProcessError
+
+from ..utils import get_input
+from ..cf_reports import find_nc_files, check_files
+
+import logging
+LOGGER = logging.getLogger("PYWPS")
+
+
+MAX_PATHS = 100
+MAX_FILES = 1000
+
+
+class CFCheckBatch(Process):
+    def __init__(self):
+        inputs = [
+            LiteralInput(
+                "CFVersion",
+                "CF Version",
+                abstract=("Version of the CF Conventions that the NetCDF files should be checked against. "
+                          "E.g.: auto, 1.6, 1.7, 1.8. With auto, each file is checked against the version "
+                          "it declares."),
+                allowed_values=["auto", "1.0", "1.1", "1.2", "1.3", "1.4", "1.5", "1.6", "1.7", "1.8"],
+                data_type="string",
+                default="auto",
+                min_occurs=1,
+                max_occurs=1
+            ),
+            LiteralInput(
+                "NetCDFFilePaths",
+                "NetCDF File Paths",
+                abstract=("Paths to the NetCDF files in the CEDA Archive. Each one can be a file, a directory "
+                          "(all the .nc files in it and its sub-directories are checked) or a glob pattern, "
+                          f"e.g.: /badc/project/data/*.nc. The maximum number of files is {MAX_FILES}."),
+                data_type="string",
+                min_occurs=1,
+                max_occurs=MAX_PATHS
+            ),
+        ]
+
+        outputs = [
+            ComplexOutput('output', 'Output',
+                          abstract=('Outputs from the CF-Checker for each file, followed by a summary table '
+                                    'of the number of messages of each kind for each file'),
+                          as_reference=True,
+                          supported_formats=[FORMATS.TEXT])]
+
+        super(CFCheckBatch, self).__init__(
+            self._handler,
+            identifier="CFCheckBatch",
+            title="CF-Checker for Many Files",
+            abstract="Run the CF-Checker on many NetCDF files in the CEDA Archive, such as a whole delivery.",
+            keywords=['check', 'cf', 'conventions', 'climate', 'forecasts', 'checking', 'standards',
+                      'ocean', 'atmosphere', 'batch'],
+            metadata=[
+                Metadata('CEDA WPS UI', 'https://ceda-wps-ui.ceda.ac.uk'),
+                Metadata('CEDA WPS', 'https://ceda-wps.ceda.ac.uk'),
+                Metadata('CF-Checker source', 'https://github.com/cedadev/cf-checker'),
+                Metadata('CF Conventions', 'https://cfconventions.org/'),
+                Metadata('Disclaimer', 'https://help.ceda.ac.uk/article/4642-disclaimer')
+            ],
+            version='1.0.0',
+            inputs=inputs,
+            outputs=outputs,
+            store_supported=True,
+            status_supported=True
+        )
+
+    def _get_nc_paths(self, inputs):
+        """
+        Return the paths of all the files given by the "NetCDFFilePaths" inputs.
+        """
+        patterns = [nc_input.data for nc_input in inputs["NetCDFFilePaths"]]
+
+        try:
+            nc_paths = find_nc_files(patterns, limit=MAX_FILES)
+        except ValueError as exc:
+            LOGGER.error(str(exc))
+            raise ProcessError('No NetCDF files were found at one or more of the paths provided.')
+
+        if len(nc_paths) > MAX_FILES:
+            raise ProcessError(f'Too many files: the maximum is {MAX_FILES}.')
+
+        return nc_paths
+
+    def _handler(self, request, response):
+        """
+        Runs the CF-Checker on many NetCDF files.
+        """
+        response.update_status('Job is now running', 0)
+
+        nc_paths = self._get_nc_paths(request.inputs)
+        LOGGER.info(f"Number of NetCDF files to check: {len(nc_paths)}")
+
+        def _update_status(n_done, n_total, row):
+            response.update_status(f'Checked {n_done} of {n_total} files', 10 + int(80 * n_done / n_total))
+
+        # Set output file
+        output_file = os.path.join(self.workdir, 'cfchecker_output.txt')
+
+        response.update_status(f'Checking {len(nc_paths)} files', 10)
+
+        with open(output_file, "w") as writer:
+            rows = check_files(nc_paths, writer, version=get_input(request.inputs, "CFVersion", "auto"),
+                               work_dir=self.workdir, callback=_update_status)
+
+        n_passed = sum(row["status"] == "PASS" for row in rows)
+        response.update_status(f'CF-Checks completed: {n_passed} of {len(rows)} files passed', 90)
+
+        LOGGER.info(f'Written output file: {output_file}')
+
+        response.outputs['output'].file = output_file
+
+        LOGGER.info("Completed job!!!")
+        return response
@@ -4,6 +4,7 @@ from collections import namedtuple
 
 from pywps import (
     BoundingBoxInput,
+    ComplexInput,
     LiteralInput,
     Process,
     FORMATS,
@@ -15,8 +16,9 @@ from pywps.inout.formats import _FORMATS
 from pywps.app.Common import Metadata
 from pywps.app.exceptions import ProcessError
 
-from vulture.utils import get_input
-from vulture.stripes_lib.stripes import StripesRenderer
+from vulture.utils import get_input, get_region, get_reference_period, get_requested_outputs, get_output_format
+from vulture.exceptions import LocationOutOfRangeError
+from vulture.stripes_lib.stripes import StripesRenderer, REFERENCE_PERIODS, DEFAULT_REFERENCE_PERIOD
 
 
 import logging
@@ -50,6 +52,7 @@ _abstract = (
 "the UK and we'll use this to make a personalised climate stripes image for your area. " 
 """
 All we need is the latitude and longitude of your location, you can find this information at https://www.latlong.net . 
+Alternatively, provide a bounding box or a GeoJSON polygon to use the average over a whole area.
 """ 
 "The programme will take a little while to run after submission. Once it has completed click "
 "'Show Output' to view a pdf with your figure! The pdf has a table showing the breakdown of each "
@@ -115,11 +118,24 @@ class PlotClimateStripes(Process):
             self._define_input("project_name", "Project name", "Enter a name for your project", "string", optional=True),
             self._define_input("latitude", "Latitude", 
                                "Latitude is how far the location is from the equator, most of the UK is between 50 and 59 degrees North.",
-                               "float"),
+                               "float", optional=True),
             self._define_input("longitude", "Longitude", 
                                ("Longitude is how far the place is from the Prime Meridian which goes vertically through Greenwich in London. "
                                 "Anything East of this will be a positive number whilst anything West will be a negative number."), 
-                               "float"),
+                               "float", optional=True),
+            BoundingBoxInput("bbox", "Bounding box",
+                             abstract=("Instead of a latitude and longitude, you can provide a bounding box (as: minimum "
+                                       "longitude, minimum latitude, maximum longitude, maximum latitude) to use the "
+                                       "average temperature over that area."),
+                             crss=["epsg:4326"],
+                             min_occurs=0,
+                             max_occurs=1),
+            ComplexInput("region", "Region",
+                         abstract=("Instead of a latitude and longitude, you can provide a GeoJSON polygon to use the "
+                                   "average temperature over that area."),
+                         supported_formats=[FORMATS.GEOJSON],
+                         min_occurs=0,
+                         max_occurs=1),
             self._define_input("n_colours", "Number of Colours", 
                                ("Enter the number of colours you’d like in your figure. The minimum is 5 and the maximum is 100, "
                                 "we recommend 20 colours."), "integer", default=20),
@@ -128,7 +144,12 @@ class PlotClimateStripes(Process):
                                "integer", default=1901),
             self._define_input("end_year", "End year", 
                                "Enter the year you would like the data to finish on. The last available year is 2022.", 
-                               "integer", default=2000)
+                               "integer", default=2000),
+            self._define_input("reference_period", "Reference period",
+                               ("Choose the period used to calculate the average temperature. Each stripe shows "
+                                "how much warmer or cooler that year was than this average."),
+                               "string", allowed_values=["{}-{}".format(*period) for period in REFERENCE_PERIODS],
+                               default="{}-{}".format(*DEFAULT_REFERENCE_PERIOD))
             
 #        LiteralInput( "yearNumericRange", "Time Period", abstract="The time period", data_type="string", default="1901/2000", min_occurs=1, max_occurs=1,)
 
@@ -143,7 +164,13 @@ class PlotClimateStripes(Process):
                           supported_formats=[FORMATS_EXT.PDF]),
             ComplexOutput('png_output', 'PNG Output',
                           as_reference=True,
-                          supported_formats=[FORMATS_EXT.PNG])
+                          supported_formats=[FORMATS_EXT.PNG]),
+            ComplexOutput('data_output', 'Data Output',
+                          abstract=('The years, temperature values, differences from the average and colours '
+                                    'of the stripes, as JSON or CSV. Request only this output to get the data '
+                                    'without drawing the figure.'),
+                          as_reference=True,
+                          supported_formats=[FORMATS.JSON, FORMATS.CSV])
             ]
         return outputs
 
@@ -156,32 +183,64 @@ class PlotClimateStripes(Process):
         n_colours = get_input(request.inputs, "n_colours")
         start_year = get_input(request.inputs, "start_year")
         end_year = get_input(request.inputs, "end_year")
+        reference_period = get_reference_period(request.inputs, default=DEFAULT_REFERENCE_PERIOD)
+
+        try:
+            region = get_region(request.inputs)
+        except ValueError as exc:
+            raise ProcessError(str(exc))
+
+        if region is None and (lat is None or lon is None):
+            raise ProcessError("Please provide either a latitude and longitude, or a bounding box or polygon region.")
     #    time_range = get_input(request.inputs, "yearNumericRange") 
    #     inputs = {"latitude": lat, "longitude": lon, "project_name": project_name}
    #     except Exception as exc:
    #        raise ProcessError(f"An error occurred when converting to CSV: {str(exc)}")
 
+        requested = get_requested_outputs(request, self.outputs)
+        # The data output is written as JSON or CSV, depending on the format that was asked for
+        data_format = get_output_format(request, response.outputs['data_output']).extension.lstrip(".")
+
         png_file = os.path.join(self.workdir, "stripes.png")
         pdf_file = os.path.join(self.workdir, "stripes.pdf")
 #        shutil.copy("/tmp/climate-stripes.png", output_file)
 
         # Make the stripes
-        stripes_maker = StripesRenderer()
+        stripes_maker = StripesRenderer(reference_period=reference_period)
         response.update_status('Begin data loading', 10)
 
 #        RAL = [51.570664384, -1.308832098]
-        df = stripes_maker.create(lat, lon, n_colours=n_colours, output_file=png_file, time_range=(start_year, end_year))
+        kwargs = {"lat": lat, "lon": lon, "region": region, "n_colours": n_colours,
+                  "time_range": (start_year, end_year)}
+        df = None
+
+        try:
+            # Only make the outputs that were requested: the HTML and PDF are skipped if only the PNG
+            # was requested, and the figure is not drawn at all if only the data was requested
+            if requested & {'output', 'png_output'}:
+                df = stripes_maker.create_outputs(png_file if 'png_output' in requested else None,
+                                                  pdf_file if 'output' in requested else None,
+                                                  project_name=project_name, **kwargs)
+
+            if 'data_output' in requested:
+                # Reuse the data of the figure, unless it came from the cache
+                if df is None:
+                    df = stripes_maker.create_data(**kwargs)
+                response.outputs['data_output'].data = stripes_maker.to_data(data_format)
+        except LocationOutOfRangeError as exc:
+            raise ProcessError(str(exc))
 
         response.update_status('Data extracted', 70)
 
 #        html = stripes_maker.to_html(html_file="/tmp/output.html", project_name="My great project")
-        pdf_file_ = stripes_maker.to_pdf(pdf_file, project_name=project_name)
                 
         response.update_status('Outputs written', 90)
 
-        LOGGER.info(f'Written output file: {pdf_file}')
-        response.outputs['output'].file = pdf_file
-        response.outputs['png_output'].file = png_file
+        for identifier, output_file in (('output', pdf_file), ('png_output', png_file)):
+            if identifier in requested:
+                LOGGER.info(f'Written output file: {output_file}')
+                response.outputs[identifier].file = output_file
+
         return response
 
 
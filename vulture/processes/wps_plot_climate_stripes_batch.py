@@ -0,0 +1,183 @@
+import csv
+import io
+
+from pywps import (
+    LiteralInput,
+    ComplexInput,
+    Process,
+    FORMATS,
+    ComplexOutput,
+)
+
+from pywps.app.Common import Metadata
+from pywps.app.exceptions import ProcessError
+
+from vulture.utils import get_input, get_reference_period
+from vulture.stripes_lib.stripes import StripesRenderer, REFERENCE_PERIODS, DEFAULT_REFERENCE_PERIOD
+
+
+import logging
+LOGGER = logging.getLogger("PYWPS")
+
+
+MAX_LOCATIONS = 500
+
+
+_abstract = (
+    "Plot climate stripes for a whole list of locations in one go! Upload a CSV file with one location "
+    "per line, as: latitude, longitude, name (the name is optional, and a header line is allowed). "
+    "Choose whether to use the UK (HadUK-Grid) or global (CRU TS) data, and we'll make a climate stripes "
+    "image and PDF for every location. "
+    """
+The outputs are returned as a single zip file, along with a summary table listing the grid box used
+for each location (or why it could not be used).
+"""
+    """
+You can find out more about climate stripes and discover inspiration for things to do with them here:
+https://www.ceda.ac.uk/outreach
+"""
+)
+
+
+class PlotClimateStripesBatch(Process):
+
+    IDENTIFIER = "PlotClimateStripesBatch"
+    TITLE = "Plot Climate Stripes for Many Locations"
+    ABSTRACT = _abstract
+    KEYWORDS = ["climate", "observations", "change", "batch"]
+    DATASETS = {"UK": False, "Global": True}
+
+    PROCESS_METADATA = [
+        Metadata("CEDA WPS UI", "https://ceda-wps-ui.ceda.ac.uk"),
+        Metadata("CEDA WPS", "https://ceda-wps.ceda.ac.uk"),
+        Metadata("Disclaimer", "https://help.ceda.ac.uk/article/4642-disclaimer"),
+        Metadata("https://www.latlong.net", "https://www.latlong.net"),
+        Metadata("https://www.ceda.ac.uk/outreach", "https://www.ceda.ac.uk/outreach")
+    ]
+
+    def __init__(self):
+
+        inputs = self._define_inputs()
+        outputs = self._define_outputs()
+
+        super(PlotClimateStripesBatch, self).__init__(
+            self._handler,
+            identifier=self.IDENTIFIER,
+            title=self.TITLE,
+            abstract=self.ABSTRACT,
+            keywords=self.KEYWORDS,
+            metadata=self.PROCESS_METADATA,
+            version="1.0.0",
+            inputs=inputs,
+            outputs=outputs,
+            store_supported=True,
+            status_supported=True,
+        )
+
+    def _define_input(self, name, long_name, abstract, dtype="string", allowed_values=None, optional=False,
+                      default=None):
+        return LiteralInput(
+            name,
+            long_name,
+            abstract=abstract,
+            data_type=dtype,
+            allowed_values=allowed_values,
+            min_occurs=(0 if optional else 1),
+            max_occurs=1,
+            default=default
+        )
+
+    def _define_inputs(self):
+        inputs = [
+            self._define_input("project_name", "Project name", "Enter a name for your project", "string",
+                               optional=True),
+            ComplexInput("locations", "Locations",
+                         abstract=(f"A CSV file with one location per line: latitude, longitude, name. "
+                                   f"The maximum number of locations is {MAX_LOCATIONS}."),
+                         supported_formats=[FORMATS.CSV, FORMATS.TEXT],
+                         min_occurs=1,
+                         max_occurs=1),
+            self._define_input("dataset", "Dataset",
+                               "Use the UK (HadUK-Grid) or the global (CRU TS) temperature data.",
+                               "string", allowed_values=list(self.DATASETS), default="UK"),
+            self._define_input("n_colours", "Number of Colours",
+                               ("Enter the number of colours you’d like in your figure. The minimum is 5 and "
+                                "the maximum is 100, we recommend 20 colours."), "integer", default=20),
+            self._define_input("start_year", "Start year",
+                               ("Enter the year you would like the data to start from. "
+                                "Note: most of the data starts in 1901."),
+                               "integer", default=1901),
+            self._define_input("end_year", "End year",
+                               "Enter the year you would like the data to finish on.",
+                               "integer", default=2000),
+            self._define_input("reference_period", "Reference period",
+                               ("Choose the period used to calculate the average temperature. Each stripe shows "
+                                "how much warmer or cooler that year was than this average."),
+                               "string", allowed_values=["{}-{}".format(*period) for period in REFERENCE_PERIODS],
+                               default="{}-{}".format(*DEFAULT_REFERENCE_PERIOD))
+        ]
+        return inputs
+
+    def _define_outputs(self):
+        outputs = [
+            ComplexOutput('output', 'Output',
+                          abstract='Zip file containing the climate stripes for each location',
+                          as_reference=True,
+                          supported_formats=[FORMATS.ZIP])
+        ]
+        return outputs
+
+    def _read_locations(self, content):
+        """
+        Parse the CSV content of the "locations" input.
+        Returns a list of (lat, lon, name) tuples.
+        """
+        rows = [row for row in csv.reader(io.StringIO(content)) if any(cell.strip() for cell in row)]
+        locations = []
+
+        for i, row in enumerate(rows):
+            try:
+                lat, lon = float(row[0]), float(row[1])
+            except (ValueError, IndexError):
+                # Allow a header line
+                if i == 0:
+                    continue
+                raise ProcessError(f"Could not read latitude and longitude from line: {', '.join(row)}")
+
+            name = row[2].strip() if len(row) > 2 else "location"
+            locations.append((lat, lon, name))
+
+        if not locations:
+            raise ProcessError("No locations were provided.")
+
+        if len(locations) > MAX_LOCATIONS:
+            raise ProcessError(f"Too many locations: {len(locations)}. The maximum is {MAX_LOCATIONS}.")
+
+        return locations
+
+    def _handler(self, request, response):
+
+        locations = self._read_locations(get_input(request.inputs, "locations"))
+        project_name = get_input(request.inputs, "project_name")
+        dataset = get_input(request.inputs, "dataset", "UK")
+        n_colours = get_input(request.inputs, "n_colours")
+        start_year = get_input(request.inputs, "start_year")
+        end_year = get_input(request.inputs, "end_year")
+        reference_period = get_reference_period(request.inputs, default=DEFAULT_REFERENCE_PERIOD)
+
+        # Make the stripes
+        stripes_maker = StripesRenderer(global_mode=self.DATASETS[dataset], reference_period=reference_period)
+        response.update_status(f'Begin data loading for {len(locations)} locations', 10)
+
+        def _update_status(n_done, n_total):
+            response.update_status(f'Rendered {n_done} of {n_total} locations', 20 + int(70 * n_done / n_total))
+
+        zip_file = stripes_maker.create_many(locations, self.workdir, n_colours=n_colours,
+                                             time_range=(start_year, end_year), project_name=project_name,
+                                             callback=_update_status)
+
+        response.update_status('Outputs written', 90)
+
+        LOGGER.info(f'Written output file: {zip_file}')
+        response.outputs['output'].file = zip_file
+        return response
@@ -0,0 +1,235 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+
+# Define some global constants for the on-disk cache.
+# Both can be overridden with environment variables so that all workers of a deployment share the same cache.
+STRIPES_CACHE_DIR = os.environ.get("VULTURE_STRIPES_CACHE_DIR",
+                                   os.path.join(tempfile.gettempdir(), "vulture-stripes-cache"))
+STRIPES_CACHE_MAX_BYTES = int(os.environ.get("VULTURE_STRIPES_CACHE_MAX_BYTES", 256 * 1024 ** 2))
+ARTIFACT_CACHE_DIR = os.environ.get("VULTURE_ARTIFACT_CACHE_DIR",
+                                    os.path.join(tempfile.gettempdir(), "vulture-artifact-cache"))
+ARTIFACT_CACHE_MAX_BYTES = int(os.environ.get("VULTURE_ARTIFACT_CACHE_MAX_BYTES", 1024 ** 3))
+
+# Temporary files older than this (in seconds) are assumed to be left over from a crashed writer
+STALE_TMP_AGE = 3600
+
+
+def make_key(*parts):
+    """
+    Return a hex digest that uniquely identifies `parts` (any JSON-serialisable values).
+    """
+    content = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _link_or_copy(source, destination):
+    """
+    Hard link `source` to `destination` (replacing it), or copy it if they are not on the same file system.
+    The destination is created under a temporary name first, so it is never seen half-written.
+    """
+    tmp_path = f"{destination}.{os.getpid()}.{time.time_ns()}.tmp"
+
+    try:
+        try:
+            os.link(source, tmp_path)
+        except OSError:
+            shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, destination)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class _CacheDirectory:
+    """
+    The eviction and clearing of a size-bounded cache of files (ending in `SUFFIX`) in a directory.
+    When the total size exceeds `max_bytes`, the least recently used entries (by modification time,
+    which is refreshed on every hit) are removed.
+    """
+    SUFFIX = None
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def _entries(self):
+        """
+        Returns a list of (mtime, size, path) tuples for all cache entries.
+        Cleans up stale temporary files along the way.
+        """
+        entries = []
+        now = time.time()
+
+        try:
+            dir_entries = list(os.scandir(self.cache_dir))
+        except FileNotFoundError:
+            return entries
+
+        for entry in dir_entries:
+            try:
+                stat = entry.stat()
+                if entry.name.endswith(self.SUFFIX):
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                elif entry.name.endswith(".tmp") and now - stat.st_mtime > STALE_TMP_AGE:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                # Removed by another process in the meantime
+                continue
+
+        return entries
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in `max_bytes`.
+        """
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+            total -= size
+
+    def clear(self):
+        "Remove all entries from the cache."
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class DiskCache(_CacheDirectory):
+    """
+    A persistent, size-bounded cache of NumPy arrays stored on disk.
+
+    Each entry is a dictionary of arrays, saved as a single `.npz` file named after its key.
+    Writes are atomic (write to a temporary file, then rename) so the cache directory can be
+    shared safely between processes. When the total size exceeds `max_bytes`, the least
+    recently used entries (by modification time, which is refreshed on every hit) are removed.
+
+    Use as follows:
+    >>> cache = DiskCache("/tmp/my-cache", max_bytes=10 * 1024 ** 2)
+    >>> key = make_key("haduk-grid", "v1.2.0.ceda", 51.57, -1.31)
+    >>> cache.put(key, {"years": years, "values": values})
+    >>> cache.get(key)["values"]
+    """
+    SUFFIX = ".npz"
+
+    def __init__(self, cache_dir=STRIPES_CACHE_DIR, max_bytes=STRIPES_CACHE_MAX_BYTES):
+        super().__init__(cache_dir, max_bytes)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}{self.SUFFIX}")
+
+    def __contains__(self, key):
+        return os.path.isfile(self._path(key))
+
+    def get(self, key):
+        """
+        Return the dictionary of arrays stored under `key`, or None if not cached.
+        """
+        path = self._path(key)
+
+        try:
+            with np.load(path, allow_pickle=False) as npz:
+                data = {name: npz[name] for name in npz.files}
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+
+        # Mark the entry as recently used
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+        return data
+
+    def put(self, key, data):
+        """
+        Store the dictionary of arrays `data` under `key`, then evict old entries if required.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+
+        try:
+            with os.fdopen(fd, "wb") as writer:
+                np.savez(writer, **{name: np.asarray(value) for name, value in data.items()})
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self.evict()
+
+
+class ArtifactCache(_CacheDirectory):
+    """
+    A persistent, size-bounded cache of output files (such as the PNG and PDF of a climate stripes request),
+    stored on disk under a key that identifies everything that affects their content.
+
+    Files are stored and fetched by hard linking them (falling back to copying when the cache is on
+    a different file system), so a hit does not need to read or write the content of the files.
+    Like `DiskCache`, the directory can be shared safely between processes.
+
+    Use as follows:
+    >>> cache = ArtifactCache("/tmp/my-artifacts")
+    >>> key = make_key("renderer-v1", 51.57, -1.31, 20)
+    >>> if not cache.fetch(key, {"png": "/wps/workdir/stripes.png"}):
+    ...     render("/wps/workdir/stripes.png")
+    ...     cache.store(key, {"png": "/wps/workdir/stripes.png"})
+    """
+    SUFFIX = ".artifact"
+
+    def __init__(self, cache_dir=ARTIFACT_CACHE_DIR, max_bytes=ARTIFACT_CACHE_MAX_BYTES):
+        super().__init__(cache_dir, max_bytes)
+
+    def _path(self, key, name):
+        return os.path.join(self.cache_dir, f"{key}.{name}{self.SUFFIX}")
+
+    def fetch(self, key, outputs):
+        """
+        Link the files stored under `key` to the paths in `outputs` (a dictionary of {name: path}).
+        Returns True if all of them were found in the cache, or False otherwise.
+        """
+        paths = {name: self._path(key, name) for name in outputs}
+
+        if not all(os.path.isfile(path) for path in paths.values()):
+            return False
+
+        try:
+            for name, output_path in outputs.items():
+                _link_or_copy(paths[name], output_path)
+                # Mark the entry as recently used
+                os.utime(paths[name])
+        except FileNotFoundError:
+            # Evicted by another process in the meantime
+            return False
+
+        return True
+
+    def store(self, key, outputs):
+        """
+        Store the files in `outputs` (a dictionary of {name: path}) under `key`, then evict old entries if required.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        for name, output_path in outputs.items():
+            _link_or_copy(output_path, self._path(key, name))
+
+        self.evict()
@@ -0,0 +1,79 @@
+import os
+import threading
+
+
+class DatasetHandle:
+    """
+    An opened dataset, along with the modification time of the file it was opened from.
+    Objects derived from the dataset (such as spatial indexes) can be stored with it, so
+    they are built once and discarded along with the dataset when it is reopened.
+    """
+
+    def __init__(self, path, ds, mtime):
+        self.path = path
+        self.ds = ds
+        self.mtime = mtime
+        self._derived = {}
+        # Re-entrant, so that a factory can use other derived objects
+        self._lock = threading.RLock()
+
+    def derived(self, name, factory):
+        """
+        Return the object stored as `name`, building it with `factory(ds)` on first use.
+        """
+        with self._lock:
+            if name not in self._derived:
+                self._derived[name] = factory(self.ds)
+
+            return self._derived[name]
+
+
+class DatasetPool:
+    """
+    A process-wide, thread-safe pool of opened (Xarray) datasets.
+
+    Opening a dataset (parsing a kerchunk reference file or decoding NetCDF metadata) is a
+    fixed cost that we only want to pay once per worker. Datasets are keyed by the path of the
+    file they are opened from, and reopened if that file's modification time changes.
+    Handles are never shared across a fork: a child process opens its own.
+
+    Use as follows:
+    >>> pool = DatasetPool()
+    >>> ds = pool.get("/path/to/file.nc", xr.open_dataset).ds
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._handles = {}
+        self._pid = os.getpid()
+
+    def get(self, path, opener):
+        """
+        Return a `DatasetHandle` for `path`, calling `opener(path)` to open it if it is not
+        already open (or if the file has changed since it was opened).
+        Raises FileNotFoundError if `path` does not exist.
+        """
+        mtime = os.stat(path).st_mtime_ns
+
+        with self._lock:
+            if self._pid != os.getpid():
+                self._handles = {}
+                self._pid = os.getpid()
+
+            handle = self._handles.get(path)
+
+            # Old handles are not closed explicitly because other threads may still be reading
+            # from them, they are closed when no longer referenced.
+            if handle is None or handle.mtime != mtime:
+                handle = DatasetHandle(path, opener(path), mtime)
+                self._handles[path] = handle
+
+        return handle
+
+    def __contains__(self, path):
+        return path in self._handles
+
+    def clear(self):
+        "Remove all datasets from the pool."
+        with self._lock:
+            self._handles = {}
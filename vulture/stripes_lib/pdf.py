@@ -0,0 +1,220 @@
+"""
+Native layout of PDF reports with Matplotlib (an alternative to converting HTML with xhtml2pdf).
+"""
+import textwrap
+import threading
+
+import matplotlib
+from matplotlib.artist import Artist
+from matplotlib.backends.backend_pdf import FigureCanvasPdf, PdfPages
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.figure import Figure
+from matplotlib.font_manager import FontProperties
+
+
+# Page size (A4) and margins, in inches
+PAGE_SIZE = (8.27, 11.69)
+MARGIN = 0.6
+
+# Height of a table row (in inches), and the font (one of the standard PDF fonts) and its sizes (in points)
+ROW_HEIGHT = 0.2
+FONT_FAMILY = "Times"
+HEADING_SIZE = 14
+TEXT_SIZE = 9
+TABLE_TEXT_SIZE = 7
+
+# Matplotlib only uses the standard PDF fonts (which are fast to draw, and are not embedded in the
+# file) if the global "pdf.use14corefonts" setting is on, so it is only changed while holding this lock
+_CORE_FONTS_LOCK = threading.Lock()
+
+
+def _get_font(size, bold=False):
+    return FontProperties(family=FONT_FAMILY, weight=("bold" if bold else "roman"), size=size)
+
+
+class CellText(Artist):
+    """
+    A single Matplotlib artist that draws the text of many table cells, each one right-aligned
+    and centred vertically at its (x, y) position (in data coordinates). This is much faster than
+    creating a `Text` artist for each cell.
+    """
+
+    def __init__(self, cells, fontproperties):
+        """
+        `cells` is a list of (x, y, text) tuples.
+        """
+        super().__init__()
+        self.cells = cells
+        self.fontproperties = fontproperties
+
+    def draw(self, renderer):
+        if not self.get_visible():
+            return
+
+        gc = renderer.new_gc()
+        gc.set_foreground("black")
+        points = self.get_transform().transform([(x, y) for x, y, text in self.cells])
+        canvas_height = renderer.get_canvas_width_height()[1]
+
+        for (x, y), (_, _, text) in zip(points, self.cells):
+            width, height, descent = renderer.get_text_width_height_descent(text, self.fontproperties, ismath=False)
+            baseline = y - (height - 2 * descent) / 2
+
+            # Some renderers measure y from the top of the canvas (as in `Text.draw`)
+            if renderer.flipy():
+                baseline = canvas_height - baseline
+
+            renderer.draw_text(gc, x - width, baseline, text, self.fontproperties, 0)
+
+        gc.restore()
+
+
+class PdfReport:
+    """
+    Writes a PDF document by laying out blocks (headings, paragraphs, images and tables)
+    from the top of each page down, starting a new page when a block does not fit.
+
+    Use as follows:
+    >>> with PdfReport("report.pdf") as report:
+    ...     report.heading("Climate Stripes")
+    ...     report.image(image_array)
+    ...     report.table(["year", "colour"], rows)
+    """
+
+    def __init__(self, output_file, page_size=PAGE_SIZE, margin=MARGIN):
+        """
+        `output_file` is a path or a binary file-like object.
+        """
+        self.page_size = page_size
+        self.margin = margin
+        self.width = page_size[0] - 2 * margin
+
+        self._pages = PdfPages(output_file)
+        self._fig = None
+        self._y = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _new_page(self):
+        self._save_page()
+        self._fig = Figure(figsize=self.page_size)
+        FigureCanvasPdf(self._fig)
+        self._y = self.page_size[1] - self.margin
+
+    def _save_page(self):
+        if self._fig is not None:
+            with _CORE_FONTS_LOCK, matplotlib.rc_context({"pdf.use14corefonts": True}):
+                self._pages.savefig(self._fig)
+
+            self._fig.clear()
+            self._fig = None
+
+    def _space_left(self):
+        return (self._y - self.margin) if self._fig is not None else 0
+
+    def _reserve(self, height):
+        """
+        Reserve `height` inches for the next block (on a new page if it does not fit on this one,
+        unless the page is still empty). Returns the top of the block, in inches from the bottom of the page.
+        """
+        if self._fig is None or (height > self._space_left() and self._y < self.page_size[1] - self.margin):
+            self._new_page()
+
+        top = self._y
+        self._y -= height
+        return top
+
+    def _add_axes(self, top, height):
+        width, page_height = self.page_size
+        ax = self._fig.add_axes([self.margin / width, (top - height) / page_height,
+                                 self.width / width, height / page_height])
+        ax.axis("off")
+        return ax
+
+    def heading(self, text, size=HEADING_SIZE):
+        "Add a (bold) heading."
+        self.paragraph(text, size=size, bold=True, space_after=0.1)
+
+    def paragraph(self, text, size=TEXT_SIZE, bold=False, space_after=0.08):
+        "Add a paragraph of text, wrapped to the width of the page."
+        # Approximate the number of characters per line from the average width of a character
+        n_chars = int(self.width * 72 / (size * 0.55))
+        lines = textwrap.wrap(" ".join(text.split()), n_chars) or [""]
+        line_height = size * 1.3 / 72
+
+        top = self._reserve(len(lines) * line_height + space_after)
+
+        for i, line in enumerate(lines):
+            self._fig.text(self.margin / self.page_size[0], (top - i * line_height) / self.page_size[1], line,
+                           fontproperties=_get_font(size, bold), va="top", ha="left")
+
+    def image(self, image, space_after=0.2):
+        "Add an image (an array, as read by `matplotlib.image.imread`), scaled to the width of the page."
+        height = self.width * image.shape[0] / image.shape[1]
+        ax = self._add_axes(self._reserve(height + space_after), height)
+        ax.imshow(image, aspect="auto", interpolation="none")
+
+    def table(self, col_names, rows, colours=None, space_after=0.2):
+        """
+        Add a table, with a header row of `col_names` and `rows` (a list of lists of strings).
+        If `colours` (one colour per row) is given, the last column is filled with the colour of each row
+        (and has no text). The table is split over as many pages as needed, with the header repeated on each page.
+        """
+        start = 0
+
+        while start < len(rows):
+            # Fit as many rows as possible on the current page (or at least one row on a new page)
+            n_rows = int(round(self._space_left() / ROW_HEIGHT, 6)) - 1
+
+            if n_rows < 1:
+                self._new_page()
+                continue
+
+            chunk = rows[start: start + n_rows]
+            chunk_colours = colours[start: start + n_rows] if colours is not None else None
+            height = (len(chunk) + 1) * ROW_HEIGHT
+
+            self._draw_table(self._add_axes(self._reserve(height), height), col_names, chunk, chunk_colours)
+            start += n_rows
+
+        self._y -= space_after
+
+    def _draw_table(self, ax, col_names, rows, colours=None):
+        "Draw a table on `ax`, with the grid lines and colour blocks drawn as one collection each."
+        n_cols = len(col_names)
+        n_rows = len(rows) + 1
+
+        ax.set_xlim(0, n_cols)
+        ax.set_ylim(n_rows, 0)
+
+        segments = [[(0, y), (n_cols, y)] for y in range(n_rows + 1)] + \
+                   [[(x, 0), (x, n_rows)] for x in range(n_cols + 1)]
+        ax.add_collection(LineCollection(segments, colors="black", linewidths=0.5, clip_on=False))
+
+        if colours is not None:
+            blocks = [[(n_cols - 1, y), (n_cols, y), (n_cols, y + 1), (n_cols - 1, y + 1)]
+                      for y in range(1, n_rows)]
+            ax.add_collection(PolyCollection(blocks, facecolors=colours, edgecolors="none"))
+
+        header_font, font = _get_font(TABLE_TEXT_SIZE, bold=True), _get_font(TABLE_TEXT_SIZE)
+
+        # Right-align the text in each cell, with a small gap before the cell border
+        header = [(x - 0.04, 0.5, col_name) for x, col_name in enumerate(col_names, 1)]
+        cells = [(x - 0.04, y + 0.5, value) for y, row in enumerate(rows, 1) for x, value in enumerate(row, 1)]
+
+        ax.add_artist(CellText(header, header_font))
+        ax.add_artist(CellText(cells, font))
+
+    def close(self):
+        "Save the last page and close the PDF document."
+        if self._fig is None:
+            self._new_page()
+
+        self._save_page()
+
+        with _CORE_FONTS_LOCK, matplotlib.rc_context({"pdf.use14corefonts": True}):
+            self._pages.close()
@@ -0,0 +1,148 @@
+"""
+Offline pre-computation of derived datasets used by the climate stripes processes.
+"""
+import os
+import tempfile
+
+import cftime
+import netCDF4
+import numpy as np
+import xarray as xr
+
+from .stripes import NETCDF_PATH, ANNUAL_NETCDF_PATH, REFERENCE_PERIODS, StripesMaker, annual_mean, is_annual
+
+
+# Number of latitude rows read from the monthly data at a time (bounds the memory used)
+LAT_BLOCK_SIZE = 20
+
+# Chunk shape (in lat, lon) of the output, each chunk holds the full time series
+DEFAULT_CHUNK_SIZE = (8, 8)
+
+
+def write_annual_means(netcdf_path=NETCDF_PATH, output_path=ANNUAL_NETCDF_PATH, var_id="tmp",
+                       chunk_size=DEFAULT_CHUNK_SIZE, lat_block_size=LAT_BLOCK_SIZE):
+    """
+    Calculate annual means from the monthly CRU TS data in `netcdf_path` and write them to `output_path`.
+
+    The output is chunked so that the full time series of a small block of grid cells is stored
+    together, which makes reading the series at a point cheap. The monthly data is processed one
+    block of latitude rows at a time. The output is written to a temporary file which is renamed
+    once complete, so readers never see a partial file.
+
+    Returns the output path.
+    """
+    ds = xr.open_dataset(netcdf_path, use_cftime=True, decode_timedelta=False)
+    var = ds[var_id]
+
+    units = "days since 1900-1-1"
+    calendar = ds.time.encoding.get("calendar", "standard")
+    annual_times = annual_mean(var.isel(lat=0, lon=0)).time.values
+
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(output_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=output_dir, suffix=".tmp")
+    os.close(fd)
+
+    try:
+        with netCDF4.Dataset(tmp_path, "w", format="NETCDF4") as nc:
+            nc.setncatts({key: str(value) for key, value in ds.attrs.items()})
+            nc.frequency = "yr"
+            nc.source_file = os.path.abspath(netcdf_path)
+
+            nc.createDimension("time", None)
+            nc.createDimension("lat", ds.lat.size)
+            nc.createDimension("lon", ds.lon.size)
+
+            time_var = nc.createVariable("time", "f8", ("time",))
+            time_var.setncatts({"units": units, "calendar": calendar, "standard_name": "time"})
+            time_var[:] = cftime.date2num(annual_times, units, calendar=calendar)
+
+            for coord in ("lat", "lon"):
+                coord_var = nc.createVariable(coord, "f4", (coord,))
+                coord_var.setncatts(ds[coord].attrs)
+                coord_var[:] = ds[coord].values
+
+            chunksizes = (len(annual_times),) + tuple(chunk_size)
+            out_var = nc.createVariable(var_id, "f4", ("time", "lat", "lon"), zlib=True,
+                                        chunksizes=chunksizes, fill_value=netCDF4.default_fillvals["f4"])
+            out_var.setncatts({key: value for key, value in var.attrs.items() if key != "_FillValue"})
+            out_var.cell_methods = "time: mean"
+
+            for start in range(0, ds.lat.size, lat_block_size):
+                end = min(start + lat_block_size, ds.lat.size)
+                print(f"Calculating annual means for latitude rows {start} to {end - 1}...")
+                block = annual_mean(var.isel(lat=slice(start, end)).load())
+                out_var[:, start:end, :] = block.values
+
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return output_path
+
+
+def write_climatologies(global_mode=True, output_path=None, periods=REFERENCE_PERIODS,
+                        row_block_size=LAT_BLOCK_SIZE, **maker_kwargs):
+    """
+    Calculate the mean of the annual temperatures over each reference period in `periods` (a list of
+    (start year, end year) tuples), for every grid cell of the UK (HadUK-Grid) or global (CRU TS) data,
+    and write them to `output_path` (by default: the climatology path used by `StripesMaker`).
+    Any other keyword arguments are passed to `StripesMaker` (e.g. to set the path of the data).
+
+    The data is read from the same source as the climate stripes (so for the global data, the
+    pre-computed annual means are used if they exist), one block of grid rows at a time.
+    The output is written to a temporary file which is renamed once complete.
+
+    Returns the output path.
+    """
+    stripes_maker = StripesMaker(global_mode=global_mode, **maker_kwargs)
+    output_path = output_path or stripes_maker.climatology_path
+
+    ds = stripes_maker._open_dataset().ds
+    var = ds.tmp if global_mode else ds.tas
+    to_annual = annual_mean if global_mode and not is_annual(ds) else (lambda data: data)
+
+    dims = tuple(dim for dim in var.dims if dim != "time")
+    var = var.transpose("time", *dims)
+    row_dim = dims[0]
+
+    climatology = np.full((len(periods),) + tuple(var.sizes[dim] for dim in dims), np.nan)
+
+    for start in range(0, var.sizes[row_dim], row_block_size):
+        end = min(start + row_block_size, var.sizes[row_dim])
+        print(f"Calculating climatologies for rows {start} to {end - 1}...")
+        block = to_annual(var.isel({row_dim: slice(start, end)}).load()).astype("float64")
+        years = block.time.dt.year.values
+
+        for i, (period_start, period_end) in enumerate(periods):
+            in_period = (years >= period_start) & (years <= period_end)
+
+            if in_period.any():
+                climatology[i, start:end] = block.values[in_period].mean(axis=0)
+
+    attrs = {"long_name": "Mean of annual temperatures over the reference period", "cell_methods": "time: mean"}
+    attrs.update({key: value for key, value in var.attrs.items() if key == "units"})
+
+    coords = {"period_start": ("period", [int(period[0]) for period in periods]),
+              "period_end": ("period", [int(period[1]) for period in periods])}
+    coords.update({dim: ds[dim] for dim in dims if dim in ds.coords})
+
+    output = xr.Dataset({"climatology": (("period",) + dims, climatology, attrs)}, coords=coords)
+    output.attrs = {"dataset_version": stripes_maker.dataset_version, "source_file": stripes_maker.source_path}
+
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(output_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=output_dir, suffix=".tmp")
+    os.close(fd)
+
+    try:
+        output.to_netcdf(tmp_path, format="NETCDF4", encoding={"climatology": {"zlib": True}})
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return output_path
@@ -0,0 +1,100 @@
+import json
+
+import numpy as np
+from matplotlib.path import Path
+
+
+class Region:
+    """
+    An area (a bounding box or a polygon, in latitude and longitude) to calculate area-mean stripes over.
+
+    Use as follows:
+    >>> region = Region.from_bbox(-5.7, 49.9, 1.8, 55.8)
+    >>> region = Region.from_geojson('{"type": "Polygon", "coordinates": [[[-1, 51], [0, 51], [0, 52], [-1, 51]]]}')
+    >>> mask = region.contains(lats, lons)
+    """
+
+    def __init__(self, polygons, description):
+        """
+        `polygons` is a list of polygons, each one a list of rings (an exterior ring followed by any holes),
+        each ring a list of (lon, lat) points, as in the GeoJSON "MultiPolygon" coordinates.
+        """
+        self.polygons = [[np.asarray(ring, dtype="float64")[:, :2] for ring in polygon] for polygon in polygons]
+        self.description = description
+
+        points = np.concatenate([polygon[0] for polygon in self.polygons])
+        self.bounds = (points[:, 0].min(), points[:, 1].min(), points[:, 0].max(), points[:, 1].max())
+
+    @classmethod
+    def from_bbox(cls, min_lon, min_lat, max_lon, max_lat):
+        "Create a region from the corners of a bounding box."
+        min_lon, min_lat, max_lon, max_lat = [float(i) for i in (min_lon, min_lat, max_lon, max_lat)]
+
+        if min_lon >= max_lon or min_lat >= max_lat:
+            raise ValueError(f"Invalid bounding box: {(min_lon, min_lat, max_lon, max_lat)}")
+
+        ring = [(min_lon, min_lat), (max_lon, min_lat), (max_lon, max_lat), (min_lon, max_lat), (min_lon, min_lat)]
+        description = (f"Area between latitudes {min_lat}&deg; and {max_lat}&deg;, "
+                       f"and longitudes {min_lon}&deg; and {max_lon}&deg;.")
+        return cls([[ring]], description)
+
+    @classmethod
+    def from_geojson(cls, geojson):
+        """
+        Create a region from a GeoJSON string (or dictionary) holding a Polygon or MultiPolygon
+        geometry, or a Feature or FeatureCollection of them.
+        """
+        geojson = json.loads(geojson) if isinstance(geojson, str) else geojson
+        polygons = []
+
+        def _add(geometry):
+            geom_type = geometry.get("type")
+
+            if geom_type == "Feature":
+                _add(geometry["geometry"])
+            elif geom_type == "FeatureCollection":
+                for feature in geometry["features"]:
+                    _add(feature)
+            elif geom_type == "Polygon":
+                polygons.append(geometry["coordinates"])
+            elif geom_type == "MultiPolygon":
+                polygons.extend(geometry["coordinates"])
+            else:
+                raise ValueError(f"Unsupported GeoJSON type: {geom_type}. Please provide a Polygon or MultiPolygon.")
+
+        _add(geojson)
+
+        if not polygons:
+            raise ValueError("No polygons found in GeoJSON.")
+
+        return cls(polygons, "Area within the polygon provided.")
+
+    @property
+    def key(self):
+        "A string that identifies the region (used for caching)."
+        return json.dumps([[ring.round(6).tolist() for ring in polygon] for polygon in self.polygons])
+
+    def contains(self, lats, lons):
+        """
+        Return a boolean array (of the same shape as `lats` and `lons`) that is True for
+        the points inside the region.
+        """
+        lats, lons = np.asarray(lats), np.asarray(lons)
+        min_lon, min_lat, max_lon, max_lat = self.bounds
+
+        # Only test the points inside the bounding box against the polygons
+        inside = (lons >= min_lon) & (lons <= max_lon) & (lats >= min_lat) & (lats <= max_lat)
+        candidates = np.nonzero(inside.ravel())[0]
+        points = np.column_stack([lons.ravel()[candidates], lats.ravel()[candidates]])
+        in_region = np.zeros(candidates.size, dtype=bool)
+
+        for polygon in self.polygons:
+            in_polygon = Path(polygon[0]).contains_points(points)
+
+            for hole in polygon[1:]:
+                in_polygon &= ~Path(hole).contains_points(points)
+
+            in_region |= in_polygon
+
+        inside.ravel()[candidates] = in_region
+        return inside
@@ -0,0 +1,82 @@
+"""
+Vectorised drawing of climate stripes with Matplotlib.
+"""
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import Collection
+from matplotlib.figure import Figure
+from matplotlib.path import Path
+
+
+# Size (in inches) of the climate stripes image
+FIGURE_SIZE = (10, 2)
+
+
+class StripesCollection(Collection):
+    """
+    A single Matplotlib artist that draws one vertical stripe per colour, spanning the full
+    height of the axes. Stripe `i` covers `i - 0.5` to `i + 0.5` along the x-axis.
+
+    Each stripe is drawn exactly as `Axes.axvspan` would draw it (the unit rectangle path, scaled
+    and moved by its own affine transform, with a filled and stroked outline), so the image is
+    identical to drawing the stripes one by one, but without creating an artist per stripe.
+
+    Use as follows:
+    >>> ax = Figure().add_subplot()
+    >>> StripesCollection.add_to(ax, colours)
+    """
+
+    def __init__(self, colours, **kwargs):
+        """
+        `colours` is an (N, 4) array of RGBA colours, one per stripe.
+        """
+        colours = np.atleast_2d(colours)
+        n_stripes = colours.shape[0]
+
+        # Use at least two colours, so a single stripe is not drawn as a marker (which renders differently)
+        if n_stripes == 1:
+            colours = np.repeat(colours, 2, axis=0)
+
+        kwargs.setdefault("joinstyle", "miter")
+        super().__init__(facecolors=colours, edgecolors=colours, **kwargs)
+
+        transforms = np.zeros((n_stripes, 3, 3))
+        transforms[:, 0, 0] = transforms[:, 1, 1] = transforms[:, 2, 2] = 1
+        transforms[:, 0, 2] = np.arange(n_stripes) - 0.5
+
+        self._transforms = transforms
+        self.set_paths([Path.unit_rectangle()] * n_stripes)
+
+    @classmethod
+    def add_to(cls, ax, colours, **kwargs):
+        """
+        Add the stripes for `colours` to the axes `ax`, and scale the x-axis to fit them
+        (in the same way as `Axes.axvspan`). Returns the `StripesCollection`.
+        """
+        stripes = cls(colours, transform=ax.get_xaxis_transform(which="grid"), **kwargs)
+        ax.add_collection(stripes, autolim=False)
+
+        ax.update_datalim([(-0.5, 0), (stripes._transforms.shape[0] - 0.5, 0)], updatey=False)
+        ax.autoscale_view(scaley=False)
+        return stripes
+
+
+def render_stripes(colours, output_file, figsize=FIGURE_SIZE):
+    """
+    Draw the stripes for `colours` (an (N, 4) array of RGBA colours) and save the image to `output_file`.
+
+    The figure is created with the object-oriented API (not `pyplot`), so it is never registered in
+    pyplot's global state: it is freed as soon as it has been saved, and renders can run in parallel threads.
+    """
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+
+    try:
+        ax = fig.add_subplot()
+        StripesCollection.add_to(ax, colours)
+        ax.axis("off")
+        fig.savefig(output_file)
+    finally:
+        fig.clear()
+
+    return output_file
@@ -0,0 +1,110 @@
+from collections import namedtuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+EARTH_RADIUS_KM = 6371.0
+
+# The result of a nearest grid cell lookup:
+#   - index: dictionary of {dimension: integer index} of the grid cell
+#   - lat, lon: latitude and longitude of the grid cell centre
+#   - distance: great circle distance (km) from the requested location to the grid cell centre
+CellMatch = namedtuple("CellMatch", "index lat lon distance")
+
+
+def to_unit_vectors(lats, lons):
+    """
+    Convert arrays of latitudes and longitudes (in degrees) to an (N, 3) array of 3-D unit vectors.
+    """
+    lats, lons = np.radians(np.ravel(lats)), np.radians(np.ravel(lons))
+    return np.column_stack([np.cos(lats) * np.cos(lons), np.cos(lats) * np.sin(lons), np.sin(lats)])
+
+
+def chord_to_km(chord):
+    "Convert the distance between unit vectors to a great circle distance in km."
+    return 2 * np.arcsin(np.clip(chord / 2, 0, 1)) * EARTH_RADIUS_KM
+
+
+class SpatialIndex:
+    """
+    A spatial index (KD-tree) of grid cell centres, for nearest grid cell lookups.
+
+    The cell centres are stored as 3-D unit vectors, so distances are correct for any grid
+    (regular latitude/longitude or projected) and across the poles and the date line.
+    The index is built once per dataset, after which each lookup only touches memory.
+
+    Use as follows:
+    >>> index = SpatialIndex.from_dataset(ds, "latitude", "longitude")
+    >>> match = index.nearest(51.57, -1.31)
+    >>> ds.tas.isel(**match.index)
+    """
+
+    def __init__(self, lats, lons, dims):
+        """
+        `lats` and `lons` are 2-D arrays of cell centre coordinates, with dimensions `dims`.
+        """
+        self.lats = np.asarray(lats, dtype="float64")
+        self.lons = np.asarray(lons, dtype="float64")
+        self.dims = tuple(dims)
+        self.shape = self.lats.shape
+        self._tree = cKDTree(to_unit_vectors(self.lats, self.lons))
+
+    @classmethod
+    def from_dataset(cls, ds, lat_var, lon_var):
+        """
+        Build the index from the coordinate variables of an Xarray `Dataset`.
+        Handles both 1-D (regular grid) and 2-D (projected grid) latitude and longitude variables.
+        """
+        lats, lons = ds[lat_var], ds[lon_var]
+
+        if lats.ndim == 1:
+            dims = (lats.dims[0], lons.dims[0])
+            lons_2d, lats_2d = np.meshgrid(lons.values, lats.values)
+            return cls(lats_2d, lons_2d, dims)
+
+        return cls(lats.values, lons.transpose(*lats.dims).values, lats.dims)
+
+    def valid_cell_lookup(self, valid):
+        """
+        Build a lookup grid that maps every grid cell to the nearest cell for which `valid`
+        (a 2-D boolean array, such as a land mask) is True.
+        Returns a 2-D array (with the shape of the grid) of flat indexes of the valid cells.
+        """
+        valid = np.asarray(valid, dtype=bool).ravel()
+
+        if not valid.any():
+            return np.arange(valid.size).reshape(self.shape)
+
+        valid_index = np.nonzero(valid)[0]
+        _, nearest = cKDTree(self._tree.data[valid_index]).query(self._tree.data)
+        return valid_index[nearest].reshape(self.shape)
+
+    def query(self, lats, lons, lookup=None):
+        """
+        Find the nearest grid cells to arrays of latitudes and longitudes, in one vectorised lookup.
+        If a `lookup` grid (see `valid_cell_lookup`) is provided, each cell found is replaced
+        by the cell it maps to (and the distance is to that cell).
+        Returns a `CellMatch` in which each field is an array (with one value per location).
+        """
+        points = to_unit_vectors(lats, lons)
+        chord, flat_index = self._tree.query(points)
+
+        if lookup is not None:
+            flat_index = np.asarray(lookup).ravel()[flat_index]
+            chord = np.linalg.norm(self._tree.data[flat_index] - points, axis=1)
+
+        index = np.unravel_index(flat_index, self.shape)
+
+        return CellMatch(index=dict(zip(self.dims, index)),
+                         lat=self.lats[index], lon=self.lons[index],
+                         distance=chord_to_km(chord))
+
+    def nearest(self, lat, lon, lookup=None):
+        """
+        Find the nearest grid cell to a single location (see `query`). Returns a `CellMatch`.
+        """
+        match = self.query([lat], [lon], lookup=lookup)
+        return CellMatch(index={dim: int(i[0]) for dim, i in match.index.items()},
+                         lat=float(match.lat[0]), lon=float(match.lon[0]),
+                         distance=float(match.distance[0]))
@@ -1,20 +1,51 @@
 import pandas as pd
-import matplotlib.pyplot as plt
+import matplotlib
+import matplotlib.image
+from matplotlib.colors import Normalize
 import xarray as xr
 import numpy as np
 import fsspec
-from convertbng.util import convert_bng
 from xhtml2pdf import pisa
-from io import BytesIO
+from io import BytesIO, StringIO, TextIOWrapper
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import base64
+import html
+import json
+import multiprocessing
 import os
-
-
-# Define the cache as a dictionary
-CACHE = {}
+import re
+from collections import namedtuple
+from functools import lru_cache
+import tempfile
+import time
+import tracemalloc
+import zipfile
+
+from .cache import ArtifactCache, DiskCache, make_key
+from .datasets import DatasetPool
+from .spatial_index import SpatialIndex, CellMatch
+from .regions import Region
+from .render import render_stripes
+from .pdf import PdfReport
+from ..exceptions import LocationOutOfRangeError
+
+
+# Define the cache of extracted time series (shared on disk between workers)
+CACHE = DiskCache()
+
+# Define the pool of opened datasets (shared between threads of a worker)
+DATASETS = DatasetPool()
+
+# Define the cache of rendered outputs (shared on disk between workers), and the version of the renderer:
+# increase it whenever a change to the code affects the content of the PNG or PDF outputs
+ARTIFACTS = ArtifactCache()
+RENDERER_VERSION = 1
 
 # Define some global constants for the colour maps
 DEFAULT_CMAP = "RdBu_r"
 N_COLOURS = 20
+# Maximum number of (colour map, number of colours) combinations to keep the colour tables of
+COLOUR_TABLES_CACHE_SIZE = 64
 
 
 def get_colour_map(cmap_name=DEFAULT_CMAP, n_colours=-1):
@@ -22,11 +53,10 @@ def get_colour_map(cmap_name=DEFAULT_CMAP, n_colours=-1):
     Return a colour map object based on colour map name and the number of colour bins.
     Set n_colours to -1 to get a continuous colour map.
     """
-    args = [cmap_name]
+    cmap = matplotlib.colormaps[cmap_name]
     if n_colours > 1: 
-        args.append(n_colours)
+        cmap = cmap.resampled(n_colours)
 
-    cmap = plt.get_cmap(*args)
     cmap._init()
     return cmap
 
@@ -43,22 +73,111 @@ def get_colours_lookup(cmap_name=DEFAULT_CMAP, n_colours=N_COLOURS):
     """
     Based on a colour map and a number of requested colours, return a lookup dictionary of:
         - (red, green, blue): colour name
+    NOTE: The last three names are for the colours of low and high out-of-range values and of masked values.
+    Colours are named by bin with `get_colour_tables` and `get_colour_indexes`, which should be preferred.
+    """
+    tables = get_colour_tables(cmap_name, n_colours)
+    assert tables.n_colours == n_colours
+
+    return dict(zip(map(tuple, tables.lut[:, :3].tolist()), tables.names.tolist()))
+
+
+# The colour tables of a colour map. Each table has one row per colour bin, as in the lookup table of
+# the colour map: the `n_colours` colours, then the colours for low and high out-of-range values and
+# for masked values.
+#   - n_colours: number of colours in the colour map
+#   - lut: array of (red, green, blue, alpha) values
+#   - hex: array of hex strings
+#   - names: array of colour names ("colour_01", "colour_02", ...)
+ColourTables = namedtuple("ColourTables", "n_colours lut hex names")
+
+
+@lru_cache(maxsize=COLOUR_TABLES_CACHE_SIZE)
+def get_colour_tables(cmap_name=DEFAULT_CMAP, n_colours=N_COLOURS):
+    """
+    Return the `ColourTables` for a colour map and a number of colours.
+
+    The tables are built once per (cmap_name, n_colours) and then shared by all threads of the
+    process, so the arrays are read-only.
     """
     cmap = get_colour_map(cmap_name, n_colours)
-    assert cmap.N == n_colours
+    tables = ColourTables(n_colours=cmap.N, lut=cmap._lut.copy(),
+                          hex=np.array([rgba_to_hex(*rgba) for rgba in cmap._lut]),
+                          names=np.array([f"colour_{(i + 1):02d}" for i in range(len(cmap._lut))]))
+
+    for table in tables[1:]:
+        table.setflags(write=False)
+
+    return tables
+
+
+def get_colour_indexes(normalised_values, n_colours=N_COLOURS):
+    """
+    Return an integer array of the colour bin (the row in the `ColourTables`) of each normalised value,
+    calculated as a Matplotlib colour map with `n_colours` colours does: values from 0 to 1 are split
+    into `n_colours` equal bins, values below 0 or above 1 get the out-of-range bins and NaNs (or
+    masked values) get the bin for masked values.
+    """
+    values = np.ma.filled(np.ma.asarray(normalised_values, dtype="float64"), np.nan) * n_colours
+    values[values == n_colours] = n_colours - 1
+
+    under, over, bad = values < 0, values >= n_colours, np.isnan(values)
+
+    with np.errstate(invalid="ignore"):
+        indexes = values.astype(int)
+
+    indexes[under] = n_colours
+    indexes[over] = n_colours + 1
+    indexes[bad] = n_colours + 2
+    return indexes
 
-    cols = [((r, g, b), f"colour_{(i + 1):02d}") for i, (r, g, b, a) in sorted(enumerate(cmap._lut))]
-    print("NOTE: The last three rows are the colours for data low and high out-of-range values and for masked values.")
-    return dict(cols)
+
+def annual_mean(data):
+    """
+    Return the annual means of an Xarray object with a monthly time axis.
+    """
+    return data.resample(time='Y').mean()
+
+
+def is_annual(ds):
+    "Returns True if the dataset was pre-computed to hold annual means."
+    return ds.attrs.get("frequency") == "yr"
 
 
 # Now let's define a class to create a stripes dataset and plot.
 # First define some global constants
 NETCDF_PATH = "/badc/cru/data/cru_ts/cru_ts_4.08/data/tmp/cru_ts4.08.1901.2023.tmp.dat.nc"
 KERCHUNK_PATH = "/usr/local/src/vulture/vulture/stripes_lib/haduk-grid1.json"
+# Annual means of the CRU TS data, pre-computed with: `vulture precompute cru-annual`
+ANNUAL_NETCDF_PATH = os.environ.get("VULTURE_CRU_ANNUAL_PATH",
+                                    "/usr/local/src/vulture/vulture/stripes_lib/cru_ts4.08.1901.2023.tmp.annual.nc")
+# Means over the reference periods (per grid cell), pre-computed with: `vulture precompute climatology`
+CLIMATOLOGY_PATHS = {
+    False: os.environ.get("VULTURE_HADUK_CLIMATOLOGY_PATH",
+                          "/usr/local/src/vulture/vulture/stripes_lib/haduk-grid.tas.climatology.nc"),
+    True: os.environ.get("VULTURE_CRU_CLIMATOLOGY_PATH",
+                         "/usr/local/src/vulture/vulture/stripes_lib/cru_ts4.08.tmp.climatology.nc")
+}
+HADUK_GRID_VERSION = "haduk-grid-60km-v1.2.0.ceda"
+CRU_TS_VERSION = "cru_ts-4.08"
 SPATIAL_PROXIMITY_THRESHOLD = 0.05
 DEFAULT_REFERENCE_PERIOD = (1901, 2000)
+# Reference periods that can be chosen (and are pre-computed): the default and the WMO standard baselines
+REFERENCE_PERIODS = [DEFAULT_REFERENCE_PERIOD, (1961, 1990), (1971, 2000), (1981, 2010), (1991, 2020)]
 DEFAULT_MODE = False
+# Maximum number of grid cells read in one vectorised call, and of parallel rendering processes (batch mode)
+BATCH_READ_SIZE = 64
+MAX_RENDER_WORKERS = min(4, os.cpu_count() or 1)
+# How the rendering processes are started: not by forking, which would copy the threads (and held locks) of the server
+RENDER_MP_CONTEXT = "forkserver"
+# Maximum size (in bytes) of each block of data read when calculating the mean over a region
+REGION_BLOCK_BYTES = 64 * 1024 * 1024
+# Formats of the data-only outputs (see `StripesMaker.to_data`), and the columns written to them
+DATA_FORMATS = ("json", "csv")
+DATA_COLUMNS = ["years", "temp_value", "temp_demeaned", "colour", "hex_colour"]
+# Ways of writing the PDF outputs (see `StripesRenderer.to_pdf`), and the default one
+PDF_BACKENDS = ("pisa", "matplotlib")
+DEFAULT_PDF_BACKEND = os.environ.get("VULTURE_PDF_BACKEND", "pisa")
 CITATIONS = ['Met Office; Hollis, D.; McCarthy, M.; Kendon, M.; Legg, T. (2023): HadUK-Grid Gridded Climate Observations on a 60km grid over the UK, v1.2.0.ceda (1836-2022). NERC EDS Centre for Environmental Data Analysis, 30 August 2023. doi:10.5285/22df6602b5064b1686dda7e9455f86fc. <a href="https://dx.doi.org/10.5285/22df6602b5064b1686dda7e9455f86fc">https://dx.doi.org/10.5285/22df6602b5064b1686dda7e9455f86fc</a>.',
              'University of East Anglia Climatic Research Unit; Harris, I.C.; Jones, P.D.; Osborn, T. (2024): CRU TS4.08: Climatic Research Unit (CRU) Time-Series (TS) version 4.08 of high-resolution gridded data of month-by-month variation in climate (Jan. 1901- Dec. 2023). NERC EDS Centre for Environmental Data Analysis, date of citation. <a href="https://catalogue.ceda.ac.uk/uuid/715abce1604a42f396f81db83aeb2a4b/">https://catalogue.ceda.ac.uk/uuid/715abce1604a42f396f81db83aeb2a4b/</a>.']
 
@@ -83,215 +202,579 @@ class StripesMaker:
     To specify a time range and a different number of colours and a blue-green colour map:
     >>> stripes_maker.create(51.23, -1.23, n_colours=10, cmap_name="winter", time_range=(1950, 2010), 
                output_file="new-stripes.png")
+
+    To use the mean over a region (a bounding box or a polygon) instead of a single location:
+    >>> stripes_maker.create_for_region(Region.from_bbox(-2.5, 51.0, -0.5, 52.5))
     """
 
     def __init__(self, global_mode=DEFAULT_MODE, kerchunk_path=KERCHUNK_PATH, 
                 netcdf_path=NETCDF_PATH,
+                annual_netcdf_path=ANNUAL_NETCDF_PATH,
+                climatology_path=None,
                 spatial_threshold=SPATIAL_PROXIMITY_THRESHOLD,
                 reference_period=DEFAULT_REFERENCE_PERIOD,
                 cmap_name=DEFAULT_CMAP,
-                n_colours=N_COLOURS):
+                n_colours=N_COLOURS,
+                cache=None):
 
         self.netcdf_path = netcdf_path
+        self.annual_netcdf_path = annual_netcdf_path
         self.kerchunk_path = kerchunk_path
+        self.climatology_path = CLIMATOLOGY_PATHS[global_mode] if climatology_path is None else climatology_path
         self.spatial_threshold = spatial_threshold
         self.reference_period = reference_period
         self.cmap_name = cmap_name
         self.n_colours = n_colours
         self.global_mode = global_mode
+        self.cache = CACHE if cache is None else cache
 
         self.latest_df = None
         self.latest_plot = None
+        self.latest_png = None
         self.latest_request = None
 
-    def _check_location_is_near(self, lat, lon, point_ds, ds):
+    def _check_location_is_near(self, lat, lon, match):
         """
-        Checks that selected eastings and northings (in BNG coordinates) are within the lat/lon threshold of
-        the `lat` and `lon` requested by the user.
+        Checks that the grid cell centre found by a spatial index lookup (a `CellMatch`) is within
+        the lat/lon threshold of the `lat` and `lon` requested by the user.
     
-        Raises an exception if outside the acceptable threshold.
+        Raises a `LocationOutOfRangeError` if outside the acceptable threshold.
     
-        Returns tuple of: (eastings, northings)
+        Returns the `CellMatch`.
         """
-        y = float(point_ds.projection_y_coordinate.values)
-        x = float(point_ds.projection_x_coordinate.values)
-        
-        lat_diff = abs(float(ds.latitude.sel(projection_y_coordinate=y, projection_x_coordinate=x)) - lat)
-        lon_diff = abs(float(ds.longitude.sel(projection_y_coordinate=y, projection_x_coordinate=x)) - lon)
-    
-        assert lat_diff < self.spatial_threshold, f"Lat diff is too big: {lat_diff}"
-        assert lon_diff < self.spatial_threshold, f"Lon diff is too big: {lon_diff}"
-    
-        return (x, y)
+        lat_diff = abs(match.lat - lat)
+        lon_diff = abs(match.lon - lon)
+
+        if lat_diff >= self.spatial_threshold or lon_diff >= self.spatial_threshold:
+            raise LocationOutOfRangeError(
+                f"The requested location ({lat}, {lon}) is outside the area covered by the data. "
+                f"The nearest grid box centre is {match.distance:.1f} km away, at ({match.lat:.4f}, {match.lon:.4f}).")
+
+        return match
+
+    @property
+    def dataset_version(self):
+        "Identifier of the dataset (and its version) that this instance reads from."
+        return CRU_TS_VERSION if self.global_mode else HADUK_GRID_VERSION
+
+    @property
+    def source_path(self):
+        """
+        Path to the file that the data is read from.
+        In global mode, the pre-computed annual means are used if they exist.
+        """
+        if not self.global_mode:
+            return self.kerchunk_path
+
+        if self.annual_netcdf_path and os.path.isfile(self.annual_netcdf_path):
+            return self.annual_netcdf_path
+
+        return self.netcdf_path
+
+    @staticmethod
+    def _open_netcdf(path):
+        return xr.open_dataset(path, use_cftime=True, decode_timedelta=False)
 
+    @staticmethod
+    def _open_kerchunk(path):
+        backend_args = {"consolidated": False, "storage_options": {"fo": path}}
+        return xr.open_dataset("reference://", engine="zarr", backend_kwargs=backend_args)
 
-    def _extract_time_series_at_location(self, lat, lon, years=None, ref_period=DEFAULT_REFERENCE_PERIOD):
+    def _open_dataset(self):
         """
-        Read the data from the data files.
+        Return a `DatasetHandle` holding the (lazily loaded) Xarray `Dataset` to read from.
+        Datasets are opened once per process and then reused from the pool.
+        """
+        if self.global_mode:
+            print("Opening dataset...")
+            return DATASETS.get(self.source_path, self._open_netcdf)
+
+        # Create an Xarray dataset that will read from the NetCDF data files
+        print("opening kerchunk...need bigger arrays and specify duplicate coords and lat lon from each")
+        return DATASETS.get(self.kerchunk_path, self._open_kerchunk)
+
+    def _get_spatial_index(self, handle):
+        """
+        Return the `SpatialIndex` of the grid cell centres (built once per dataset).
+        """
+        lat_var, lon_var = ("lat", "lon") if self.global_mode else ("latitude", "longitude")
+        return handle.derived("spatial_index", lambda ds: SpatialIndex.from_dataset(ds, lat_var, lon_var))
+
+    def _get_valid_cell_lookup(self, handle):
+        """
+        Return the lookup grid that maps each grid cell to the nearest cell with valid data (see
+        `SpatialIndex.valid_cell_lookup`), so that locations on the coast or at sea are redirected to a
+        land cell without reading any more data. The land mask is taken from the first time step.
+
+        The lookup is built once per dataset and saved in the cache, so other workers load it from there.
+        """
+        def _build(ds):
+            key = make_key(self.dataset_version, handle.path, handle.mtime, "valid_cell_lookup")
+            data = self.cache.get(key)
+
+            if data is None:
+                print("Building the lookup of grid cells with valid data...")
+                index = self._get_spatial_index(handle)
+                var = ds.tmp if self.global_mode else ds.tas
+                valid = var.isel(time=0).transpose(*index.dims).notnull().values
+                data = {"lookup": index.valid_cell_lookup(valid)}
+                self.cache.put(key, data)
+
+            return data["lookup"]
+
+        return handle.derived("valid_cell_lookup", _build)
+
+    def _resolve_grid_cell(self, handle, lat, lon, match=None):
+        """
+        Find the grid cell with valid data nearest to the requested location, using the spatial index
+        of the dataset (unless the `CellMatch` has already been looked up).
         Return a dictionary containing keys:
-            - temp_series: the extracted temperature series
-            - demeaned_temp_series: the temperature series with the mean of the reference period subtracted
-            - eastings: actual easting of grid box centre (British National Grid)
-            - northings: actual northing of grid box centre (British National Grid)
+            - index: dictionary of {dimension: integer index} of the grid cell
+            - eastings: actual easting of grid box centre (British National Grid, UK mode only)
+            - northings: actual northing of grid box centre (British National Grid, UK mode only)
             - lat: actual latitude of grid box centre
             - lon: actual longitude of grid box centre
+            - distance: distance (km) from the requested location to the grid box centre
         """
+        if match is None:
+            print("Getting the closest grid point...")
+            match = self._get_spatial_index(handle).nearest(lat, lon, lookup=self._get_valid_cell_lookup(handle))
 
-        print("extract nearest grid point (with time subset if specified)...")
-        #start_year, end_year = (str(years[0]), str(years[1])) if years \
-        #                        else (str(ds.time.min().dt.year.values), str(ds.time.max().dt.year.values))
+        if not self.global_mode:
+            # Check the chosen location is near the requested location
+            print("check data point is close enough to the requested location (within spatial threshold)...")
+            self._check_location_is_near(lat, lon, match)
 
-        response = dict()
+        cell = match._asdict()
 
         if not self.global_mode:
-            # Create an Xarray dataset that will read from the NetCDF data files
-            print("opening kerchunk...need bigger arrays and specify duplicate coords and lat lon from each")
-            backend_args = {"consolidated": False, "storage_options": {"fo": self.kerchunk_path}}
-            ds = xr.open_dataset("reference://", engine="zarr", backend_kwargs=backend_args)
+            ds = handle.ds
+            cell['eastings'] = float(ds.projection_x_coordinate[match.index["projection_x_coordinate"]])
+            cell['northings'] = float(ds.projection_y_coordinate[match.index["projection_y_coordinate"]])
 
-            start_year, end_year = (str(years[0]), str(years[1])) if years \
-                                else (str(ds.time.min().dt.year.values), str(ds.time.max().dt.year.values))
+        return cell
 
-            print("convert to northings, eastings...")
-            requested_eastings, requested_northings = [i[0] for i in convert_bng(lon, lat)] 
+    def _get_reference_mean(self, cell):
+        """
+        Return the mean over the reference period for a grid cell (as returned by `_resolve_grid_cell`),
+        looked up in the pre-computed climatology file. The climatology for each reference period is
+        held in memory once loaded.
 
-            temp_series = ds.tas.sel(projection_y_coordinate=requested_northings, 
-                                 projection_x_coordinate=requested_eastings,
-                                 method="nearest").sel(time=slice(start_year, end_year))
-    
-            # Check the chosen location is near the requested location
-            print("check data point is close enough to the requested location (within spatial threshold)...")
-            actual_eastings, actual_northings = self._check_location_is_near(lat, lon, temp_series, ds)
+        Returns None if there is no climatology for this dataset and reference period.
+        """
+        if not self.climatology_path or not os.path.isfile(self.climatology_path):
+            return None
 
-            response['eastings'] = actual_eastings
-            response['northings'] = actual_northings
-            response['lat'] = float(ds.latitude.sel(projection_y_coordinate=actual_northings, projection_x_coordinate=actual_eastings))
-            response['lon'] = float(ds.longitude.sel(projection_y_coordinate=actual_northings, projection_x_coordinate=actual_eastings))
-            
+        handle = DATASETS.get(self.climatology_path, self._open_netcdf)
+        ds = handle.ds
 
-        else:
-            print("Opening dataset...")
-            ds = xr.open_dataset(self.netcdf_path, use_cftime=True, decode_timedelta=False)
-            start_year, end_year = (str(years[0]), str(years[1])) if years \
-                                else (str(ds.time.min().dt.year.values), str(ds.time.max().dt.year.values))
+        if ds.attrs.get("dataset_version") != self.dataset_version:
+            return None
 
-            print("Resampling dataset...")
-            ds = ds.resample(time='Y').mean()
+        periods = list(zip(ds.period_start.values.tolist(), ds.period_end.values.tolist()))
+        reference_period = tuple(self.reference_period)
 
-            print("Getting the closest points...")
-            temp_series = ds.tmp.sel(lon=lon, 
-                                 lat=lat, method='nearest').sel(time=slice(start_year, end_year))
+        if reference_period not in periods:
+            return None
 
+        i = periods.index(reference_period)
+        climatology = handle.derived(f"climatology_{i}", lambda ds: ds.climatology.isel(period=i).load())
+        return float(climatology.isel(**cell["index"]))
 
-            if temp_series.isnull().any():
-                temp_series = ds.tmp.sel(lon=slice(lon - 0.5, lon + 0.5), lat=slice(lat - 0.5, lat + 0.5), time=slice(start_year, end_year))
-                temp_series = temp_series.where(~xr.ufuncs.isnan(temp_series))
-                temp_series = temp_series.mean(dim=["lat", "lon"])
+    def _extract_time_series_at_location(self, ds, cell):
+        """
+        Read the full annual temperature series for a grid cell (as returned by `_resolve_grid_cell`)
+        from the data files. Returns an Xarray `DataArray`.
+        """
+        print("extract grid point for the full time span...")
 
-            response['lat'] = lat
-            response['lon'] = lon
-        
-        # Get mean over reference period
-        print("calculate the mean over the reference period...")
-        reference_mean = temp_series.sel(time=slice(str(ref_period[0]), str(ref_period[1]))).mean()
+        if not self.global_mode:
+            temp_series = ds.tas.isel(**cell["index"])
+
+        else:
+            # Select the point (lazily) before any reduction, so only that column is read
+            temp_series = ds.tmp.isel(**cell["index"]).load()
 
-        response['temp_series'] = temp_series.squeeze().compute().astype('float64')
-        response['demeaned_temp_series'] = (temp_series - reference_mean).squeeze().compute().astype('float64')
+            if not is_annual(ds):
+                temp_series = annual_mean(temp_series)
 
         print("Returning data objects...")
+        return temp_series.squeeze().compute().astype('float64')
+
+    def _extract_time_series_at_locations(self, ds, cells):
+        """
+        Read the full annual temperature series for many grid cells (as returned by `_resolve_grid_cell`).
+        The cells are read in batches with vectorised indexing, so each batch reads the data it needs
+        in one call. Returns a list of Xarray `DataArray`s (one per cell).
+        """
+        var = ds.tmp if self.global_mode else ds.tas
+        dims = list(cells[0]["index"]) if cells else []
+
+        # Sort the cells so that neighbouring cells are read in the same batch
+        order = sorted(range(len(cells)), key=lambda i: [cells[i]["index"][dim] for dim in dims])
+        results = [None] * len(cells)
+
+        for start in range(0, len(order), BATCH_READ_SIZE):
+            batch = order[start:start + BATCH_READ_SIZE]
+            print(f"extract {len(batch)} grid points for the full time span...")
+
+            indexers = {dim: xr.DataArray([cells[i]["index"][dim] for i in batch], dims="cell") for dim in dims}
+            block = var.isel(**indexers).load()
 
-        return response
+            if self.global_mode and not is_annual(ds):
+                block = annual_mean(block)
+
+            for position, i in enumerate(batch):
+                results[i] = block.isel(cell=position).squeeze().astype('float64')
+
+        return results
+
+    def _get_cell_series(self, lat, lon):
+        """
+        Return a dictionary containing the full annual series for the grid cell nearest to `lat` and `lon`:
+            - years: array of years
+            - temp_values: array of annual temperature values
+            - plus the grid cell details returned by `_resolve_grid_cell`
+
+        Series are cached per grid cell, so any request that resolves to the same grid cell (whatever its
+        time range or colours) is read from the data files only once (until the file is modified).
+        """
+        handle = self._open_dataset()
+        cell = self._resolve_grid_cell(handle, lat, lon)
+        key = make_key(self.dataset_version, self.source_path, handle.mtime, sorted(cell["index"].items()))
+
+        # Use the cache if the data for this grid cell has already been extracted
+        data = self.cache.get(key)
+
+        if data is not None:
+            print("Loading from cache...")
+        else:
+            print("Loading from file...")
+            temp_series = self._extract_time_series_at_location(handle.ds, cell)
+            data = {"years": temp_series.time.dt.year.values, "temp_values": temp_series.values}
+            print("Saving to cache...")
+            self.cache.put(key, data)
+
+        data.update(cell)
+        data["reference_mean"] = self._get_reference_mean(cell)
+        return data
+
+    def _get_cell_series_many(self, locations):
+        """
+        Return a list with one entry per (lat, lon) in `locations`: either a dictionary as returned by
+        `_get_cell_series`, or a `LocationOutOfRangeError` if the location is outside the data.
+
+        All locations are resolved with a single spatial index query, and the grid cells that are
+        not already cached are read together (see `_extract_time_series_at_locations`).
+        """
+        handle = self._open_dataset()
+        lats, lons = [np.array([loc[i] for loc in locations], dtype="float64") for i in (0, 1)]
+        matches = self._get_spatial_index(handle).query(lats, lons, lookup=self._get_valid_cell_lookup(handle))
+
+        cells, keys, series = [], [], {}
+
+        for i, (lat, lon) in enumerate(zip(lats, lons)):
+            match = CellMatch(index={dim: int(index[i]) for dim, index in matches.index.items()},
+                              lat=float(matches.lat[i]), lon=float(matches.lon[i]),
+                              distance=float(matches.distance[i]))
+            try:
+                cell = self._resolve_grid_cell(handle, lat, lon, match=match)
+            except LocationOutOfRangeError as exc:
+                cells.append(exc)
+                keys.append(None)
+                continue
+
+            key = make_key(self.dataset_version, self.source_path, handle.mtime, sorted(cell["index"].items()))
+            cells.append(cell)
+            keys.append(key)
+
+            if key not in series:
+                series[key] = self.cache.get(key)
+
+        missing = [key for key, data in series.items() if data is None]
+        print(f"Loading {len(series) - len(missing)} grid points from cache and {len(missing)} from file...")
+
+        if missing:
+            missing_cells = [cells[keys.index(key)] for key in missing]
+
+            for key, temp_series in zip(missing, self._extract_time_series_at_locations(handle.ds, missing_cells)):
+                series[key] = {"years": temp_series.time.dt.year.values, "temp_values": temp_series.values}
+                self.cache.put(key, series[key])
+
+        return [cell if key is None else dict(series[key], reference_mean=self._get_reference_mean(cell), **cell)
+                for cell, key in zip(cells, keys)]
+
+    def _get_region_weights(self, handle, region):
+        """
+        Find the grid cells with centres inside `region`. Returns a tuple of:
+            - indexers: dictionary of {dimension: slice} of the smallest window holding all those cells
+            - weights: 2-D array of the weight of each cell in the window (zero outside the region)
+
+        Global (CRU TS) cells are weighted by the cosine of their latitude, to account for their area.
+        UK (HadUK-Grid) cells are on the British National Grid, so they all have the same area.
+
+        Raises a `LocationOutOfRangeError` if there are no grid cells in the region.
+        """
+        index = self._get_spatial_index(handle)
+        mask = region.contains(index.lats, index.lons)
+
+        if not mask.any():
+            raise LocationOutOfRangeError(
+                "The requested region does not contain any grid box centres. "
+                "Please choose a larger region, or a single location.")
+
+        rows, cols = np.nonzero(mask)
+        window = (slice(rows.min(), rows.max() + 1), slice(cols.min(), cols.max() + 1))
+        weights = mask[window].astype("float64")
+
+        if self.global_mode:
+            weights *= np.cos(np.radians(index.lats[window]))
+
+        return dict(zip(index.dims, window)), weights
+
+    def _extract_region_mean(self, handle, region):
+        """
+        Calculate the (area-weighted) mean temperature series over `region`.
+
+        The data is read in blocks of time steps, each no larger than `REGION_BLOCK_BYTES`, and reduced
+        to a weighted sum before the next block is read, so the memory used does not depend on the
+        length of the series. Missing values (e.g. over the sea) are left out of the mean.
+        Returns an Xarray `DataArray` of annual values.
+        """
+        ds = handle.ds
+        indexers, weights = self._get_region_weights(handle, region)
+        var = (ds.tmp if self.global_mode else ds.tas).isel(**indexers).transpose("time", *indexers)
+
+        # Read whole chunks (along the time axis) at a time where the memory limit allows it
+        n_times = var.sizes["time"]
+        block_size = max(1, REGION_BLOCK_BYTES // (weights.size * 8))
+        chunks = var.encoding.get("chunksizes") or var.encoding.get("chunks")
+
+        if chunks and chunks[0] <= block_size:
+            block_size -= block_size % chunks[0]
+
+        sums, totals = np.zeros(n_times), np.zeros(n_times)
+        print(f"extract mean over {int((weights > 0).sum())} grid points for the full time span...")
+
+        for start in range(0, n_times, block_size):
+            end = min(start + block_size, n_times)
+            block = var.isel(time=slice(start, end)).values.astype("float64")
+            valid = ~np.isnan(block)
+
+            sums[start:end] = np.where(valid, block, 0).reshape(end - start, -1) @ weights.ravel()
+            totals[start:end] = valid.reshape(end - start, -1) @ weights.ravel()
+
+        if not totals.any():
+            raise LocationOutOfRangeError(
+                "The requested region returned no valid data. Please check that your selection included land points.")
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            temp_series = xr.DataArray(sums / totals, coords={"time": var.time}, dims="time")
+
+        if self.global_mode and not is_annual(ds):
+            temp_series = annual_mean(temp_series)
+
+        return temp_series
+
+    def _get_region_series(self, region):
+        """
+        Return a dictionary containing the full annual series of the mean over `region`:
+            - years: array of years
+            - temp_values: array of annual temperature values
+        Series are cached per region, in the same way as for grid cells (see `_get_cell_series`).
+        """
+        handle = self._open_dataset()
+        key = make_key(self.dataset_version, self.source_path, handle.mtime, "region", region.key)
+        data = self.cache.get(key)
+
+        if data is not None:
+            print("Loading from cache...")
+        else:
+            print("Loading from file...")
+            temp_series = self._extract_region_mean(handle, region)
+            data = {"years": temp_series.time.dt.year.values, "temp_values": temp_series.values}
+            print("Saving to cache...")
+            self.cache.put(key, data)
+
+        return data
+
+    def create_for_region(self, region, n_colours=N_COLOURS, cmap_name=DEFAULT_CMAP, time_range=None,
+                          output_file="climate-stripes.png", range_buffer=0.2, render=True):
+        """
+        Creates both a plot and a dataset (as a `pandas DataFrame`) from the mean over a `Region`.
+        Takes the same arguments as `create`. Returns a `pandas.DataFrame` object.
+        """
+        data = self._get_region_series(region)
+        return self._create_from_series(None, None, data, n_colours=n_colours, cmap_name=cmap_name,
+                                        time_range=time_range, output_file=output_file,
+                                        range_buffer=range_buffer, region=region, render=render)
 
     def create(self, lat, lon, n_colours=N_COLOURS, cmap_name=DEFAULT_CMAP, time_range=None, 
-               output_file="climate-stripes.png", range_buffer=0.2):
+               output_file="climate-stripes.png", range_buffer=0.2, render=True):
         """
         Creates both a plot and a dataset (as a `pandas DataFrame`) based on input requirements.
         
         NOTE: range_buffer can be modified to ensure that the colours are all within range of the cmap.
+        Set `render` to False to only create the dataset (without drawing the plot).
+        Returns a `pandas.DataFrame` object.
+        """
+        data = self._get_cell_series(lat, lon)
+        return self._create_from_series(lat, lon, data, n_colours=n_colours, cmap_name=cmap_name,
+                                        time_range=time_range, output_file=output_file, range_buffer=range_buffer,
+                                        render=render)
+
+    def create_data(self, lat=None, lon=None, region=None, n_colours=N_COLOURS, cmap_name=DEFAULT_CMAP,
+                    time_range=None, range_buffer=0.2):
+        """
+        Creates the dataset only (without drawing the plot), for a location (`lat` and `lon`) or a `region`.
+        This is much quicker than `create`, for clients that draw the stripes themselves: write the
+        dataset out with `to_data`. Returns a `pandas.DataFrame` object.
+        """
+        kwargs = {"n_colours": n_colours, "cmap_name": cmap_name, "time_range": time_range,
+                  "output_file": None, "range_buffer": range_buffer, "render": False}
+
+        if region:
+            return self.create_for_region(region, **kwargs)
+
+        return self.create(lat, lon, **kwargs)
+
+    def _create_from_series(self, lat, lon, data, n_colours=N_COLOURS, cmap_name=DEFAULT_CMAP, time_range=None,
+                            output_file="climate-stripes.png", range_buffer=0.2, region=None, render=True):
+        """
+        Creates the plot and the dataset from the full annual series of a grid cell
+        (as returned by `_get_cell_series`), or of a `region` (as returned by `_get_region_series`).
+        The PNG image is kept in memory (as `self.latest_png`), and written to `output_file` (if given).
+        If `render` is False, only the dataset is created (and `self.latest_png` is None).
         Returns a `pandas.DataFrame` object.
         """
         self.cmap_name = cmap_name or self.cmap_name
         time_range = tuple(time_range) if time_range else time_range
 
         n_colours = n_colours if n_colours > 0 else self.n_colours
-        args = (lat, lon, n_colours, cmap_name, range_buffer, time_range)
+        all_years, all_values = data["years"], data["temp_values"]
 
-        # Use the cache if the request has already been made
-        if args in CACHE.keys():
-            print("Loading from cache...")
-            data = CACHE[args]
-        else:
-            print("Loading from file...")
-            resp = self._extract_time_series_at_location(lat, lon, time_range)
-            years = resp["temp_series"].time.dt.year
-        
-            actual_values = resp["temp_series"].values
-            stripes_data = resp["demeaned_temp_series"].values
-            data = {"years": years, "actual_values": actual_values, "stripes_data": stripes_data}
-            print("Saving to cache...")
-            CACHE[args] = data
+        # Get mean over reference period (unless it was looked up in the pre-computed climatology)
+        reference_mean = data.get("reference_mean")
+
+        if reference_mean is None:
+            print("calculate the mean over the reference period...")
+            ref_start, ref_end = self.reference_period
+            reference_mean = all_values[(all_years >= ref_start) & (all_years <= ref_end)].mean()
+
+        # Subset to the requested time range in memory
+        in_range = (all_years >= time_range[0]) & (all_years <= time_range[1]) if time_range \
+                    else np.ones(all_years.shape, dtype=bool)
+
+        years, actual_values = all_years[in_range], all_values[in_range]
+        stripes_data = actual_values - reference_mean
 
         self.latest_request = {
-            "lat": lat, "lon": lon, "n_colours": n_colours,
-            "cmap_name": cmap_name, "time_range": (time_range or (int(data["years"].min()), int(data["years"].max())))
+            "lat": lat, "lon": lon, "region": (region.description if region else None),
+            "cell": ({key: data[key] for key in ("lat", "lon", "distance")} if "distance" in data else None),
+            "n_colours": n_colours, "reference_period": tuple(self.reference_period),
+            "cmap_name": cmap_name, "time_range": (time_range or (int(years.min()), int(years.max())))
         }
         
-        print("Downloaded data...")
-        # Unpack dictionary
-        years, actual_values, stripes_data = data["years"], data["actual_values"], data["stripes_data"]
-    
         print("Min and max:", stripes_data.min(), stripes_data.max())
     
         # Add a buffer around the lower and upper boundaries - to use only values within the colourmap
-        normalised_data = plt.Normalize(stripes_data.min() - range_buffer, stripes_data.max() + range_buffer)
-        cmap = get_colour_map(self.cmap_name, n_colours)
-        
-        fig, ax = plt.subplots(figsize=(10, 2))
-        
-        print("Starting plot")
-    
-        colours = []
-        
-        for i in range(stripes_data.shape[0]):
-            actual_value = actual_values[i]
-            year = years[i]
-            normalised_value = normalised_data(stripes_data[i])
-            rgba_colour = cmap(normalised_value)
-            colours.append(rgba_colour)
-    
-            # collected.append([actual_value, normalised_value, colour])
-            ax.axvspan(
-                xmin=i - 0.5, xmax=i + 0.5, color=rgba_colour
-            )
-        
-        ax.axis("off")
-        plt.savefig(output_file)
-        print(f"Saved image file: {output_file}")
-        self.latest_plot = output_file
+        normalised_data = Normalize(stripes_data.min() - range_buffer, stripes_data.max() + range_buffer)
+        tables = get_colour_tables(self.cmap_name, n_colours)
+
+        # Find the colour bin of every year at once, then look everything else up from the colour tables
+        colour_indexes = get_colour_indexes(normalised_data(stripes_data), tables.n_colours)
+        colours = tables.lut[colour_indexes]
+
+        self.latest_png = None
+        self.latest_plot = None
+
+        if render:
+            print("Starting plot")
+            self.latest_png = render_stripes(colours, BytesIO()).getvalue()
+            self.latest_plot = output_file
+
+            if output_file:
+                with open(output_file, "wb") as writer:
+                    writer.write(self.latest_png)
+                print(f"Saved image file: {output_file}")
 
         df = pd.DataFrame({
             "years": years,
             "temp_value": actual_values,
             "temp_demeaned": stripes_data,
-            "hex_colour": [rgba_to_hex(r, g, b) for (r, g, b, a) in colours],
-            "red": [col[0] for col in colours],
-            "green": [col[1] for col in colours],
-            "blue": [col[2] for col in colours]
+            "hex_colour": tables.hex[colour_indexes],
+            "red": colours[:, 0],
+            "green": colours[:, 1],
+            "blue": colours[:, 2]
         })
 
-        self.latest_df = self._extend_dataframe(df, cmap_name, n_colours)
+        self.latest_df = self._extend_dataframe(df, tables.names[colour_indexes])
         return self.latest_df
 
-    def _extend_dataframe(self, df, cmap_name, n_colours):
+    def _extend_dataframe(self, df, colour_names):
         """
-        Extends and returns the DataFrame with "colour_block" and "colour" columns.
+        Extends and returns the DataFrame with "colour_block" and "colour" (the `colour_names`) columns.
         "colour_block" is empty - ready for highlighted rendering with `.show_table()`.
         """
-        col_lookup = get_colours_lookup(cmap_name, n_colours)
         df["colour_block"] = ""
-        df.loc[:, "colour"] = df.apply(lambda row: col_lookup[(row["red"], row["green"], row["blue"])], axis=1)
+        df["colour"] = colour_names
+        return df
+
+    def _get_data_frame(self):
+        "Return the columns of the latest data table that are written by `to_json` and `to_csv`."
+        df = self.latest_df[DATA_COLUMNS].copy()
+        float_cols = df.select_dtypes("float").columns
+        df[float_cols] = df[float_cols].round(5)
         return df
 
+    def to_data(self, data_format="json", data_file=None):
+        """
+        Return the latest dataset in `data_format`: one of `DATA_FORMATS` (see `to_json` and `to_csv`).
+        Or write to `data_file` if defined, and return its path.
+        """
+        if data_format not in DATA_FORMATS:
+            raise ValueError(f"Unknown data format: {data_format}. Please use one of: {', '.join(DATA_FORMATS)}.")
+
+        return getattr(self, f"to_{data_format}")(data_file)
+
+    def to_json(self, json_file=None):
+        """
+        Return the latest dataset as compact JSON (or write to `json_file` if defined, and return its path).
+
+        The JSON object holds the details of the request, one list per column (years, temperature values,
+        differences from the average and colour names) and a lookup of the hex code of each colour name.
+        Missing values are written as null.
+        """
+        df = self._get_data_frame()
+        request = dict(self.latest_request, dataset=self.dataset_version)
+        colours = dict(zip(df["colour"], df.pop("hex_colour")))
+
+        data = {"request": request, "colours": dict(sorted(colours.items()))}
+        data.update({col: df[col].astype(object).where(df[col].notna(), None).tolist() for col in df.columns})
+
+        content = json.dumps(data, separators=(",", ":"), default=_to_json_value)
+
+        if json_file:
+            with open(json_file, "w", encoding="utf-8") as writer:
+                writer.write(content)
+            return json_file
+
+        return content
+
+    def to_csv(self, csv_file=None):
+        """
+        Return the latest dataset as CSV, with one row per year (or write to `csv_file` if defined,
+        and return its path).
+        """
+        content = self._get_data_frame().to_csv(index=False, lineterminator="\n")
+
+        if csv_file:
+            with open(csv_file, "w", encoding="utf-8") as writer:
+                writer.write(content)
+            return csv_file
+
+        return content
+
     def _get_colour_mapping(self, df):
         tmp_df = df[["colour", "hex_colour"]].drop_duplicates().sort_values("colour")
         dct = pd.Series(tmp_df.hex_colour.values, index=tmp_df.colour).to_dict()
@@ -326,12 +809,72 @@ class StripesMaker:
         return Image(self.latest_plot)
     
     def clear_cache(self):
-        "Empties global cache dictionary."
-        keys = list(CACHE.keys())
+        "Empties the cache of extracted time series."
+        self.cache.clear()
+
+
+def _to_json_value(value):
+    "Convert the NumPy values in a request (see `StripesMaker.latest_request`) for writing as JSON."
+    if isinstance(value, np.generic):
+        return value.item()
 
-        for key in keys:
-            del CACHE[key]
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def warm_datasets():
+    """
+    Open the datasets (for both UK and global modes) into the pool and build their spatial indexes
+    and valid cell lookups, so that the first request does not have to pay for it.
+    Datasets that cannot be found are skipped. Returns a list of the paths that were opened.
+    """
+    opened = []
 
+    for global_mode in (False, True):
+        stripes_maker = StripesMaker(global_mode=global_mode)
+
+        try:
+            stripes_maker._get_valid_cell_lookup(stripes_maker._open_dataset())
+            opened.append(stripes_maker.source_path)
+        except Exception as exc:
+            print(f"Could not open dataset: {stripes_maker.source_path}: {exc}")
+
+    return opened
+
+
+def benchmark_pdf_backends(stripes_renderer, backends=PDF_BACKENDS, repeats=3, project_name=None):
+    """
+    Time writing the PDF for the latest stripes created by `stripes_renderer` with each of the `backends`.
+    Returns a dictionary of {backend: {"seconds": <mean time>, "peak_memory_mib": <peak memory allocated
+    while writing the PDF>, "size_bytes": <size of the PDF>}}.
+    """
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for backend in backends:
+            pdf_file = stripes_renderer.to_pdf(os.path.join(tmp_dir, f"{backend}.pdf"),
+                                               project_name=project_name, backend=backend)
+
+            start = time.perf_counter()
+            for _ in range(repeats):
+                stripes_renderer.to_pdf(pdf_file, project_name=project_name, backend=backend)
+            seconds = (time.perf_counter() - start) / repeats
+
+            tracemalloc.start()
+            try:
+                stripes_renderer.to_pdf(pdf_file, project_name=project_name, backend=backend)
+                peak_memory = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+            results[backend] = {"seconds": seconds, "peak_memory_mib": peak_memory / 2 ** 20,
+                                "size_bytes": os.path.getsize(pdf_file)}
+
+    return results
+
+
+ADDITIONAL_INFORMATION = """If you like this please share with friends and family! You can point them towards our page 
+https://www.ceda.ac.uk/outreach where there's some more resources, links to further information 
+and a place for you to share anything cool you do with this!"""
 
 HTML_TEMPLATE = """<html>
 <head>
@@ -346,8 +889,9 @@ HTML_TEMPLATE = """<html>
 <body>
     <h1>Climate Stripes for:</h1>
     {project}
-    <p>Latitude: {lat}&deg;,  Longitude: {lon}&deg;.</p>
+    <p>{location}</p>
     <p>Time period: {time_range}</p>
+    <p>Reference period (for the average): {reference_period[0]}-{reference_period[1]}</p>
     <p>Using: {n_colours} colours</p>
     </br/>
     <img src="{png_file}" />
@@ -366,82 +910,191 @@ HTML_TEMPLATE = """<html>
 <p>{citation}</p>
 
 <h1>Additional information</h1>
-<p>If you like this please share with friends and family! You can point them towards our page 
-https://www.ceda.ac.uk/outreach where there's some more resources, links to further information 
-and a place for you to share anything cool you do with this!</p>
+<p>{additional_information}</p>
 
 </body>
 </html>"""
 
 
+# Columns shown in each table of the HTML/PDF outputs
+TABLE_COLUMNS = {
+    1: "years temp_value temp_demeaned hex_colour red green blue colour".split(),
+    2: ["colour", "colour_count"]
+}
+
+
+def _format_column(values, escape=True):
+    """
+    Format a table column as strings (floats are rounded to 5 decimal places), HTML-escaped if `escape` is True.
+    """
+    if pd.api.types.is_float_dtype(values):
+        values = values.round(5)
+
+    values = values.astype(str)
+    return values.map(html.escape) if escape else values
+
+
+def _html_to_text(content):
+    "Convert a snippet of HTML (as used in the report) to plain text."
+    return html.unescape(re.sub(r"<[^>]+>", "", content))
+
+
 # Create an extension to write to HTML and PDF outputs
 
 class StripesRenderer(StripesMaker):
-    
-    def _get_table(self, table):
+
+    def __init__(self, *args, artifacts=None, **kwargs):
+        """
+        Takes the same arguments as `StripesMaker`, and `artifacts`: the `ArtifactCache` of rendered
+        outputs used by `create_outputs` (default: `ARTIFACTS`).
+        """
+        super().__init__(*args, **kwargs)
+        self.artifacts = ARTIFACTS if artifacts is None else artifacts
+
+    def create_outputs(self, png_file=None, pdf_file=None, lat=None, lon=None, region=None, n_colours=N_COLOURS,
+                       cmap_name=DEFAULT_CMAP, time_range=None, range_buffer=0.2, project_name=None, backend=None):
+        """
+        Creates the stripes for a location (`lat` and `lon`) or a `region`, and writes the PNG and PDF
+        outputs to `png_file` and `pdf_file`. Either can be None, so that only the other one is made
+        (without a `pdf_file`, no HTML or PDF content is generated).
+
+        Each output is stored in the cache of rendered outputs, under a key made from everything that
+        affects it. Outputs of identical requests are served from the cache (by linking the stored files
+        to `png_file` and `pdf_file`) without rendering them again. If all of them are found, no data is read
+        at all. Outputs with missing values are not cached.
+
+        Returns a `pandas.DataFrame` object (as `create`), or None if all the outputs came from the cache.
+        """
+        backend = backend or DEFAULT_PDF_BACKEND
+        location = region.key if region else [lat, lon]
+
+        # The files the data and the reference mean are read from are identified by their modification time,
+        # so that outputs made from an older version of either are not served
+        png_key = make_key(RENDERER_VERSION, self.dataset_version, _get_file_stamp(self.source_path),
+                           _get_file_stamp(self.climatology_path), list(self.reference_period),
+                           location, n_colours, cmap_name, list(time_range) if time_range else None, range_buffer)
+        # The PDF also depends on the project name and the way it is written
+        pdf_key = make_key(png_key, project_name, backend)
+
+        outputs = {name: (key, path) for name, key, path in (("png", png_key, png_file), ("pdf", pdf_key, pdf_file))
+                   if path}
+        missing = {name: (key, path) for name, (key, path) in outputs.items()
+                   if not self.artifacts.fetch(key, {name: path})}
+
+        if not missing:
+            print(f"Outputs found in cache: {', '.join(path for _, path in outputs.values())}")
+            return None
+
+        # Remove any existing outputs (which may be linked to the cache) rather than overwriting them
+        for _, path in missing.values():
+            if os.path.exists(path):
+                os.remove(path)
+
+        # The image is always drawn (the PDF includes it), but only written out if it is missing
+        kwargs = {"n_colours": n_colours, "cmap_name": cmap_name, "time_range": time_range,
+                  "output_file": (png_file if "png" in missing else None), "range_buffer": range_buffer}
+
+        if region:
+            df = self.create_for_region(region, **kwargs)
+        else:
+            df = self.create(lat, lon, **kwargs)
+
+        if "pdf" in missing:
+            self.to_pdf(pdf_file, project_name=project_name, backend=backend)
+
+        if not df["temp_value"].isna().any():
+            for name, (key, path) in missing.items():
+                self.artifacts.store(key, {name: path})
+
+        return df
+
+    def _get_table_frame(self, table):
+        "Return the data frame (with a `colour_block` style column) for table number `table`."
         ldf = self.latest_df
-        colour_dict = self._get_colour_mapping(ldf)
 
         if table == 1:
-            df = ldf.copy()
-            row_vars = "years temp_value temp_demeaned hex_colour red green blue colour".split()
+            df = ldf[TABLE_COLUMNS[1]].copy()
         elif table == 2:
-            df = pd.DataFrame(ldf["colour"].value_counts().sort_values().sort_index())
-            df = df.reset_index().rename(columns={'count': 'colour_count'})
-            df["colour_block"] = ""
-            row_vars = ["colour", "colour_count"]
-
-        df["colour_block"] = df["colour"].map(colour_dict)
-
-        normal_rows = "\n".join([f"        <td>{{{row_var}}}</td>\n" for row_var in row_vars])
-
-        row_template = f"""
-    <tr>
-{normal_rows}
-      <td style="{{colour_block}}">         </td>
-    </tr>"""
-
-        table_rows = ""
-
-        for idx, row in df.round(5).iterrows():
-            html_row = row_template.format(**row)
-            table_rows += html_row
-
-        col_names = row_vars + ["actual_colour"]
-        head_rows = "\n".join([f"      <th>{col_name}</th>" for col_name in col_names])
-
-        html_table = f"""<table>
-  <thead>
-{head_rows}
-  </thead>
-  <tbody>
-    {table_rows}
-  </tbody>
-</table>
-"""
-        return html_table
-    
-    def to_html(self, html_file=None, project_name=None):
+            df = ldf["colour"].value_counts().sort_index().rename_axis("colour").reset_index(name="colour_count")
+        else:
+            raise ValueError(f"Unknown table: {table}")
+
+        df["colour_block"] = df["colour"].map(self._get_colour_mapping(ldf))
+        return df
+
+    def _iter_table(self, table):
         """
-        Return HTML content as a string (or write to `html_file` if defined).
+        Generate the HTML for table number `table`, in chunks (one per row).
+
+        The cells are formatted a whole column at a time, so the time taken grows linearly
+        with the number of rows.
         """
-        if project_name:
-            project = f"<p><b>{project_name}</b></p>"
-        else:
-            project = ""
+        df = self._get_table_frame(table)
+        col_names = TABLE_COLUMNS[table] + ["actual_colour"]
+
+        head_rows = "".join([f"      <th>{col_name}</th>\n" for col_name in col_names])
+        yield f"<table>\n  <thead>\n{head_rows}  </thead>\n  <tbody>\n"
+
+        rows = pd.Series("    <tr>\n", index=df.index)
+
+        for col in TABLE_COLUMNS[table]:
+            rows += "      <td>" + _format_column(df[col]) + "</td>\n"
+
+        rows += '      <td style="' + df["colour_block"].map(html.escape) + '">         </td>\n    </tr>\n'
+
+        yield from rows
+        yield "  </tbody>\n</table>\n"
+
+    def _get_table(self, table):
+        "Return the HTML for table number `table`."
+        return "".join(self._iter_table(table))
 
+    def _get_report_content(self, project_name=None):
+        "Return a dictionary of the content of the HTML/PDF report (not including the tables)."
         content = self.latest_request.copy()
-        content["project"] = project
-        content["png_file"] = self.latest_plot
-        content["png_url"] = os.path.basename(self.latest_plot)
+        content["project_name"] = project_name
+        content["location"] = content["region"] or f"Latitude: {content['lat']}&deg;,  Longitude: {content['lon']}&deg;."
 
-        content["table_1"] = self._get_table(table=1)
-        content["table_2"] = self._get_table(table=2)
+        if content["cell"]:
+            content["location"] += (" Data from the grid box centred at Latitude: {lat:.4f}&deg;,  Longitude: {lon:.4f}&deg; "
+                                    "({distance:.1f} km away).").format(**content["cell"])
+        # Embed the image in the report, so it does not have to be read back from disk
+        content["png_file"] = "data:image/png;base64," + base64.b64encode(self.latest_png).decode("ascii")
+        content["png_url"] = os.path.basename(self.latest_plot) if self.latest_plot else ""
 
         content["citation"] = CITATIONS[1] if self.global_mode else CITATIONS[0]
+        content["additional_information"] = ADDITIONAL_INFORMATION
+        return content
 
-        
-        html = HTML_TEMPLATE.format(**content)
+    def write_html(self, stream, project_name=None):
+        """
+        Write the HTML content to `stream` (a text file-like object), one piece at a time.
+        """
+        content = self._get_report_content(project_name)
+
+        if project_name:
+            content["project"] = f"<p><b>{html.escape(project_name)}</b></p>"
+        else:
+            content["project"] = ""
+
+        # Write the template around the tables, and the tables themselves row by row
+        head, rest = HTML_TEMPLATE.split("{table_1}")
+        middle, tail = rest.split("{table_2}")
+
+        stream.write(head.format(**content))
+        stream.writelines(self._iter_table(table=1))
+        stream.write(middle.format(**content))
+        stream.writelines(self._iter_table(table=2))
+        stream.write(tail.format(**content))
+
+    def to_html(self, html_file=None, project_name=None):
+        """
+        Return HTML content as a string (and write it to `html_file` if defined).
+        To write the HTML to a file without building the whole string first, use `write_html`.
+        """
+        html_content = StringIO()
+        self.write_html(html_content, project_name=project_name)
+        html = html_content.getvalue()
 
         if html_file:
             with open(html_file, "w", encoding="utf-8") as file:
@@ -449,21 +1102,162 @@ class StripesRenderer(StripesMaker):
 
         return html
 
-    def to_pdf(self, pdf_file, project_name=None):
-        html_content = self.to_html(project_name=project_name)
-        
-        # Create a BytesIO object to store the PDF output
-        pdf_output = BytesIO()
-        
-        # Convert the HTML content to a PDF document
-        pisa.CreatePDF(html_content, dest=pdf_output, encoding='utf-8')
-        
-        # Open a PDF file for writing in binary mode
-        with open(pdf_file, "wb") as pdf_writer:
-            pdf_writer.write(pdf_output.getvalue())
+    def to_pdf(self, pdf_file, project_name=None, backend=None):
+        """
+        Write the PDF report to `pdf_file` (a path, or a binary file-like object), and return `pdf_file`.
+
+        `backend` is one of `PDF_BACKENDS` (default: `DEFAULT_PDF_BACKEND`): "pisa" converts the
+        HTML content with xhtml2pdf, "matplotlib" lays out the same report directly with Matplotlib.
+        """
+        backend = backend or DEFAULT_PDF_BACKEND
+
+        if backend == "pisa":
+            write_pdf = self._write_pdf_pisa
+        elif backend == "matplotlib":
+            write_pdf = self._write_pdf_matplotlib
+        else:
+            raise ValueError(f"Unknown PDF backend: {backend}. Please use one of: {', '.join(PDF_BACKENDS)}.")
+
+        if hasattr(pdf_file, "write"):
+            write_pdf(pdf_file, project_name)
+        else:
+            with open(pdf_file, "wb") as pdf_writer:
+                write_pdf(pdf_writer, project_name)
 
         return pdf_file
 
+    def _write_pdf_pisa(self, pdf_writer, project_name=None):
+        # Write the HTML content straight into a buffer for the PDF converter
+        html_content = BytesIO()
+        writer = TextIOWrapper(html_content, encoding="utf-8")
+        self.write_html(writer, project_name=project_name)
+        writer.detach()
+        html_content.seek(0)
+
+        # Convert the HTML content to a PDF document, written straight to the output
+        pisa.CreatePDF(html_content, dest=pdf_writer, encoding='utf-8')
+
+    def _write_pdf_matplotlib(self, pdf_writer, project_name=None):
+        content = self._get_report_content(project_name)
+
+        with PdfReport(pdf_writer) as report:
+            report.heading("Climate Stripes for:")
+
+            if project_name:
+                report.paragraph(project_name, bold=True)
+
+            report.paragraph(_html_to_text(content["location"]))
+            report.paragraph(f"Time period: {content['time_range']}")
+            report.paragraph("Reference period (for the average): {}-{}".format(*content["reference_period"]))
+            report.paragraph(f"Using: {content['n_colours']} colours")
+            report.image(matplotlib.image.imread(BytesIO(self.latest_png), format="png"))
+
+            for table, title in ((1, "Table 1: Temperature variations from the average, and colours per year."),
+                                 (2, "Table 2: Colour table")):
+                df = self._get_table_frame(table)
+                rows = list(zip(*[_format_column(df[col], escape=False) for col in TABLE_COLUMNS[table]]))
+                colours = df["colour"].map(dict(zip(self.latest_df["colour"], self.latest_df["hex_colour"])))
+
+                report.heading(title)
+                report.table(TABLE_COLUMNS[table] + ["actual_colour"], rows, colours=list(colours))
+
+            report.heading("Citation")
+            report.paragraph(_html_to_text(content["citation"]))
+            report.heading("Additional information")
+            report.paragraph(_html_to_text(ADDITIONAL_INFORMATION))
+
+    def create_many(self, locations, output_dir, n_colours=N_COLOURS, cmap_name=DEFAULT_CMAP, time_range=None,
+                    range_buffer=0.2, project_name=None, max_workers=MAX_RENDER_WORKERS, callback=None):
+        """
+        Creates stripes (PNG and PDF) for many locations and bundles them into a single zip file,
+        along with a "summary.csv" file listing the grid box used (or the error) for each location.
+
+        `locations` is a list of (lat, lon) or (lat, lon, name) tuples. The data for all locations
+        is read together, then the outputs are rendered (in memory) in a pool of `max_workers` processes,
+        and each location's outputs are written into the zip file as soon as they are rendered (so they
+        are not all held in memory at once). A location that cannot be rendered is listed in the summary
+        with its error, and the other locations are still rendered.
+        If provided, `callback(n_done, n_total)` is called each time a location has been rendered.
+
+        Returns the path to the zip file.
+        """
+        names = [_get_safe_name(loc[2] if len(loc) > 2 else "location", i) for i, loc in enumerate(locations)]
+        all_data = self._get_cell_series_many(locations)
+
+        summary = {}
+        jobs = []
+
+        for name, loc, data in zip(names, locations, all_data):
+            row = {"name": name, "latitude": loc[0], "longitude": loc[1]}
+
+            if isinstance(data, Exception):
+                row["status"] = str(data)
+            else:
+                row.update({"cell_latitude": data["lat"], "cell_longitude": data["lon"],
+                            "distance_km": round(data["distance"], 3), "status": "OK"})
+                jobs.append({
+                    "maker_kwargs": {"global_mode": self.global_mode, "reference_period": self.reference_period},
+                    "lat": loc[0], "lon": loc[1], "data": data,
+                    "create_kwargs": {"n_colours": n_colours, "cmap_name": cmap_name, "time_range": time_range,
+                                      "range_buffer": range_buffer, "output_file": None},
+                    "name": name, "project_name": project_name
+                })
+
+            summary[name] = row
+
+        zip_file = os.path.join(output_dir, "climate-stripes.zip")
+
+        with zipfile.ZipFile(zip_file, "w", compression=zipfile.ZIP_DEFLATED) as bundle, \
+                ProcessPoolExecutor(max_workers=max_workers,
+                                    mp_context=multiprocessing.get_context(RENDER_MP_CONTEXT)) as executor:
+            futures = {executor.submit(_render_location, job): job["name"] for job in jobs}
+            n_total = len(futures)
+
+            for n_done, future in enumerate(as_completed(futures), 1):
+                # Write the outputs as soon as they are rendered, then let go of them
+                name = futures.pop(future)
+
+                try:
+                    png, pdf = future.result()
+                except Exception as exc:
+                    print(f"Could not render the stripes for {name}: {exc!r}")
+                    summary[name]["status"] = f"Could not render the stripes: {str(exc) or type(exc).__name__}"
+                else:
+                    bundle.writestr(f"{name}.png", png)
+                    bundle.writestr(f"{name}.pdf", pdf)
+
+                if callback:
+                    callback(n_done, n_total)
+
+            bundle.writestr("summary.csv", pd.DataFrame(list(summary.values())).to_csv(index=False))
+
+        return zip_file
+
+
+def _get_file_stamp(path):
+    "Return the path and modification time of a file (or \"absent\" if there is no such file), for cache keys."
+    if not path or not os.path.isfile(path):
+        return [path, "absent"]
+
+    return [path, os.stat(path).st_mtime_ns]
+
+
+def _get_safe_name(name, i):
+    "Return a file name for location number `i`, based on `name`."
+    safe_name = re.sub(r"[^\w\-]+", "_", str(name)).strip("_") or "location"
+    return f"{i + 1:03d}_{safe_name}"
+
+
+def _render_location(job):
+    """
+    Renders the PNG and PDF outputs for one location of `StripesRenderer.create_many` (in a worker process).
+    Returns the (PNG, PDF) content as bytes.
+    """
+    renderer = StripesRenderer(**job["maker_kwargs"])
+    renderer._create_from_series(job["lat"], job["lon"], job["data"], **job["create_kwargs"])
+    pdf_file = renderer.to_pdf(BytesIO(), project_name=job["project_name"])
+    return renderer.latest_png, pdf_file.getvalue()
+
 
 
 
@@ -1,9 +1,15 @@
+import json
 import re
+import sys
+import threading
+from contextlib import contextmanager
 
 from netCDF4 import Dataset
 
 from cfchecker import cfchecks
 
+from vulture.stripes_lib.regions import Region
+
 
 def get_input(inputs, key, default=None):
     """
@@ -15,12 +21,76 @@ def get_input(inputs, key, default=None):
     return default
 
 
+def get_requested_outputs(request, outputs):
+    """
+    Return the set of identifiers of the outputs that were asked for in the WPS request (in its
+    ResponseDocument or RawDataOutput). If none were specified, all `outputs` of the process are returned.
+    """
+    if request.outputs:
+        return set(request.outputs)
+
+    return {output.identifier for output in outputs}
+
+
+def get_output_format(request, output):
+    """
+    Return the `Format` that was asked for a `ComplexOutput` (with a "mimetype" in the ResponseDocument
+    or RawDataOutput), and set it as the format of the output. PyWPS only sets it for a ResponseDocument.
+    The default format of the output is used if none (or an unsupported one) was asked for.
+    """
+    mimetype = request.outputs.get(output.identifier, {}).get("mimetype")
+
+    for data_format in output.supported_formats:
+        if data_format.mime_type == mimetype:
+            output.data_format = data_format
+
+    return output.data_format
+
+
+def get_region(inputs, bbox_key="bbox", geojson_key="region"):
+    """
+    Return a `Region` from the bounding box or GeoJSON polygon inputs, or None if neither was provided.
+    Raises ValueError if the input cannot be read.
+    """
+    bbox = get_input(inputs, bbox_key)
+    if bbox:
+        return Region.from_bbox(*bbox)
+
+    geojson = get_input(inputs, geojson_key)
+    if geojson:
+        try:
+            return Region.from_geojson(geojson)
+        except (KeyError, TypeError, IndexError, json.JSONDecodeError) as exc:
+            raise ValueError(f"Could not read GeoJSON region: {exc}")
+
+    return None
+
+
+def get_reference_period(inputs, key="reference_period", default=None):
+    """
+    Read a reference period input (given as "start-end") and return it as a tuple of (start, end) years.
+    """
+    value = get_input(inputs, key)
+
+    if not value:
+        return default
+
+    return tuple(int(year) for year in value.split("-"))
+
+
 def resolve_conventions_version(inputs, nc_path):
     """
     Use the user input and/or the file version to decide the Conventions
     version to test the file against.
     """
-    convention_version = get_input(inputs, "CFVersion", "auto")
+    return get_conventions_version(nc_path, get_input(inputs, "CFVersion", "auto"))
+
+
+def get_conventions_version(nc_path, convention_version="auto"):
+    """
+    Return the Conventions version to test the file against: `convention_version`
+    (e.g. "1.8"), or the version the file declares if it is "auto".
+    """
     AUTO = 'auto'
 
     # Read the file to get the conventions if "auto" is selected
@@ -50,3 +120,67 @@ def resolve_conventions_version(inputs, nc_path):
 
     return version
 
+
+class _ThreadLocalStdout:
+    """
+    A replacement for `sys.stdout` that sends what each thread writes to the stream that thread is
+    capturing to (see `capture_stdout`), or to the original `sys.stdout` if it is not capturing.
+    """
+
+    def __init__(self, default):
+        self.default = default
+        self.local = threading.local()
+
+    @property
+    def stream(self):
+        stream = getattr(self.local, "stream", None)
+        return self.default if stream is None else stream
+
+    def write(self, data):
+        return self.stream.write(data)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+_STDOUT_LOCK = threading.Lock()
+_stdout_captures = 0
+
+
+@contextmanager
+def capture_stdout(stream):
+    """
+    Context manager that writes everything printed by the current thread to `stream` (a text file-like
+    object), as it is printed. Other threads are not affected, so they can capture to their own streams
+    at the same time. `sys.stdout` is restored on exit, even if an exception was raised.
+
+    Use as follows:
+    >>> with open("output.txt", "w") as output, capture_stdout(output):
+    ...     print("Written to output.txt")
+    """
+    global _stdout_captures
+
+    with _STDOUT_LOCK:
+        if not isinstance(sys.stdout, _ThreadLocalStdout):
+            sys.stdout = _ThreadLocalStdout(sys.stdout)
+
+        proxy = sys.stdout
+        _stdout_captures += 1
+
+    previous = getattr(proxy.local, "stream", None)
+    proxy.local.stream = stream
+
+    try:
+        yield stream
+    finally:
+        proxy.local.stream = previous
+
+        with _STDOUT_LOCK:
+            _stdout_captures -= 1
+
+            # Put the original stdout back once no thread is capturing
+            if _stdout_captures == 0 and sys.stdout is proxy:
+                sys.stdout = proxy.default
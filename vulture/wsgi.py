@@ -2,6 +2,8 @@ import os
 from pywps.app.Service import Service
 
 from .processes import processes
+from .stripes_lib.stripes import warm_datasets, get_colour_tables, DEFAULT_CMAP, N_COLOURS
+from .cf_tables import CF_TABLES
 
 
 def create_app(cfgfiles=None):
@@ -14,4 +16,24 @@ def create_app(cfgfiles=None):
     return service
 
 
+def warm_worker():
+    """
+    Open the long-lived datasets, and parse the CF tables, when the worker starts, rather than on the
+    first request.
+    This is not done on import (so that importing vulture stays cheap): it is called by `vulture start`,
+    and by gunicorn through `post_fork`.
+    """
+    warm_datasets()
+    get_colour_tables(DEFAULT_CMAP, N_COLOURS)
+    CF_TABLES.warm()
+
+
+def post_fork(server, worker):
+    """
+    Gunicorn server hook: warm each worker when it starts. Use it in the gunicorn configuration file with:
+    `from vulture.wsgi import post_fork`
+    """
+    warm_worker()
+
+
 application = create_app()